@@ -1,44 +1,59 @@
-from typing import Dict, Any
-from services import workflow_engine
+from typing import Dict, Any, Optional, Callable, Awaitable
+from services import workflow_engine, response_stream
+from tracing import tracer
 from datetime import datetime
 
 class BankingConversationAgent:
     def __init__(self):
         self.workflow_engine = workflow_engine
 
-    async def process_message(self, user_id: str, message: str, session_id: str) -> Dict[str, Any]:
+    async def process_message(self, user_id: str, message: str, session_id: str,
+                              on_delta: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict[str, Any]:
         """Main entry point for AI-powered conversation processing"""
-        try:
-            # Process through the AI-enhanced workflow engine
-            response = await self.workflow_engine.handle_conversation(user_id, message, session_id)
+        # Root span of the turn unless the caller (e.g. the WebSocket) started one
+        with tracer.start_trace("process_message", user_id=user_id, session_id=session_id,
+                                streaming=on_delta is not None) as span:
+            # Stream reply chunks to on_delta while the turn is generated
+            stream_token = response_stream.set(on_delta)
+            try:
+                # Process through the AI-enhanced workflow engine
+                response = await self.workflow_engine.handle_conversation(user_id, message, session_id)
             
-            # Get current context for additional metadata
-            context = self.workflow_engine.conversation_ai.contexts.get(session_id)
+                # Get current context for additional metadata
+                context = await self.workflow_engine.conversation_ai.sessions.get(session_id)
+                span.set_attributes({
+                    "intent": context.current_intent.value if context and context.current_intent else None,
+                    "confidence": context.ai_confidence if context else None,
+                    "state": context.conversation_state.value if context else "idle"
+                })
             
-            return {
-                "response": response["response"],
-                "intent": response.get("intent"),
-                "workflow_active": response.get("workflow_active", False),
-                "completed": response.get("completed", False),
-                "context_switched": response.get("context_switched", False),
-                "clarification_needed": response.get("clarification_needed", False),
-                "ai_confidence": context.ai_confidence if context else 0.0,
-                "current_state": context.conversation_state.value if context else "idle",
-                "timestamp": datetime.now().isoformat()
-            }
+                return {
+                    "response": response["response"],
+                    "intent": response.get("intent"),
+                    "workflow_active": response.get("workflow_active", False),
+                    "completed": response.get("completed", False),
+                    "context_switched": response.get("context_switched", False),
+                    "clarification_needed": response.get("clarification_needed", False),
+                    "ai_confidence": context.ai_confidence if context else 0.0,
+                    "current_state": context.conversation_state.value if context else "idle",
+                    "timestamp": datetime.now().isoformat()
+                }
 
-        except Exception as e:
-            print(f"Agent Error: {e}")
-            return {
-                "response": f"I apologize, but I encountered an error while processing your request. Could you please try rephrasing your question? Error: {str(e)}",
-                "completed": True,
-                "error": True,
-                "timestamp": datetime.now().isoformat()
-            }
+            except Exception as e:
+                print(f"Agent Error: {e}")
+                span.record_exception(e)
+                return {
+                    "response": f"I apologize, but I encountered an error while processing your request. Could you please try rephrasing your question? Error: {str(e)}",
+                    "completed": True,
+                    "error": True,
+                    "timestamp": datetime.now().isoformat()
+                }
+            finally:
+                response_stream.reset(stream_token)
 
     async def get_conversation_context(self, session_id: str) -> Dict[str, Any]:
         """Get current conversation context for debugging/monitoring"""
-        context = self.workflow_engine.conversation_ai.contexts.get(session_id)
+        context = await self.workflow_engine.conversation_ai.sessions.get(session_id)
         if context:
             return {
                 "session_id": context.session_id,
@@ -47,17 +62,14 @@ class BankingConversationAgent:
                 "conversation_state": context.conversation_state.value,
                 "workflow_step": context.workflow_step,
                 "collected_data": context.collected_data,
-                "conversation_length": len(context.conversation_history),
+                "conversation_length": self.workflow_engine.conversation_ai.history.message_count(context),
                 "interruption_stack_size": len(context.interruption_stack)
             }
         return {}
 
     async def reset_conversation(self, session_id: str) -> bool:
         """Reset conversation context"""
-        if session_id in self.workflow_engine.conversation_ai.contexts:
-            del self.workflow_engine.conversation_ai.contexts[session_id]
-            return True
-        return False
+        return await self.workflow_engine.conversation_ai.sessions.delete(session_id)
 
 # Global agent instance
 banking_agent = BankingConversationAgent()
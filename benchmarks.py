@@ -0,0 +1,939 @@
+"""Micro-benchmarks for the AI Banking Conversation System.
+
+Each command runs against the local SQLite database (created with demo data
+on first import) and prints a small results table:
+
+    python benchmarks.py db-pool --concurrency 16 --queries 5000
+    python benchmarks.py intent-router --folds 5
+"""
+import argparse
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import aiosqlite
+
+
+async def run_db_pool(args):
+    from database import db_manager, ReadCoalescer, UserService, CardService, AccountService
+    await db_manager.initialize_async()
+
+    @asynccontextmanager
+    async def fresh_connection():
+        # Previous behaviour: one new aiosqlite connection (and thread) per query
+        conn = await aiosqlite.connect(db_manager.db_path)
+        conn.row_factory = aiosqlite.Row
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+    class UnpooledManager:
+        db_path = db_manager.db_path
+        get_connection = staticmethod(fresh_connection)
+        reads = ReadCoalescer(enabled=False)
+
+    # Measure the pool itself, not shared reads
+    db_manager.reads = ReadCoalescer(enabled=False)
+
+    async def measure(manager) -> float:
+        users, cards, accounts = UserService(manager), CardService(manager), AccountService(manager)
+        calls = [
+            lambda: users.get_user(args.user_id),
+            lambda: cards.get_user_cards(args.user_id),
+            lambda: accounts.get_user_accounts(args.user_id),
+        ]
+        per_worker = args.queries // args.concurrency
+
+        async def worker():
+            for i in range(per_worker):
+                await calls[i % len(calls)]()
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+        return per_worker * args.concurrency / (time.perf_counter() - started)
+
+    unpooled = await measure(UnpooledManager())
+    pooled = await measure(db_manager)
+    await db_manager.close()
+
+    print(f"{args.queries} queries, concurrency {args.concurrency}, pool size {db_manager.pool.max_size}")
+    print(f"{'mode':>20} {'queries/s':>12}")
+    print(f"{'connect per query':>20} {unpooled:>12.0f}")
+    print(f"{'connection pool':>20} {pooled:>12.0f}")
+    print(f"{'speedup':>20} {pooled / unpooled:>11.1f}x")
+
+
+async def run_coalescing(args):
+    from database import db_manager, ReadCoalescer, user_service, card_service, account_service, loan_service
+
+    async def measure(reads: ReadCoalescer):
+        db_manager.reads = reads
+        calls = [user_service.get_user, card_service.get_user_cards,
+                 account_service.get_user_accounts, loan_service.get_user_loan_applications]
+
+        async def session(index: int):
+            # Every session of the burst loads the same user's dashboard
+            user_id = f"user_demo{index % args.users + 1}"
+            await asyncio.gather(*[call(user_id) for call in calls])
+
+        started = time.perf_counter()
+        for _ in range(args.bursts):
+            await asyncio.gather(*[session(i) for i in range(args.sessions)])
+            await asyncio.sleep(args.gap)
+        return time.perf_counter() - started - args.bursts * args.gap, reads.stats()
+
+    modes = [
+        ("no coalescing", ReadCoalescer(enabled=False)),
+        ("single-flight", ReadCoalescer()),
+        (f"+ cache {args.ttl:g}s", ReadCoalescer(ttl=args.ttl)),
+    ]
+    print(f"{args.bursts} bursts of {args.sessions} concurrent sessions over {args.users} users, 4 reads each")
+    print(f"{'mode':>16} {'calls':>8} {'db reads':>9} {'removed':>8} {'elapsed s':>10}")
+    for label, reads in modes:
+        elapsed, stats = await measure(reads)
+        removed = 1 - stats["db_reads"] / stats["calls"]
+        print(f"{label:>16} {stats['calls']:>8} {stats['db_reads']:>9} {removed:>8.1%} {elapsed:>10.3f}")
+    await db_manager.close()
+
+
+async def run_transaction_pages(args):
+    import sqlite3
+    from database import DatabaseManager, AccountService, ReadCoalescer
+
+    manager = DatabaseManager(args.db)
+    manager.reads = ReadCoalescer(enabled=False)
+    accounts = ["acc_001", "acc_002"]
+    conn = sqlite3.connect(args.db)
+    existing = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    if existing < args.rows:
+        rng = random.Random(11)
+        started = time.perf_counter()
+        with conn:
+            for chunk in range(existing, args.rows, 100_000):
+                conn.executemany(
+                    "INSERT INTO transactions (transaction_id, account_id, transaction_type, amount, description, "
+                    "merchant_name, transaction_date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(f"bench_{i:09d}", accounts[i % 2], rng.choice(["debit", "credit"]), round(rng.uniform(1, 500), 2),
+                      "Benchmark purchase", rng.choice(["FreshMart Grocery", "Shell Gas Station", "Coffee Corner"]),
+                      f"20{rng.randint(15, 23)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+                      f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00")
+                     for i in range(chunk, min(chunk + 100_000, args.rows))]
+                )
+        print(f"Inserted {args.rows - existing} transactions in {time.perf_counter() - started:.1f}s")
+    total = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    offset_query = """
+    SELECT * FROM transactions WHERE account_id IN (?, ?)
+    ORDER BY transaction_date DESC, transaction_id DESC LIMIT ? OFFSET ?
+    """
+
+    def offset_page(page: int) -> float:
+        started = time.perf_counter()
+        conn.execute(offset_query, (*accounts, args.page_size, page * args.page_size)).fetchall()
+        return time.perf_counter() - started
+
+    service = AccountService(manager)
+    depths = sorted(set(args.depths))
+    print(f"{total} transactions, {args.page_size} per page")
+    print(f"{'page':>8} {'keyset ms':>10} {'offset ms':>10}")
+    cursor, page = None, 0
+    while page <= depths[-1]:
+        started = time.perf_counter()
+        result = await service.get_transactions_page(args.user_id, args.page_size, cursor=cursor)
+        keyset_elapsed = time.perf_counter() - started
+        if page in depths:
+            print(f"{page:>8} {keyset_elapsed * 1000:>10.2f} {offset_page(page) * 1000:>10.2f}")
+        cursor = result["next_cursor"]
+        if cursor is None:
+            break
+        page += 1
+    conn.close()
+    await manager.close()
+
+
+async def run_spending(args):
+    import sqlite3
+    from database import DatabaseManager, SpendingService
+
+    manager = DatabaseManager(args.db)
+    accounts = ["acc_001", "acc_002"]
+    merchants = ["FreshMart Grocery", "Shell Gas Station", "Coffee Corner Cafe", "Amazon Marketplace",
+                 "City Electric", "Uber Trip", "Corner Shop"]
+    conn = sqlite3.connect(args.db)
+    existing = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    if existing < args.rows:
+        rng = random.Random(13)
+        started = time.perf_counter()
+        with conn:
+            for chunk in range(existing, args.rows, 100_000):
+                conn.executemany(
+                    "INSERT INTO transactions (transaction_id, account_id, transaction_type, amount, description, "
+                    "merchant_name, transaction_date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(f"bench_{i:09d}", accounts[i % 2], rng.choice(["debit", "debit", "credit"]),
+                      round(rng.uniform(1, 500), 2), "Benchmark purchase", rng.choice(merchants),
+                      f"20{rng.randint(15, 23)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+                      f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00")
+                     for i in range(chunk, min(chunk + 100_000, args.rows))]
+                )
+        elapsed = time.perf_counter() - started
+        print(f"Inserted {args.rows - existing} transactions with rollup triggers in {elapsed:.1f}s "
+              f"({(args.rows - existing) / elapsed:,.0f} rows/s)")
+    total = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    rollups = conn.execute("SELECT COUNT(*) FROM transaction_rollups").fetchone()[0]
+
+    raw_query = """
+    SELECT SUM(t.amount), COUNT(*) FROM accounts a
+    JOIN transactions t ON t.account_id = a.account_id
+    WHERE a.user_id = ? AND t.transaction_type = 'debit'
+      AND t.transaction_date >= ? AND t.transaction_date < ?
+    """
+    ranges = [("1 month", "2023-06-01", "2023-07-01"), ("1 year", "2022-01-01", "2023-01-01"),
+              ("all", None, None)]
+    service = SpendingService(manager)
+    print(f"{total} transactions, {rollups} rollup rows")
+    print(f"{'range':>8} {'rollup ms':>10} {'raw ms':>10} {'total':>16} {'match':>6}")
+    for label, start, end in ranges:
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            summary = await service.get_spending_summary(args.user_id, start, end)
+        rollup_ms = (time.perf_counter() - started) * 1000 / args.iterations
+
+        started = time.perf_counter()
+        raw_total, raw_count = conn.execute(raw_query, (args.user_id, start or "", end or "9999-12-31")).fetchone()
+        raw_ms = (time.perf_counter() - started) * 1000
+        match = summary["transaction_count"] == raw_count and abs(summary["total"] - (raw_total or 0)) < 0.01
+        print(f"{label:>8} {rollup_ms:>10.2f} {raw_ms:>10.2f} {summary['total']:>16,.2f} {'yes' if match else 'NO':>6}")
+    conn.close()
+    await manager.close()
+
+
+def write_synthetic_extract(directory: str, transactions: int, users: int = 1000, seed: int = 17):
+    """CSV extract files of users, accounts (two per user) and transactions"""
+    import csv
+    import os
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = {table: os.path.join(directory, f"{table}.csv") for table in ("users", "accounts", "transactions")}
+    with open(paths["users"], "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["user_id", "full_name", "email", "monthly_income", "employment_status"])
+        writer.writerows((f"bulk_user_{i}", f"Bulk User {i}", f"bulk{i}@example.com", rng.randint(2000, 12000),
+                          "employed") for i in range(users))
+    with open(paths["accounts"], "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["account_id", "user_id", "account_number", "account_type", "balance"])
+        writer.writerows((f"bulk_acc_{i}", f"bulk_user_{i // 2}", f"BLK-{i:09d}", ("checking", "savings")[i % 2],
+                          round(rng.uniform(0, 50000), 2)) for i in range(users * 2))
+    merchants = ["FreshMart Grocery", "Shell Gas Station", "Coffee Corner Cafe", "Amazon Marketplace",
+                 "City Electric", "Uber Trip", "Corner Shop"]
+    with open(paths["transactions"], "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["transaction_id", "account_id", "transaction_type", "amount", "description",
+                         "merchant_name", "transaction_date"])
+        for i in range(transactions):
+            writer.writerow((f"bulk_txn_{i:010d}", f"bulk_acc_{rng.randrange(users * 2)}",
+                             "debit" if rng.random() < 0.8 else "credit", round(rng.uniform(1, 500), 2),
+                             "Card purchase", rng.choice(merchants),
+                             f"20{rng.randint(15, 23)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+                             f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"))
+    return paths
+
+
+async def run_bulk_load(args):
+    import csv
+    import os
+    import sqlite3
+    from bulk_loader import BulkLoader
+    from database import DatabaseManager
+
+    paths = {table: os.path.join(args.dir, f"{table}.csv") for table in ("users", "accounts", "transactions")}
+    if not all(os.path.exists(path) for path in paths.values()):
+        started = time.perf_counter()
+        paths = write_synthetic_extract(args.dir, args.rows)
+        print(f"Wrote {args.rows:,} synthetic transactions to {args.dir} in {time.perf_counter() - started:.1f}s")
+
+    # Baseline: one execute per row into the live schema (indexes, rollup
+    # triggers, default pragmas), as the services and demo data do today
+    for suffix in ("", "-wal", "-shm"):
+        for db in (args.db, args.db + ".baseline"):
+            if os.path.exists(db + suffix):
+                os.remove(db + suffix)
+    DatabaseManager(args.db + ".baseline", demo_data=False)
+    conn = sqlite3.connect(args.db + ".baseline")
+    with open(paths["transactions"], newline="") as handle:
+        reader = csv.reader(handle)
+        columns = next(reader)
+        statement = f"INSERT INTO transactions ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        started = time.perf_counter()
+        with conn:
+            for _, row in zip(range(args.baseline_rows), reader):
+                conn.execute(statement, row)
+        baseline_rate = args.baseline_rows / (time.perf_counter() - started)
+    conn.close()
+
+    loader = BulkLoader(args.db, chunk_size=args.chunk_size)
+    started = time.perf_counter()
+    inserted = loader.load({table: [path] for table, path in paths.items()})
+    elapsed = time.perf_counter() - started
+    loader.close()
+
+    total = sum(inserted.values())
+    print(f"{'method':>22} {'rows/s':>12} {'time for all rows':>18}")
+    print(f"{'row-at-a-time':>22} {baseline_rate:>12,.0f} {total / baseline_rate:>17.0f}s "
+          f"(measured on {args.baseline_rows:,} rows)")
+    print(f"{'bulk_loader':>22} {total / elapsed:>12,.0f} {elapsed:>17.0f}s (including index and rollup rebuild)")
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0-100) of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-q * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """Milliseconds summary of latencies measured in seconds"""
+    ordered = sorted(sample * 1000 for sample in samples)
+    return {
+        "samples": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        **{f"p{q}_ms": round(percentile(ordered, q), 3) for q in (50, 95, 99)},
+        "max_ms": round(ordered[-1], 3) if ordered else 0.0,
+    }
+
+
+async def run_scale(args):
+    import json
+    import os
+    import subprocess
+    import uuid
+    from datetime import datetime
+    from database import (DatabaseManager, ReadCoalescer, UserService, CardService, LoanService,
+                          AccountService, SpendingService)
+    from synthetic_data import SyntheticBankData, build_database
+
+    previous = {}
+    if os.path.exists(args.results):
+        with open(args.results) as handle:
+            for line in handle:
+                result = json.loads(line)
+                previous[(result["users"], result["seed"], result["method"])] = result
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except Exception:
+        commit = ""
+    run = {"run_id": uuid.uuid4().hex[:8], "timestamp": datetime.now().isoformat(timespec="seconds"),
+           "commit": commit}
+    os.makedirs(args.db_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+
+    print(f"{'users':>9} {'method':<42} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'p95 vs last':>12}")
+    for users in args.users:
+        db_path = os.path.join(args.db_dir, f"scale_{users}_seed{args.seed}_tpa{args.transactions_per_account:g}.db")
+        if not os.path.exists(db_path):
+            started = time.perf_counter()
+            build_database(db_path, users, seed=args.seed, transactions_per_account=args.transactions_per_account)
+            print(f"Built {db_path} in {time.perf_counter() - started:.0f}s")
+
+        manager = DatabaseManager(db_path, demo_data=False)
+        # Measure the queries, not shared reads
+        manager.reads = ReadCoalescer(enabled=False)
+        user_svc, card_svc, loan_svc = UserService(manager), CardService(manager), LoanService(manager)
+        account_svc, spending_svc = AccountService(manager), SpendingService(manager)
+        # The last three months of the generated history
+        as_of = SyntheticBankData(users, seed=args.seed).as_of
+        quarter = (f"{as_of.year - (as_of.month <= 2)}-{(as_of.month - 3) % 12 + 1:02d}-01",
+                   f"{as_of.year + (as_of.month == 12)}-{as_of.month % 12 + 1:02d}-01")
+        methods = {
+            "UserService.get_user": lambda index: user_svc.get_user(SyntheticBankData.user_id(index)),
+            "CardService.get_user_cards": lambda index: card_svc.get_user_cards(SyntheticBankData.user_id(index)),
+            "LoanService.get_user_loan_applications":
+                lambda index: loan_svc.get_user_loan_applications(SyntheticBankData.user_id(index)),
+            "AccountService.get_user_accounts":
+                lambda index: account_svc.get_user_accounts(SyntheticBankData.user_id(index)),
+            "AccountService.get_account_transactions":
+                lambda index: account_svc.get_account_transactions(SyntheticBankData.account_id(index), 10),
+            "AccountService.get_transactions_page":
+                lambda index: account_svc.get_transactions_page(SyntheticBankData.user_id(index), 10),
+            "SpendingService.get_spending_summary":
+                lambda index: spending_svc.get_spending_summary(SyntheticBankData.user_id(index), *quarter),
+        }
+        rng = random.Random(args.seed)
+        with open(args.results, "a") as results:
+            for method, call in methods.items():
+                for index in rng.sample(range(users), min(users, args.warmup)):
+                    await call(index)
+                samples = []
+                for _ in range(args.samples):
+                    index = rng.randrange(users)
+                    started = time.perf_counter()
+                    await call(index)
+                    samples.append(time.perf_counter() - started)
+                summary = latency_summary(samples)
+                result = {**run, "users": users, "seed": args.seed,
+                          "transactions_per_account": args.transactions_per_account, "method": method, **summary}
+                results.write(json.dumps(result) + "\n")
+
+                last = previous.get((users, args.seed, method))
+                change = f"{summary['p95_ms'] / last['p95_ms'] - 1:+.0%}" if last and last["p95_ms"] else "-"
+                print(f"{users:>9} {method:<42} {summary['p50_ms']:>8.3f} {summary['p95_ms']:>8.3f} "
+                      f"{summary['p99_ms']:>8.3f} {summary['max_ms']:>8.3f} {change:>12}")
+        await manager.close()
+    print(f"Results appended to {args.results} (run {run['run_id']})")
+
+
+def legacy_fallback_intent(message: str):
+    """The original chain of keyword scans from ConversationAI._fallback_analysis"""
+    from models import Intent
+
+    message_lower = message.lower()
+    if any(word in message_lower for word in ["block", "freeze", "stop", "lost", "stolen"]) and "card" in message_lower:
+        return Intent.CARD_BLOCKING
+    elif any(phrase in message_lower for phrase in ["apply for card", "new card", "create card", "get a card"]):
+        return Intent.CARD_APPLICATION
+    elif any(phrase in message_lower for phrase in ["my loans", "loan status", "loan applications", "check loan"]):
+        return Intent.LOAN_INQUIRY
+    elif any(word in message_lower for word in ["loan", "borrow"]) or "apply" in message_lower:
+        return Intent.LOAN_APPLICATION
+    elif any(word in message_lower for word in ["balance", "money", "amount"]):
+        return Intent.BALANCE_INQUIRY
+    elif any(word in message_lower for word in ["transaction", "history", "statement"]):
+        return Intent.TRANSACTION_HISTORY
+    elif "card" in message_lower:
+        return Intent.CARD_INQUIRY
+    elif any(word in message_lower for word in ["hello", "hi", "hey", "good morning"]):
+        return Intent.GREETING
+    return Intent.GENERAL_INQUIRY
+
+
+def synthetic_messages(count: int, seed: int = 7) -> List[str]:
+    """Random banking-flavoured messages mixing keywords, look-alikes and filler"""
+    from intent_classifier import KEYWORD_GROUPS
+
+    keywords = [keyword for group in KEYWORD_GROUPS.values() for keyword in group]
+    filler = ["please", "my", "the", "what", "is", "show", "can", "you", "I", "need", "to", "this",
+              "account", "credit", "debit", "$1,500", "Card", "LOAN", "Hi!", "thanks", "shipping",
+              "stopwatch", "histories", "cardboard", "whatever", "apply for card", "good", "morning"]
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(keywords) if rng.random() < 0.25 else rng.choice(filler)
+                 for _ in range(rng.randint(1, 12))]
+        messages.append(" ".join(words))
+    return messages
+
+
+async def run_fallback_intents(args):
+    from intent_classifier import keyword_classifier
+
+    messages = synthetic_messages(args.messages)
+
+    started = time.perf_counter()
+    legacy = [legacy_fallback_intent(message) for message in messages]
+    legacy_rate = len(messages) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    compiled = [keyword_classifier.classify(message) for message in messages]
+    compiled_rate = len(messages) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    batched = keyword_classifier.classify_batch(messages)
+    batch_rate = len(messages) / (time.perf_counter() - started)
+
+    mismatches = sum(a != b for a, b in zip(legacy, compiled)) + sum(a != b for a, b in zip(legacy, batched))
+    print(f"{len(messages)} synthetic messages, {mismatches} classification mismatches vs. legacy")
+    print(f"{'implementation':>20} {'messages/s':>12}")
+    print(f"{'legacy any() chain':>20} {legacy_rate:>12.0f}")
+    print(f"{'compiled classify':>20} {compiled_rate:>12.0f}")
+    print(f"{'classify_batch':>20} {batch_rate:>12.0f}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+async def run_intent_router(args):
+    import zlib
+    from intent_classifier import HashedNgramIntentModel, keyword_classifier, load_intent_corpus
+
+    examples = load_intent_corpus(args.corpus)
+    folds = [[] for _ in range(args.folds)]
+    for text, intent in examples:
+        folds[zlib.crc32(text.encode()) % args.folds].append((text, intent))
+
+    # Held-out predictions from k-fold cross-validation
+    predictions = []
+    cpu_time = 0.0
+    for index, held_out in enumerate(folds):
+        training = [example for fold, rows in enumerate(folds) if fold != index for example in rows]
+        model = HashedNgramIntentModel().fit(training)
+        started = time.process_time()
+        predicted = [model.predict(text) for text, _ in held_out]
+        cpu_time += time.process_time() - started
+        predictions.extend((intent, guess, confidence) for (_, intent), (guess, confidence) in zip(held_out, predicted))
+
+    started = time.process_time()
+    keyword_correct = sum(keyword_classifier.classify(text) == intent for text, intent in examples)
+    keyword_cpu = time.process_time() - started
+
+    print(f"{len(examples)} labeled messages, {args.folds}-fold cross-validation")
+    print(f"local model CPU time   {cpu_time / len(predictions) * 1e6:.1f} us/message")
+    print(f"keyword CPU time       {keyword_cpu / len(examples) * 1e6:.1f} us/message")
+    print(f"keyword accuracy       {keyword_correct / len(examples):.3f}")
+    print(f"local model accuracy   {sum(intent == guess for intent, guess, _ in predictions) / len(predictions):.3f}")
+    print(f"{'threshold':>10} {'escalation':>11} {'routed acc':>11} {'tiered acc':>11}")
+    for threshold in args.thresholds:
+        routed = [(intent, guess) for intent, guess, confidence in predictions if confidence >= threshold]
+        routed_correct = sum(intent == guess for intent, guess in routed)
+        escalation = 1 - len(routed) / len(predictions)
+        routed_accuracy = routed_correct / len(routed) if routed else 0.0
+        # Escalated messages are assumed to be classified correctly by the LLM
+        tiered_accuracy = (routed_correct + len(predictions) - len(routed)) / len(predictions)
+        print(f"{threshold:>10.2f} {escalation:>11.1%} {routed_accuracy:>11.3f} {tiered_accuracy:>11.3f}")
+
+
+async def run_history(args):
+    from history import ConversationHistory
+    from prompts import count_tokens
+    from models import ConversationContext
+
+    async def summarizer(previous, entries):
+        # Stand-in for the LLM: keep the user's requests only
+        requests = "; ".join(entry["message"] for entry in entries if entry["role"] == "user")
+        return f"{previous} {requests}".strip()
+
+    history = ConversationHistory(window=args.window, summarizer=summarizer)
+    bounded = ConversationContext(session_id="bounded", user_id=args.user_id)
+    unbounded = ConversationContext(session_id="unbounded", user_id=args.user_id)
+    messages = synthetic_messages(args.turns)
+    reply = "Here is the information you requested. Is there anything else I can help you with?"
+
+    print(f"{'turns':>8} {'unbounded bytes':>16} {'bounded bytes':>14} {'prompt tokens':>14}")
+    checkpoints = {10, 100, 1000, 10000, args.turns}
+    for turn, message in enumerate(messages, start=1):
+        history.apply_ready_summary(bounded)
+        for role, text in (("user", message), ("assistant", reply)):
+            history.append(bounded, role, text)
+            unbounded.conversation_history.append({"role": role, "message": text, "timestamp": ""})
+        history.schedule_summary(bounded)
+        # Let the background summary finish, as it would between real turns
+        await asyncio.sleep(0)
+        if turn in checkpoints:
+            view = history.prompt_view(bounded, args.prompt_tokens)
+            print(f"{turn:>8} {len(unbounded.model_dump_json()):>16} {len(bounded.model_dump_json()):>14} "
+                  f"{count_tokens(view):>14}")
+    print(f"{history.summaries} background summaries, {history.extractive_folds} extractive folds")
+
+
+def legacy_response_prompt(context, user_message: str, system_data=None) -> str:
+    """The prompt ConversationAI.generate_response built before prompts.py"""
+    import json
+
+    history_text = ""
+    if context.conversation_history:
+        recent_history = context.conversation_history[-4:]
+        history_text = "\n".join([f"{msg['role']}: {msg['message']}" for msg in recent_history])
+    current_intent = context.current_intent.value if context.current_intent else "none"
+    current_state = context.conversation_state.value if context.conversation_state else "idle"
+    workflow_step = context.workflow_step or "none"
+    collected_data = json.dumps(context.collected_data, indent=2, default=str) if context.collected_data else "{}"
+    system_context = ""
+    if system_data:
+        system_context = f"\nSYSTEM DATA: {json.dumps(system_data, indent=2, default=str)}"
+    return f"""
+You are a professional AI Banking Assistant. Generate a helpful, conversational response.
+
+CONVERSATION CONTEXT:
+- Current Intent: {current_intent}
+- Conversation State: {current_state}
+- Workflow Step: {workflow_step}
+- Collected Data: {collected_data}
+- Recent History: {history_text}
+
+USER MESSAGE: "{user_message}"
+{system_context}
+
+RESPONSE GUIDELINES:
+1. Be conversational, helpful, and professional
+2. If collecting information, ask specific questions
+3. If showing data, format it clearly with numbers and lists
+4. Keep responses concise but informative
+5. DO NOT use any emojis, symbols, or special characters
+6. Use plain text formatting only
+7. Use "Number:" for lists instead of bullets
+
+Generate a natural, helpful response:
+"""
+
+
+async def run_prompts(args):
+    import os
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    from database import db_manager, card_service, account_service, loan_service
+    from models import ConversationContext, ConversationState, Intent
+    from prompts import count_tokens
+    from services import conversation_ai
+
+    accounts = await account_service.get_user_accounts(args.user_id)
+    cards = await card_service.get_user_cards(args.user_id)
+    loans = await loan_service.get_user_loan_applications(args.user_id)
+    transactions = await account_service.get_account_transactions(accounts[0]["account_id"], 5) if accounts else []
+    await db_manager.close()
+    active_cards = [card for card in cards if card["card_status"] == "active"]
+    selected = active_cards[0] if active_cards else (cards[0] if cards else {})
+    # A long statement, to show the data budget at work
+    statement = (transactions * (args.statement_rows // max(len(transactions), 1) + 1))[:args.statement_rows]
+
+    idle = {}
+    blocking = {"user_cards": active_cards, "selected_card": selected}
+    scenarios = [
+        ("show_balance", Intent.BALANCE_INQUIRY, idle, {"accounts": accounts, "action": "show_balance"}),
+        ("show_cards", Intent.CARD_INQUIRY, idle, {"cards": cards, "action": "show_cards"}),
+        ("show_transactions", Intent.TRANSACTION_HISTORY, idle,
+         {"accounts": accounts, "transactions": transactions, "action": "show_transactions"}),
+        (f"show_transactions x{args.statement_rows}", Intent.TRANSACTION_HISTORY, idle,
+         {"accounts": accounts, "transactions": statement, "action": "show_transactions"}),
+        ("show_loans", Intent.LOAN_INQUIRY, idle, {"loan_applications": loans, "action": "show_loans"}),
+        ("select_card_to_block", Intent.CARD_BLOCKING, {"user_cards": active_cards},
+         {"active_cards": active_cards, "action": "select_card_to_block"}),
+        ("ask_dob_verification", Intent.CARD_BLOCKING, blocking,
+         {"selected_card": selected, "action": "ask_dob_verification"}),
+        ("final_confirmation", Intent.CARD_BLOCKING, {**blocking, "block_reason": "lost"},
+         {"selected_card": selected, "block_reason": "lost", "action": "final_confirmation"}),
+        ("block_successful_verified", Intent.CARD_BLOCKING, {"selected_card": selected, "block_reason": "lost"},
+         {"selected_card": selected, "blocked_card": {**selected, "card_status": "blocked"},
+          "block_result": {"success": True, "message": "Card blocked successfully"},
+          "action": "block_successful_verified"}),
+        ("greeting", Intent.GREETING, idle, {"action": "greeting"}),
+        ("general_help", Intent.GENERAL_INQUIRY, idle, {"action": "general_help"}),
+        ("loan_application_help", Intent.LOAN_APPLICATION, idle, {"action": "loan_application_help"}),
+    ]
+
+    def timed(build) -> float:
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            build()
+        return (time.perf_counter() - started) / args.iterations * 1e6
+
+    print(f"{'action':>28} {'old tok':>8} {'new tok':>8} {'uncached':>9} {'old us':>8} {'new us':>8}")
+    totals = [0, 0]
+    for action, intent, collected, system_data in scenarios:
+        context = ConversationContext(session_id="bench", user_id=args.user_id, current_intent=intent,
+                                      collected_data=dict(collected))
+        if collected:
+            context.conversation_state = ConversationState.COLLECTING_INFO
+            context.workflow_step = "card_selection"
+        for role, text in (("user", "hello"), ("assistant", "Hi, how can I help?"), ("user", "show me")):
+            conversation_ai.history.append(context, role, text)
+
+        legacy = legacy_response_prompt(context, "show me", system_data)
+        messages = conversation_ai._response_messages(context, "show me", system_data)
+        old_tokens = count_tokens(legacy)
+        new_tokens = sum(count_tokens(message["content"]) for message in messages)
+        totals[0] += old_tokens
+        totals[1] += new_tokens
+        old_us = timed(lambda: legacy_response_prompt(context, "show me", system_data))
+        new_us = timed(lambda: conversation_ai._response_messages(context, "show me", system_data))
+        print(f"{action:>28} {old_tokens:>8} {new_tokens:>8} {count_tokens(messages[1]['content']):>9} "
+              f"{old_us:>8.1f} {new_us:>8.1f}")
+    print(f"{'total':>28} {totals[0]:>8} {totals[1]:>8}")
+    print("uncached = tokens after the static system prefix, i.e. what prefix caching cannot reuse")
+
+
+async def run_metrics(args):
+    from database import db_manager, USER_QUERY
+    from metrics import metrics, STAGE_LATENCY, LLM_TOKENS, TURN_LATENCY
+
+    intents = ["balance_inquiry", "card_blocking", "transaction_history", "loan_inquiry"]
+    steps = ["none", "card_selection", "dob_verification", "reason_collection", "final_confirmation"]
+    labels = [(intent, step) for intent in intents for step in steps]
+
+    def instrument(count: int) -> float:
+        """Per-turn metric updates: one turn, four stage timers and two token counters"""
+        started = time.perf_counter()
+        for i in range(count):
+            intent, step = labels[i % len(labels)]
+            for stage in ("intent_analysis", "route", "handler", "response_generation"):
+                with STAGE_LATENCY.time(stage, intent, step):
+                    pass
+            LLM_TOKENS.inc("response", "prompt", intent, step, amount=120)
+            LLM_TOKENS.inc("response", "completion", intent, step, amount=40)
+            TURN_LATENCY.observe(0.3, "two_call", intent)
+        return (time.perf_counter() - started) / count * 1e6
+
+    async def queries(count: int) -> float:
+        started = time.perf_counter()
+        for _ in range(count):
+            async with db_manager.get_connection() as conn:
+                cursor = await conn.execute(USER_QUERY, (args.user_id,))
+                await cursor.fetchone()
+        return (time.perf_counter() - started) / count * 1e6
+
+    print(f"{'':>28} {'disabled':>10} {'enabled':>10} {'overhead':>10}")
+    results = {}
+    for enabled in (False, True):
+        metrics.enabled = enabled
+        instrument(1000)
+        await queries(100)
+        results[enabled] = (instrument(args.turns), await queries(args.queries))
+    for index, name in enumerate(("turn metric updates (us)", "pooled query (us)")):
+        off, on = results[False][index], results[True][index]
+        print(f"{name:>28} {off:>10.2f} {on:>10.2f} {on - off:>10.2f}")
+
+    started = time.perf_counter()
+    body = metrics.render()
+    print(f"/metrics render: {(time.perf_counter() - started) * 1000:.2f} ms, "
+          f"{body.count(chr(10)):,} lines, {len(body):,} bytes")
+    await db_manager.close()
+
+
+async def run_templates(args):
+    import os
+    server = None
+    if not args.live:
+        from loadtest import MockLLMServer, use_mock_llm
+        server = MockLLMServer(latency=args.llm_latency)
+        await server.start()
+        use_mock_llm(server)
+    from database import db_manager, card_service, account_service, loan_service
+    from models import ConversationContext, Intent
+    from prompts import count_tokens
+    from services import conversation_ai
+    from templates import TEMPLATES
+
+    accounts = await account_service.get_user_accounts(args.user_id)
+    cards = await card_service.get_user_cards(args.user_id)
+    loans = await loan_service.get_user_loan_applications(args.user_id)
+    page = await account_service.get_transactions_page(args.user_id, 5)
+    selected = cards[0] if cards else {}
+    scenarios = [
+        (Intent.BALANCE_INQUIRY, {"accounts": accounts, "action": "show_balance"}),
+        (Intent.CARD_INQUIRY, {"cards": cards, "action": "show_cards"}),
+        (Intent.TRANSACTION_HISTORY, {"accounts": accounts, "transactions": page["transactions"],
+                                      "filters": page["filters"], "has_more": page["next_cursor"] is not None,
+                                      "action": "show_transactions"}),
+        (Intent.LOAN_INQUIRY, {"loan_applications": loans, "action": "show_loans"}),
+        (Intent.CARD_BLOCKING, {"active_cards": [], "action": "no_active_cards"}),
+        (Intent.CARD_BLOCKING, {"selected_card": selected, "blocked_card": {**selected, "card_status": "blocked"},
+                                "block_result": {"success": True, "message": "Card blocked successfully"},
+                                "action": "block_successful_verified"}),
+    ]
+    conversation_ai.breaker.enabled = False
+
+    source = "Groq API" if args.live else f"mock LLM, {args.llm_latency * 1000:.0f} ms per call"
+    print(f"LLM generation against the {source}")
+    print(f"{'action':>26} {'template us':>12} {'LLM ms':>9} {'speedup':>10} {'prompt tok':>11}")
+    for intent, system_data in scenarios:
+        action = system_data["action"]
+        render = TEMPLATES[action]
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            render(system_data)
+        template_us = (time.perf_counter() - started) / args.iterations * 1e6
+
+        context = ConversationContext(session_id="bench", user_id=args.user_id, current_intent=intent)
+        messages = conversation_ai._response_messages(context, "show me", system_data)
+        prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+        started = time.perf_counter()
+        for _ in range(args.llm_calls):
+            await conversation_ai.generate_response(context, "show me", system_data)
+        llm_ms = (time.perf_counter() - started) / args.llm_calls * 1000
+        print(f"{action:>26} {template_us:>12.1f} {llm_ms:>9.1f} {llm_ms * 1000 / template_us:>9.0f}x "
+              f"{prompt_tokens:>11}")
+    print("prompt tok = prompt tokens (plus up to 500 completion tokens) each templated reply saves")
+
+    await conversation_ai.history.close()
+    await conversation_ai.sessions.close()
+    await db_manager.close()
+    if server:
+        await server.stop()
+
+
+class FakeWebSocket:
+    """Stands in for a client socket; a hung client never accepts a frame"""
+
+    def __init__(self, hung: bool = False):
+        self.hung = hung
+        self.received = 0
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        if self.hung:
+            await asyncio.Event().wait()
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+
+async def run_fanout(args):
+    from connections import ConnectionManager
+    from events import CARD_BLOCKED, EventBus
+    import json
+
+    async def lag_probe(lags: List[float], stop: asyncio.Event):
+        """Worst event loop stall while the fan-out runs"""
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - started - 0.001)
+
+    print(f"{args.sockets:,} sockets for {args.sockets // args.sessions_per_user:,} users, "
+          f"{args.hung:.1%} hung clients, {args.events} broadcasts")
+    print(f"{'batch':>8} {'enqueue ms':>11} {'deliver ms':>11} {'max stall ms':>13} {'delivered':>11} {'dropped':>8}")
+    for batch_size in args.batch_sizes:
+        manager = ConnectionManager(max_queue=args.max_queue, send_timeout=args.send_timeout, batch_size=batch_size)
+        rng = random.Random(42)
+        sockets = []
+        for index in range(args.sockets):
+            websocket = FakeWebSocket(hung=rng.random() < args.hung)
+            sockets.append(websocket)
+            await manager.connect(websocket, f"ws_{index}", f"user_{index // args.sessions_per_user}")
+        await asyncio.sleep(0)
+
+        lags: List[float] = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(lag_probe(lags, stop))
+        enqueue = 0.0
+        started = time.perf_counter()
+        for index in range(args.events):
+            message = json.dumps({"type": "notification", "event": "broadcast", "data": {"index": index}})
+            queued = time.perf_counter()
+            await manager.broadcast(message)
+            enqueue += time.perf_counter() - queued
+        healthy = [websocket for websocket in sockets if not websocket.hung]
+        while sum(websocket.received for websocket in healthy) < len(healthy) * args.events:
+            await asyncio.sleep(0.001)
+        delivered = time.perf_counter() - started
+        stop.set()
+        await probe
+        print(f"{batch_size:>8} {enqueue / args.events * 1000:>11.2f} {delivered * 1000:>11.1f} "
+              f"{max(lags) * 1000:>13.2f} {manager.sent:>11,} {len(sockets) - len(healthy):>8}")
+
+        # Per-user events through the bus, as the card and loan write paths publish them
+        if batch_size == args.batch_sizes[-1]:
+            bus = EventBus()
+            bus.subscribe(lambda event: manager.send_to_user(
+                event.user_id, json.dumps({"type": "notification", **event.to_dict()})))
+            users = list(manager.by_user)
+            started = time.perf_counter()
+            for index in range(args.user_events):
+                bus.publish(CARD_BLOCKED, users[index % len(users)], card_last4="7890")
+            publish_us = (time.perf_counter() - started) / args.user_events * 1e6
+        await asyncio.sleep(args.send_timeout + 0.1)
+        disconnects = dict(manager.disconnects)
+        await manager.close()
+    print(f"per-user event publish + enqueue: {publish_us:.1f} us; slow clients dropped: {disconnects}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    db_pool = commands.add_parser("db-pool", help="Queries/s with and without the connection pool")
+    db_pool.add_argument("--concurrency", type=int, default=16)
+    db_pool.add_argument("--queries", type=int, default=5000)
+    db_pool.add_argument("--user-id", default="user_demo1")
+    db_pool.set_defaults(handler=run_db_pool)
+
+    coalescing = commands.add_parser("coalescing", help="DB round trips removed by single-flight reads and the read cache")
+    coalescing.add_argument("--sessions", type=int, default=50)
+    coalescing.add_argument("--users", type=int, default=2)
+    coalescing.add_argument("--bursts", type=int, default=20)
+    coalescing.add_argument("--gap", type=float, default=0.05, help="Seconds between bursts")
+    coalescing.add_argument("--ttl", type=float, default=1.0, help="Read cache TTL for the cached mode")
+    coalescing.set_defaults(handler=run_coalescing)
+
+    pages = commands.add_parser("transaction-pages", help="Keyset vs. OFFSET page latency deep into a large transactions table")
+    pages.add_argument("--db", default="bench_transactions.db")
+    pages.add_argument("--rows", type=int, default=2_000_000)
+    pages.add_argument("--page-size", type=int, default=20)
+    pages.add_argument("--depths", type=int, nargs="+", default=[0, 10, 100, 1000, 10000])
+    pages.add_argument("--user-id", default="user_demo1")
+    pages.set_defaults(handler=run_transaction_pages)
+
+    spending = commands.add_parser("spending", help="Spending totals from the daily rollups vs. summing raw transactions")
+    spending.add_argument("--db", default="bench_spending.db")
+    spending.add_argument("--rows", type=int, default=1_000_000)
+    spending.add_argument("--iterations", type=int, default=20)
+    spending.add_argument("--user-id", default="user_demo1")
+    spending.set_defaults(handler=run_spending)
+
+    bulk = commands.add_parser("bulk-load", help="Bulk loader vs. row-at-a-time inserts on a synthetic extract")
+    bulk.add_argument("--dir", default="bench_extract")
+    bulk.add_argument("--db", default="bench_bulk.db")
+    bulk.add_argument("--rows", type=int, default=10_000_000)
+    bulk.add_argument("--baseline-rows", type=int, default=200_000)
+    bulk.add_argument("--chunk-size", type=int, default=50000)
+    bulk.set_defaults(handler=run_bulk_load)
+
+    scale = commands.add_parser("scale", help="Service method latency percentiles on synthetic populations of growing size")
+    scale.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    scale.add_argument("--seed", type=int, default=42)
+    scale.add_argument("--transactions-per-account", type=float, default=40)
+    scale.add_argument("--samples", type=int, default=2000)
+    scale.add_argument("--warmup", type=int, default=50)
+    scale.add_argument("--db-dir", default="bench_scale")
+    scale.add_argument("--results", default="bench_scale/results.jsonl")
+    scale.set_defaults(handler=run_scale)
+
+    metrics_parser = commands.add_parser("metrics", help="Cost of the latency histograms and counters per turn and per query")
+    metrics_parser.add_argument("--turns", type=int, default=100_000)
+    metrics_parser.add_argument("--queries", type=int, default=5000)
+    metrics_parser.add_argument("--user-id", default="user_demo1")
+    metrics_parser.set_defaults(handler=run_metrics)
+
+    fallback = commands.add_parser("fallback-intents", help="Compiled fallback classifier vs. the original")
+    fallback.add_argument("--messages", type=int, default=1_000_000)
+    fallback.set_defaults(handler=run_fallback_intents)
+
+    router = commands.add_parser("intent-router", help="Offline accuracy, escalation rate and CPU cost of the local intent model")
+    router.add_argument("--corpus", default="intent_corpus.jsonl")
+    router.add_argument("--folds", type=int, default=5)
+    router.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9])
+    router.set_defaults(handler=run_intent_router)
+
+    history = commands.add_parser("history", help="Context size and prompt tokens as a conversation grows")
+    history.add_argument("--turns", type=int, default=10000)
+    history.add_argument("--window", type=int, default=8)
+    history.add_argument("--prompt-tokens", type=int, default=300)
+    history.add_argument("--user-id", default="user_demo1")
+    history.set_defaults(handler=run_history)
+
+    prompt_sizes = commands.add_parser("prompts", help="Prompt tokens and build time per handler action, before and after prompts.py")
+    prompt_sizes.add_argument("--user-id", default="user_demo1")
+    prompt_sizes.add_argument("--statement-rows", type=int, default=200)
+    prompt_sizes.add_argument("--iterations", type=int, default=2000)
+    prompt_sizes.set_defaults(handler=run_prompts)
+
+    templates = commands.add_parser("templates", help="Templated reply render time vs. LLM generation per handler action")
+    templates.add_argument("--user-id", default="user_demo1")
+    templates.add_argument("--iterations", type=int, default=10000)
+    templates.add_argument("--llm-calls", type=int, default=5)
+    templates.add_argument("--llm-latency", type=float, default=0.5, help="Mock LLM seconds per call")
+    templates.add_argument("--live", action="store_true", help="Call the Groq API (GROQ_API_KEY) instead of the mock")
+    templates.set_defaults(handler=run_templates)
+
+    fanout = commands.add_parser("fanout", help="WebSocket broadcast to simulated sockets, with hung clients")
+    fanout.add_argument("--sockets", type=int, default=10000)
+    fanout.add_argument("--sessions-per-user", type=int, default=2)
+    fanout.add_argument("--events", type=int, default=20)
+    fanout.add_argument("--user-events", type=int, default=10000)
+    fanout.add_argument("--hung", type=float, default=0.01, help="Fraction of clients that never read")
+    fanout.add_argument("--batch-sizes", type=int, nargs="+", default=[10000, 500, 100])
+    fanout.add_argument("--max-queue", type=int, default=256)
+    fanout.add_argument("--send-timeout", type=float, default=1.0)
+    fanout.set_defaults(handler=run_fanout)
+
+    args = parser.parse_args(argv)
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""Streaming bulk loader for core-banking extracts.
+
+Loads CSV (with a header row) or JSONL files of users, accounts, cards,
+transactions, loan applications and bill payments into the banking database:
+
+    python bulk_loader.py --users users.csv --accounts accounts.csv --transactions txns_*.jsonl
+    python bulk_loader.py --status
+
+Rows are inserted with executemany in chunks, one transaction per chunk,
+with durability relaxed on the loader's connection. Triggers on the loaded
+tables are dropped for the duration of the load and restored at the end.
+Secondary indexes are only dropped (and rebuilt once at the end) on tables
+that hold at most --rebuild-max-rows rows when the load starts; a delta into
+a populated table keeps them. Likewise the transaction rollups are rebuilt in
+full after loading into a (nearly) empty transactions table, and otherwise
+only for the account months the loaded rows fall in.
+
+Each chunk commits together with the file's byte offset in
+bulk_load_progress, so after a crash rerunning the same command resumes
+every file where it stopped. Files whose size or mtime changed are loaded
+from the start; completed files are skipped.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from schema import (ROLLUP_MONTH_INSERT, ROLLUP_REBUILD_MONTHS_STATEMENTS, ROLLUP_REBUILD_STATEMENTS,
+                    ROLLUP_REPLACED_MONTH_INSERT, apply_migrations, create_tables)
+
+# Loaded in this order so rows can reference the ones before them
+LOAD_TABLES = ("users", "accounts", "cards", "transactions", "loan_applications", "bill_payments")
+
+# Only the loader's own connection runs with these
+BULK_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "OFF",
+    "cache_size": -262144,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+# Marker in bulk_load_deferred: rebuild every rollup once the load completes
+FULL_ROLLUP_REBUILD = "transaction_rollups"
+
+
+def _csv_rows(handle, offset: int, columns: Sequence[str]) -> Tuple[List[str], Iterator[Tuple[tuple, int]]]:
+    header = next(csv.reader([handle.readline().decode("utf-8-sig")]))
+    picked = [column for column in header if column in columns]
+    positions = [header.index(column) for column in picked]
+    if offset:
+        handle.seek(offset)
+    position = handle.tell()
+
+    def lines() -> Iterator[str]:
+        nonlocal position
+        for line in iter(handle.readline, b""):
+            position += len(line)
+            yield line.decode("utf-8")
+
+    def rows() -> Iterator[Tuple[tuple, int]]:
+        # csv pulls exactly the lines of one record, so position is the
+        # offset just past the record being yielded
+        for values in csv.reader(lines()):
+            if values:
+                yield tuple(values[i] or None for i in positions), position
+
+    return picked, rows()
+
+
+def _jsonl_rows(handle, offset: int, columns: Sequence[str]) -> Tuple[List[str], Iterator[Tuple[tuple, int]]]:
+    handle.seek(offset)
+    first = handle.readline()
+    while first and not first.strip():
+        first = handle.readline()
+    if not first:
+        return [], iter(())
+    record = json.loads(first)
+    picked = [column for column in columns if column in record]
+
+    def rows() -> Iterator[Tuple[tuple, int]]:
+        yield tuple(record.get(column) for column in picked), handle.tell()
+        for line in iter(handle.readline, b""):
+            if line.strip():
+                row = json.loads(line)
+                yield tuple(row.get(column) for column in picked), handle.tell()
+
+    return picked, rows()
+
+
+class BulkLoader:
+    """Chunked, resumable loader writing straight to the SQLite file"""
+
+    def __init__(self, db_path: str = "banking_system.db", chunk_size: int = 50000,
+                 report_interval: float = 5.0, rebuild_max_rows: int = 100000):
+        self.db_path = db_path
+        self.chunk_size = chunk_size
+        self.report_interval = report_interval
+        self.rebuild_max_rows = rebuild_max_rows
+        # Creates the schema and applies migrations, without demo data
+        conn = sqlite3.connect(db_path)
+        try:
+            create_tables(conn)
+            apply_migrations(conn)
+        finally:
+            conn.close()
+        self.conn = sqlite3.connect(db_path, isolation_level=None)
+        for name, value in BULK_PRAGMAS.items():
+            self.conn.execute(f"PRAGMA {name} = {value}")
+
+    def load(self, files: Dict[str, Sequence[str]]) -> Dict[str, int]:
+        """Load files per table (table -> paths), then rebuild deferred
+        indexes and triggers. Returns the rows inserted per table."""
+        unknown = set(files) - set(LOAD_TABLES)
+        if unknown:
+            raise ValueError(f"Unknown tables: {', '.join(sorted(unknown))}")
+
+        self.defer_schema_objects([table for table in LOAD_TABLES if files.get(table)])
+        inserted = {}
+        started = time.perf_counter()
+        for table in LOAD_TABLES:
+            for path in files.get(table, ()):
+                inserted[table] = inserted.get(table, 0) + self.load_file(table, path)
+        total = sum(inserted.values())
+        elapsed = time.perf_counter() - started
+        print(f"Loaded {total:,} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f} rows/s)")
+        self.finish()
+        return inserted
+
+    def load_file(self, table: str, path: str) -> int:
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        progress = self.conn.execute(
+            "SELECT file_size, file_mtime, byte_offset, rows_loaded, completed_at "
+            "FROM bulk_load_progress WHERE path = ?", (key,)
+        ).fetchone()
+        offset, loaded = 0, 0
+        if progress and (progress[0], progress[1]) == (stat.st_size, stat.st_mtime):
+            if progress[4]:
+                print(f"{table}: {path} already loaded ({progress[3]:,} rows), skipping")
+                return 0
+            offset, loaded = progress[2], progress[3]
+            if loaded:
+                print(f"{table}: resuming {path} after {loaded:,} rows")
+        now = datetime.now().isoformat()
+        self.conn.execute("""
+        INSERT OR REPLACE INTO bulk_load_progress
+            (path, table_name, file_size, file_mtime, byte_offset, rows_loaded, started_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (key, table, stat.st_size, stat.st_mtime, offset, loaded, now, now))
+
+        columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+        reader = _jsonl_rows if path.endswith((".jsonl", ".ndjson")) else _csv_rows
+        inserted = 0
+        with open(path, "rb") as handle:
+            picked, rows = reader(handle, offset, columns)
+            if not picked:
+                print(f"{table}: {path} has no {table} columns, skipping")
+                self._commit_chunk("", [], key, offset, completed=True)
+                return 0
+            statement = (f"INSERT OR REPLACE INTO {table} ({', '.join(picked)}) "
+                         f"VALUES ({', '.join('?' * len(picked))})")
+            months = self._rollup_months(table, picked)
+
+            started = last_report = time.perf_counter()
+            batch: List[tuple] = []
+            for row, end in rows:
+                batch.append(row)
+                if len(batch) >= self.chunk_size:
+                    self._commit_chunk(statement, batch, key, end, months=months)
+                    inserted += len(batch)
+                    batch.clear()
+                    if time.perf_counter() - last_report >= self.report_interval:
+                        last_report = time.perf_counter()
+                        print(f"{table}: {loaded + inserted:,} rows from {os.path.basename(path)} "
+                              f"({inserted / (last_report - started):,.0f} rows/s, "
+                              f"{end / max(stat.st_size, 1):.0%})")
+            end = handle.tell()
+            self._commit_chunk(statement, batch, key, end, completed=True, months=months)
+            inserted += len(batch)
+
+        elapsed = time.perf_counter() - started
+        print(f"{table}: {path} done, {inserted:,} rows in {elapsed:.1f}s "
+              f"({inserted / elapsed if elapsed else 0:,.0f} rows/s)")
+        return inserted
+
+    def _rollup_months(self, table: str, picked: Sequence[str]) -> Optional[Tuple[Optional[int], int, Optional[int]]]:
+        """Positions of transaction_id, account_id and transaction_date in a row
+        when the rollups are rebuilt per account month, else None"""
+        if table != "transactions" or "account_id" not in picked or self._full_rollup_rebuild():
+            return None
+        position = {column: index for index, column in enumerate(picked)}
+        return position.get("transaction_id"), position["account_id"], position.get("transaction_date")
+
+    def _full_rollup_rebuild(self) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM bulk_load_deferred WHERE name = ?", (FULL_ROLLUP_REBUILD,)
+        ).fetchone() is not None
+
+    def _commit_chunk(self, statement: str, batch: List[tuple], key: str, end: int, completed: bool = False,
+                      months: Optional[Tuple[Optional[int], int, Optional[int]]] = None):
+        """Insert a chunk and record the resume point (and the account months
+        it touches) in the same transaction"""
+        now = datetime.now().isoformat()
+        self.conn.execute("BEGIN")
+        try:
+            if batch and months:
+                id_index, account_index, date_index = months
+                # A replaced row leaves its old month out of date too
+                if id_index is not None:
+                    self.conn.executemany(ROLLUP_REPLACED_MONTH_INSERT, ((row[id_index],) for row in batch))
+                # Rows without a date get CURRENT_TIMESTAMP
+                self.conn.executemany(ROLLUP_MONTH_INSERT, {
+                    (row[account_index], row[date_index] if date_index is not None else "now") for row in batch
+                })
+            if batch:
+                self.conn.executemany(statement, batch)
+            self.conn.execute("""
+            UPDATE bulk_load_progress
+            SET byte_offset = ?, rows_loaded = rows_loaded + ?, updated_at = ?, completed_at = ?
+            WHERE path = ?
+            """, (end, len(batch), now, now if completed else None, key))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _nearly_empty(self, table: str) -> bool:
+        rows = self.conn.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} LIMIT ?)",
+                                 (self.rebuild_max_rows + 1,)).fetchone()[0]
+        return rows <= self.rebuild_max_rows
+
+    def defer_schema_objects(self, tables: Sequence[str] = LOAD_TABLES):
+        """Drop triggers on the given tables, and their secondary indexes if
+        the tables are (nearly) empty, keeping the definitions so finish()
+        (or a resumed run) can restore them"""
+        objects = []
+        full_rebuild = False
+        for table in tables:
+            kinds = ("trigger",)
+            if self._nearly_empty(table):
+                kinds = ("index", "trigger")
+                full_rebuild = full_rebuild or table == "transactions"
+            elif self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+                                   "AND sql IS NOT NULL", (table,)).fetchone():
+                print(f"{table}: over {self.rebuild_max_rows:,} rows already, keeping its indexes")
+            objects += self.conn.execute(f"""
+            SELECT name, type, sql FROM sqlite_master
+            WHERE type IN ({', '.join('?' * len(kinds))}) AND sql IS NOT NULL AND tbl_name = ?
+            """, (*kinds, table)).fetchall()
+        if not objects and not full_rebuild:
+            return
+        self.conn.execute("BEGIN")
+        for name, kind, sql in objects:
+            self.conn.execute("INSERT OR REPLACE INTO bulk_load_deferred (name, type, sql) VALUES (?, ?, ?)",
+                              (name, kind, sql))
+            self.conn.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+        if full_rebuild:
+            self.conn.execute("INSERT OR REPLACE INTO bulk_load_deferred (name, type, sql) VALUES (?, 'rollups', '')",
+                              (FULL_ROLLUP_REBUILD,))
+        self.conn.execute("COMMIT")
+        if objects:
+            print(f"Deferred {len(objects)} indexes and triggers until the load completes")
+
+    def finish(self):
+        """Rebuild deferred indexes, then the rollups (in full, or the account
+        months a delta touched) and their triggers, and invalidate cached
+        replies for every user"""
+        deferred = self.conn.execute(
+            "SELECT name, type, sql FROM bulk_load_deferred ORDER BY type = 'trigger', name"
+        ).fetchall()
+        for name, kind, sql in deferred:
+            if kind != "index":
+                continue
+            started = time.perf_counter()
+            self.conn.execute("BEGIN")
+            self.conn.execute(sql)
+            self.conn.execute("DELETE FROM bulk_load_deferred WHERE name = ?", (name,))
+            self.conn.execute("COMMIT")
+            print(f"Built index {name} in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        triggers = [(name, sql) for name, kind, sql in deferred if kind == "trigger"]
+        self.conn.execute("BEGIN")
+        for name, sql in triggers:
+            self.conn.execute(sql)
+            self.conn.execute("DELETE FROM bulk_load_deferred WHERE name = ?", (name,))
+        # Rows loaded while the rollup triggers were off are not in the rollups yet
+        full_rebuild = any(kind == "rollups" for _, kind, _ in deferred)
+        months = self.conn.execute("SELECT COUNT(*) FROM bulk_load_rollup_months").fetchone()[0]
+        if full_rebuild:
+            for statement in ROLLUP_REBUILD_STATEMENTS:
+                self.conn.execute(statement)
+            self.conn.execute("DELETE FROM bulk_load_rollup_months")
+            self.conn.execute("DELETE FROM bulk_load_deferred WHERE name = ?", (FULL_ROLLUP_REBUILD,))
+        elif months:
+            for statement in ROLLUP_REBUILD_MONTHS_STATEMENTS:
+                self.conn.execute(statement)
+        # Replies cached against the old data must not be served again
+        self.conn.execute("""
+        INSERT INTO user_data_versions (user_id, version) SELECT user_id, 1 FROM users WHERE true
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+        """)
+        self.conn.execute("COMMIT")
+        if full_rebuild:
+            print(f"Rebuilt transaction rollups in {time.perf_counter() - started:.1f}s")
+        elif months:
+            print(f"Rebuilt transaction rollups for {months:,} account months in {time.perf_counter() - started:.1f}s")
+        self.conn.execute("PRAGMA optimize")
+
+    def status(self) -> List[Dict[str, object]]:
+        self.conn.row_factory = sqlite3.Row
+        try:
+            rows = self.conn.execute("SELECT * FROM bulk_load_progress ORDER BY started_at").fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            self.conn.row_factory = None
+
+    def close(self):
+        self.conn.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="banking_system.db")
+    for table in LOAD_TABLES:
+        parser.add_argument(f"--{table.replace('_', '-')}", dest=table, nargs="+", default=[], metavar="FILE")
+    parser.add_argument("--chunk-size", type=int, default=int(os.getenv("BULK_CHUNK_SIZE", "50000")))
+    parser.add_argument("--rebuild-max-rows", type=int, default=int(os.getenv("BULK_REBUILD_MAX_ROWS", "100000")),
+                        help="Drop and rebuild a table's indexes only if it holds at most this many rows")
+    parser.add_argument("--status", action="store_true", help="Show per-file progress and exit")
+    args = parser.parse_args(argv)
+
+    loader = BulkLoader(args.db, chunk_size=args.chunk_size, rebuild_max_rows=args.rebuild_max_rows)
+    try:
+        if args.status:
+            for row in loader.status():
+                state = "done" if row["completed_at"] else "in progress"
+                print(f"{row['table_name']:>12} {row['rows_loaded']:>12,} {state:>12}  {row['path']}")
+            return
+        loader.load({table: getattr(args, table) for table in LOAD_TABLES if getattr(args, table)})
+    finally:
+        loader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class LRUCache:
+    """In-process LRU cache with optional TTL and hit/miss/eviction counters.
+
+    With sliding=True the TTL is an idle timeout that every read refreshes;
+    otherwise entries expire a fixed time after they were written.
+    """
+
+    def __init__(self, capacity: int = 1024, ttl: Optional[float] = None, sliding: bool = True,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.sliding = sliding
+        self.on_evict = on_evict
+        self.clock = clock
+        # key -> (value, timestamp); ordered from least to most recently used
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and not self._expired(entry[1], self.clock())
+
+    def _expired(self, timestamp: float, now: float) -> bool:
+        return self.ttl is not None and now - timestamp > self.ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        now = self.clock()
+        value, timestamp = entry
+        if self._expired(timestamp, now):
+            self._remove(key, value)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        if self.sliding:
+            self._entries[key] = (value, now)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (value, self.clock())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            oldest_key, (oldest_value, _) = next(iter(self._entries.items()))
+            self._remove(oldest_key, oldest_value)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.pop(key, None)
+        return entry[0] if entry is not None else default
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches predicate"""
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def sweep(self) -> int:
+        """Remove expired entries and return how many were dropped"""
+        if self.ttl is None:
+            return 0
+        now = self.clock()
+        expired: List[Tuple[Hashable, Any]] = []
+        if self.sliding:
+            # Access order matches timestamp order, so stop at the first live entry
+            for key, (value, timestamp) in self._entries.items():
+                if not self._expired(timestamp, now):
+                    break
+                expired.append((key, value))
+        else:
+            expired = [(key, value) for key, (value, timestamp) in self._entries.items()
+                       if self._expired(timestamp, now)]
+        for key, value in expired:
+            self._remove(key, value)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _remove(self, key: Hashable, value: Any):
+        del self._entries[key]
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class ResponseCache:
+    """Generated replies for read-only intents, keyed on the user's data version.
+
+    Write paths bump the version, so a cached reply is only served while the
+    data it was generated from is unchanged; the TTL bounds everything else
+    (e.g. wording drift). Message-to-intent memos let a repeated question skip
+    intent analysis too.
+    """
+
+    def __init__(self, capacity: int = 10000, ttl: Optional[float] = 300.0):
+        self.replies = LRUCache(capacity=capacity, ttl=ttl, sliding=False)
+        self.message_intents = LRUCache(capacity=capacity, ttl=ttl, sliding=False)
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        return " ".join(re.sub(r"[^a-z0-9 ]", " ", message.lower()).split())
+
+    def get(self, user_id: str, intent: str, version: int) -> Optional[str]:
+        return self.replies.get((user_id, intent, version))
+
+    def set(self, user_id: str, intent: str, version: int, reply: str):
+        self.replies.set((user_id, intent, version), reply)
+
+    def known_intent(self, message: str) -> Optional[str]:
+        return self.message_intents.get(self.normalize(message))
+
+    def remember_intent(self, message: str, intent: str):
+        self.message_intents.set(self.normalize(message), intent)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"replies": self.replies.stats(), "message_intents": self.message_intents.stats()}
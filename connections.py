@@ -0,0 +1,227 @@
+"""WebSocket connections indexed by session and by user.
+
+Sends never wait on a socket: each connection has a bounded queue drained by
+its own writer task, so one slow client cannot hold up a turn or a fan-out
+to other clients. A client whose queue fills up (WS_SEND_QUEUE messages), or
+that does not accept a frame within WS_SEND_TIMEOUT seconds, is disconnected
+with close code 1013 (try again later). Streamed reply chunks (send_delta)
+are merged into the assistant_delta frame still waiting at the tail of the
+queue, so a fast stream to a slower client takes one slot per frame actually
+written rather than one per chunk. Fan-out to many users enqueues in
+batches of WS_FANOUT_BATCH connections, yielding to the event loop between
+batches.
+"""
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Union
+
+from metrics import WS_DISCONNECTS
+
+# Close code sent to clients dropped for falling behind
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+
+class DeltaFrame:
+    """assistant_delta frame that later chunks are appended to until it is sent"""
+    __slots__ = ("session_id", "chunks")
+
+    def __init__(self, session_id: str, delta: str):
+        self.session_id = session_id
+        self.chunks: List[str] = [delta]
+
+    def render(self) -> str:
+        return json.dumps({"type": "assistant_delta", "delta": "".join(self.chunks), "session_id": self.session_id})
+
+
+class Connection:
+    __slots__ = ("websocket", "session_id", "user_id", "queue", "ready", "writer", "closed", "close_reason",
+                 "send_started")
+
+    def __init__(self, websocket: Any, session_id: str, user_id: str):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.user_id = user_id
+        self.queue: Deque[Union[str, DeltaFrame]] = deque()
+        self.ready = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.close_reason: Optional[str] = None
+        # Loop time the frame being sent was handed to the socket, 0 when idle
+        self.send_started = 0.0
+
+
+class ConnectionManager:
+    def __init__(self, max_queue: int = 256, send_timeout: float = 5.0, batch_size: int = 500):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.batch_size = batch_size
+        self.connections: Dict[str, Connection] = {}
+        self.by_user: Dict[str, Dict[str, Connection]] = {}
+        self.sent = 0
+        self.merged_deltas = 0
+        self.disconnects: Dict[str, int] = {}
+        self._watchdog: Optional[asyncio.Task] = None
+
+    async def connect(self, websocket: Any, session_id: str, user_id: str) -> Connection:
+        await websocket.accept()
+        return self.register(websocket, session_id, user_id)
+
+    def register(self, websocket: Any, session_id: str, user_id: str) -> Connection:
+        """Track an accepted socket and start its writer task"""
+        self.disconnect(session_id)
+        connection = Connection(websocket, session_id, user_id)
+        self.connections[session_id] = connection
+        self.by_user.setdefault(user_id, {})[session_id] = connection
+        connection.writer = asyncio.create_task(self._writer(connection))
+        if self._watchdog is None or self._watchdog.done():
+            self._watchdog = asyncio.create_task(self._watch_sends())
+        return connection
+
+    def disconnect(self, session_id: str, reason: Optional[str] = None):
+        """Forget the connection; with a reason the socket is also closed"""
+        connection = self.connections.pop(session_id, None)
+        if connection is None:
+            return
+        sessions = self.by_user.get(connection.user_id)
+        if sessions is not None:
+            sessions.pop(session_id, None)
+            if not sessions:
+                del self.by_user[connection.user_id]
+        connection.closed = True
+        connection.close_reason = reason
+        connection.queue.clear()
+        # Wakes the writer so it can exit (and close the socket)
+        connection.ready.set()
+        if reason:
+            self.disconnects[reason] = self.disconnects.get(reason, 0) + 1
+            WS_DISCONNECTS.inc(reason)
+
+    def _enqueue(self, connection: Connection, message: Union[str, DeltaFrame]) -> bool:
+        if connection.closed:
+            return False
+        if len(connection.queue) >= self.max_queue:
+            print(f"WebSocket {connection.session_id} fell {self.max_queue} messages behind, disconnecting")
+            self.disconnect(connection.session_id, "queue_full")
+            return False
+        connection.queue.append(message)
+        connection.ready.set()
+        return True
+
+    def send(self, session_id: str, message: str) -> bool:
+        """Queue message for one session; False if it is gone or was dropped"""
+        connection = self.connections.get(session_id)
+        return connection is not None and self._enqueue(connection, message)
+
+    def send_delta(self, session_id: str, delta: str) -> bool:
+        """Queue a streamed reply chunk, merged into a delta frame that is still queued"""
+        connection = self.connections.get(session_id)
+        if connection is None or connection.closed:
+            return False
+        if connection.queue and isinstance(connection.queue[-1], DeltaFrame):
+            connection.queue[-1].chunks.append(delta)
+            self.merged_deltas += 1
+            return True
+        return self._enqueue(connection, DeltaFrame(session_id, delta))
+
+    def send_to_user(self, user_id: str, message: str) -> int:
+        """Queue message on every open session of user_id; returns how many"""
+        sessions = self.by_user.get(user_id)
+        if not sessions:
+            return 0
+        return sum(self._enqueue(connection, message) for connection in list(sessions.values()))
+
+    async def broadcast(self, message: str, user_ids: Optional[Iterable[str]] = None) -> int:
+        """Queue message for the given users (default: everyone), a batch at a time"""
+        if user_ids is None:
+            targets = list(self.connections.values())
+        else:
+            targets = [connection for user_id in user_ids for connection in self.by_user.get(user_id, {}).values()]
+        queued = 0
+        for start in range(0, len(targets), self.batch_size):
+            for connection in targets[start:start + self.batch_size]:
+                queued += self._enqueue(connection, message)
+            await asyncio.sleep(0)
+        return queued
+
+    async def _writer(self, connection: Connection):
+        websocket = connection.websocket
+        loop = asyncio.get_running_loop()
+        try:
+            while not connection.closed:
+                await connection.ready.wait()
+                connection.ready.clear()
+                # Drain everything queued since the last wakeup in one go
+                while connection.queue and not connection.closed:
+                    message = connection.queue.popleft()
+                    if isinstance(message, DeltaFrame):
+                        message = message.render()
+                    connection.send_started = loop.time()
+                    await websocket.send_text(message)
+                    connection.send_started = 0.0
+                    self.sent += 1
+        except asyncio.CancelledError:
+            # Stopped by the watchdog or by close(); only the former closes the socket
+            if connection.close_reason != "send_timeout":
+                raise
+        except Exception:
+            # The client went away mid-send; the receive loop sees it too
+            self.disconnect(connection.session_id, "send_error")
+        if connection.close_reason in ("queue_full", "send_timeout"):
+            try:
+                await asyncio.wait_for(websocket.close(code=SLOW_CLIENT_CLOSE_CODE), 1.0)
+            except Exception:
+                pass
+
+    async def _watch_sends(self):
+        """Disconnect clients stuck on one frame for over send_timeout seconds.
+
+        A single periodic scan instead of a timeout per frame keeps sends to
+        thousands of sockets cheap.
+        """
+        loop = asyncio.get_running_loop()
+        while self.connections:
+            await asyncio.sleep(self.send_timeout / 2)
+            deadline = loop.time() - self.send_timeout
+            stuck = [connection for connection in self.connections.values()
+                     if connection.send_started and connection.send_started < deadline]
+            for connection in stuck:
+                print(f"WebSocket {connection.session_id} did not accept a frame in {self.send_timeout:g}s, "
+                      f"disconnecting")
+                self.disconnect(connection.session_id, "send_timeout")
+                connection.writer.cancel()
+
+    def queued(self) -> int:
+        return sum(len(connection.queue) for connection in self.connections.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.connections),
+            "users": len(self.by_user),
+            "queued_messages": self.queued(),
+            "sent": self.sent,
+            "merged_deltas": self.merged_deltas,
+            "disconnects": dict(self.disconnects),
+            "max_queue": self.max_queue,
+            "send_timeout": self.send_timeout
+        }
+
+    async def close(self):
+        """Stop every writer task and the watchdog"""
+        tasks = [connection.writer for connection in self.connections.values() if connection.writer]
+        for session_id in list(self.connections):
+            self.disconnect(session_id)
+        if self._watchdog is not None:
+            tasks.append(self._watchdog)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def create_connection_manager() -> ConnectionManager:
+    return ConnectionManager(
+        max_queue=int(os.getenv("WS_SEND_QUEUE", "256")),
+        send_timeout=float(os.getenv("WS_SEND_TIMEOUT", "5")),
+        batch_size=int(os.getenv("WS_FANOUT_BATCH", "500"))
+    )
@@ -1,121 +1,394 @@
+import asyncio
+import base64
+import heapq
+import json
 import sqlite3
 import os
+import time
 from datetime import datetime, timedelta
 import random
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
 import uuid
 import aiosqlite
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Awaitable, Callable, Hashable
+
+from cache import LRUCache
+from events import (CARD_BLOCKED, CARD_CREATED, LOAN_APPLICATION_CREATED, LOAN_DECISION, card_last4,
+                    event_bus)
+from metrics import DB_CONNECTION_HOLD, DB_CONNECTION_WAIT, DB_PREFETCH, turn_labels
+from schema import MERCHANT_KEY_SQL, ROLLUP_REBUILD_STATEMENTS, apply_migrations, create_tables
+from tracing import traced_connection
+
+# Hot read queries, shared by the services and the query plan check
+USER_QUERY = "SELECT * FROM users WHERE user_id = ?"
+
+USER_CARDS_QUERY = """
+SELECT c.*, a.account_number
+FROM cards c
+JOIN accounts a ON c.account_id = a.account_id
+WHERE c.user_id = ?
+ORDER BY c.created_at DESC
+"""
+
+CARD_BY_ID_QUERY = "SELECT * FROM cards WHERE card_id = ? AND user_id = ?"
+
+USER_LOANS_QUERY = """
+SELECT * FROM loan_applications
+WHERE user_id = ?
+ORDER BY applied_at DESC
+"""
+
+USER_ACCOUNTS_QUERY = "SELECT * FROM accounts WHERE user_id = ? ORDER BY created_at DESC"
+
+ACCOUNT_TRANSACTIONS_QUERY = """
+SELECT * FROM transactions
+WHERE account_id = ?
+ORDER BY transaction_date DESC
+LIMIT ?
+"""
+
+# One keyset page of an account's transactions, newest first. The cursor
+# position and the end of the date range are both folded into the row-value
+# upper bound, so every page is a single index range seek. Each filter has
+# its own query so that the seek runs on the index with that filter's column.
+TRANSACTIONS_PAGE_QUERY = """
+SELECT * FROM transactions
+WHERE account_id = ?
+  AND (transaction_date, transaction_id) < (?, ?)
+  AND transaction_date >= ?
+ORDER BY transaction_date DESC, transaction_id DESC
+LIMIT ?
+"""
+
+TRANSACTIONS_PAGE_BY_TYPE_QUERY = """
+SELECT * FROM transactions
+WHERE account_id = ? AND transaction_type = ?
+  AND (transaction_date, transaction_id) < (?, ?)
+  AND transaction_date >= ?
+ORDER BY transaction_date DESC, transaction_id DESC
+LIMIT ?
+"""
+
+# Merchant names match by case-insensitive prefix: the seek is on the first
+# word, the rest of the prefix is checked on the rows it finds
+TRANSACTIONS_PAGE_BY_MERCHANT_QUERY = f"""
+SELECT * FROM transactions
+WHERE account_id = ? AND {MERCHANT_KEY_SQL} = ?
+  AND instr(lower(merchant_name), ?) = 1
+  AND (transaction_date, transaction_id) < (?, ?)
+  AND transaction_date >= ?
+  AND (? IS NULL OR transaction_type = ?)
+ORDER BY transaction_date DESC, transaction_id DESC
+LIMIT ?
+"""
+
+DATA_VERSION_QUERY = "SELECT version FROM user_data_versions WHERE user_id = ?"
+
+# Spending over a date range from the daily rollups rather than raw
+# transactions, so its cost grows with days x merchants, not row count.
+# Grouping only sorts the handful of already-aggregated rows in range, so
+# this query is not part of the plan check.
+SPENDING_ROLLUP_QUERY = """
+SELECT a.account_number, r.category, r.merchant_name,
+       SUM(r.total_amount) AS total_amount, SUM(r.transaction_count) AS transaction_count,
+       MIN(r.day) AS first_day, MAX(r.day) AS last_day
+FROM accounts a
+JOIN transaction_rollups r ON r.account_id = a.account_id
+WHERE a.user_id = ?
+  AND r.day >= ? AND r.day < ?
+  AND r.transaction_type = ?
+  AND (? IS NULL OR r.category = ?)
+  AND (? IS NULL OR r.merchant_name LIKE '%' || ? || '%')
+GROUP BY a.account_number, r.category, r.merchant_name
+"""
+
+SERVICE_QUERIES = {
+    "UserService.get_user": USER_QUERY,
+    "CardService.get_user_cards": USER_CARDS_QUERY,
+    "CardService.get_card_by_id": CARD_BY_ID_QUERY,
+    "LoanService.get_user_loan_applications": USER_LOANS_QUERY,
+    "AccountService.get_user_accounts": USER_ACCOUNTS_QUERY,
+    "AccountService.get_account_transactions": ACCOUNT_TRANSACTIONS_QUERY,
+    "AccountService.get_transactions_page": TRANSACTIONS_PAGE_QUERY,
+    "AccountService.get_transactions_page[transaction_type]": TRANSACTIONS_PAGE_BY_TYPE_QUERY,
+    "AccountService.get_transactions_page[merchant]": TRANSACTIONS_PAGE_BY_MERCHANT_QUERY,
+    "UserService.get_data_version": DATA_VERSION_QUERY,
+}
+
+# Upper bound used when a page has neither a cursor nor an end date
+_LATEST_KEY = ("9999-12-31", "")
+
+def encode_transaction_cursor(transaction_date: str, transaction_id: str, filters: Dict[str, Any]) -> str:
+    """Opaque cursor resuming after the given row with the same filters"""
+    payload = json.dumps({"d": transaction_date, "i": transaction_id, "f": filters}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_transaction_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return {"position": (payload["d"], payload["i"]), "filters": payload["f"]}
+    except Exception:
+        raise ValueError("Invalid transaction cursor")
+
+async def bump_data_version(conn: aiosqlite.Connection, user_id: str):
+    """Increment a user's data version inside the caller's write transaction"""
+    await conn.execute("""
+    INSERT INTO user_data_versions (user_id, version) VALUES (?, 1)
+    ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+    """, (user_id,))
+
+class ConnectionPool:
+    """Bounded pool of warm aiosqlite connections.
+
+    Each aiosqlite connection owns a worker thread, so connections are opened
+    lazily up to max_size, configured once, and then reused. Use acquire() and
+    release() directly or DatabaseManager.get_connection() as a context manager.
+    """
+
+    def __init__(self, db_path: str, max_size: int = 8, pragmas: Optional[Dict[str, Any]] = None):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.pragmas = pragmas or {}
+        self._idle: List[aiosqlite.Connection] = []
+        self._slots = asyncio.Semaphore(max_size)
+        self._size = 0
+        self._closed = False
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_path)
+        conn.row_factory = aiosqlite.Row
+        for name, value in self.pragmas.items():
+            await conn.execute(f"PRAGMA {name}={value}")
+        self._size += 1
+        return conn
+
+    async def acquire(self) -> aiosqlite.Connection:
+        """Check out a connection, waiting if all max_size are in use"""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        await self._slots.acquire()
+        try:
+            if self._idle:
+                return self._idle.pop()
+            return await self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    async def release(self, conn: aiosqlite.Connection, discard: bool = False):
+        """Return a connection to the pool, closing it if it is unusable"""
+        try:
+            if not discard and not self._closed:
+                if conn.in_transaction:
+                    await conn.rollback()
+                self._idle.append(conn)
+                return
+        except Exception:
+            pass
+        finally:
+            self._slots.release()
+        await self._close_connection(conn)
+
+    async def _close_connection(self, conn: aiosqlite.Connection):
+        self._size -= 1
+        try:
+            await conn.close()
+        except Exception:
+            pass
+
+    async def close(self):
+        """Close idle connections; checked-out ones are closed on release"""
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self._close_connection(conn)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": self._size, "idle": len(self._idle), "max_size": self.max_size}
+
+# Sentinel for cache misses, since None is a valid cached result
+_MISSING = object()
+
+# Reads started ahead of the handler for the turn being handled, keyed by
+# (read name, user_id); the first matching get() takes over the task
+prefetched_reads: ContextVar[Optional[Dict[Hashable, asyncio.Task]]] = ContextVar("prefetched_reads", default=None)
+
+class ReadCoalescer:
+    """Single-flight layer, with an optional short-TTL cache, for per-user reads.
+
+    Concurrent calls for the same key share one in-flight query and its
+    result. With ttl > 0 results are also cached until they expire or a write
+    for that user calls invalidate(). A read that overlapped a write is
+    returned to its callers but never cached. Every caller gets its own copy
+    of the rows, so callers may mutate them freely.
+    """
+
+    def __init__(self, enabled: bool = True, ttl: float = 0.0, capacity: int = 10000):
+        self.enabled = enabled
+        self.cache: Optional[LRUCache] = LRUCache(capacity=capacity, ttl=ttl, sliding=False) if ttl > 0 else None
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        # Bumped by invalidate(); a read only caches if it saw no bump
+        self._generations: Dict[str, int] = {}
+        self.calls = 0
+        self.db_reads = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _copy(result: Any) -> Any:
+        if isinstance(result, list):
+            return [dict(row) for row in result]
+        if isinstance(result, dict):
+            return dict(result)
+        return result
+
+    async def get(self, name: str, user_id: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        prefetched = prefetched_reads.get()
+        if prefetched:
+            task = prefetched.pop((name, user_id), None)
+            if task is not None and not task.cancelled():
+                DB_PREFETCH.inc(name, "used")
+                return await task
+
+        if not self.enabled:
+            self.db_reads += 1
+            return await loader()
+
+        key = (name, user_id)
+        if self.cache is not None:
+            cached = self.cache.get(key, _MISSING)
+            if cached is not _MISSING:
+                return self._copy(cached)
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._load(key, user_id, loader))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._in_flight.pop(key, None) if self._in_flight.get(key) is done else None)
+        # Shielded so one caller being cancelled doesn't cancel the shared query
+        return self._copy(await asyncio.shield(task))
+
+    async def _load(self, key: Hashable, user_id: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        generation = self._generations.get(user_id, 0)
+        self.db_reads += 1
+        result = await loader()
+        if self.cache is not None and self._generations.get(user_id, 0) == generation:
+            self.cache.set(key, result)
+        return result
+
+    def invalidate(self, user_id: str):
+        """Forget cached and in-flight reads for user_id after a committed write"""
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        self.invalidations += 1
+        # Later callers must not join a query that may predate the write
+        for key in [key for key in self._in_flight if key[1] == user_id]:
+            del self._in_flight[key]
+        prefetched = prefetched_reads.get()
+        if prefetched:
+            for key in [key for key in prefetched if key[1] == user_id]:
+                prefetched.pop(key).cancel()
+                DB_PREFETCH.inc(key[0], "stale")
+        if self.cache is not None:
+            self.cache.invalidate(lambda key: key[1] == user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "db_reads": self.db_reads,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "cache": self.cache.stats() if self.cache is not None else None
+        }
 
 class DatabaseManager:
-    def __init__(self, db_path="banking_system.db"):
+    def __init__(self, db_path="banking_system.db", demo_data=True, lazy=False):
         self.db_path = db_path
+        self.demo_data = demo_data
+        self.initialized = False
+        self._initializing: Optional[asyncio.Future] = None
+        # lazy defers creating the file until initialize() or the first connection
+        if not lazy:
+            self.initialize()
+        # Pragmas are applied once per pooled connection, not per query
+        self.pool = ConnectionPool(
+            db_path,
+            max_size=int(os.getenv("DB_POOL_SIZE", "8")),
+            pragmas={
+                "journal_mode": "WAL",
+                "synchronous": os.getenv("DB_SYNCHRONOUS", "FULL"),
+                "cache_size": -16000,
+                "mmap_size": 268435456,
+                "busy_timeout": 5000
+            }
+        )
+        # Shared per-user reads (see ReadCoalescer); DB_READ_CACHE_TTL=0 keeps single-flight only
+        self.reads = ReadCoalescer(
+            enabled=os.getenv("DB_SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes"),
+            ttl=float(os.getenv("DB_READ_CACHE_TTL", "0"))
+        )
+
+    def initialize(self):
+        """Create the schema, apply migrations and add the demo data, once"""
+        if self.initialized:
+            return
         self.init_database()
-        self.populate_demo_data()
+        self.run_migrations()
+        if self.demo_data:
+            self.populate_demo_data()
+        self.initialized = True
+
+    async def initialize_async(self):
+        """initialize() on a worker thread so the event loop keeps serving;
+        concurrent callers wait for the same run"""
+        if self.initialized:
+            return
+        if self._initializing is None or self._initializing.done():
+            self._initializing = asyncio.ensure_future(asyncio.to_thread(self.initialize))
+        await asyncio.shield(self._initializing)
 
     def init_database(self):
         """Initialize database with all required tables"""
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Users table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id TEXT PRIMARY KEY,
-            full_name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            phone TEXT,
-            monthly_income REAL,
-            employment_status TEXT,
-            credit_score INTEGER DEFAULT 790,
-            date_of_birth TEXT DEFAULT '1990-01-01',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
-
-        # Accounts table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS accounts (
-            account_id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            account_number TEXT UNIQUE NOT NULL,
-            account_type TEXT NOT NULL,
-            balance REAL DEFAULT 0.0,
-            status TEXT DEFAULT 'active',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-        """)
-
-        # Cards table with additional blocking fields
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS cards (
-            card_id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            account_id TEXT NOT NULL,
-            card_number TEXT UNIQUE NOT NULL,
-            card_type TEXT NOT NULL,
-            card_status TEXT DEFAULT 'active',
-            credit_limit REAL DEFAULT 0,
-            available_credit REAL DEFAULT 0,
-            blocked_at TEXT,
-            block_reason TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id),
-            FOREIGN KEY (account_id) REFERENCES accounts (account_id)
-        )
-        """)
-
-        # Transactions table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS transactions (
-            transaction_id TEXT PRIMARY KEY,
-            account_id TEXT NOT NULL,
-            transaction_type TEXT NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT,
-            merchant_name TEXT,
-            transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            status TEXT DEFAULT 'completed',
-            FOREIGN KEY (account_id) REFERENCES accounts (account_id)
-        )
-        """)
+        try:
+            create_tables(conn)
+        finally:
+            conn.close()
+        print("Database initialized successfully")
 
-        # Loan applications table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS loan_applications (
-            application_id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            loan_type TEXT NOT NULL,
-            loan_amount REAL NOT NULL,
-            loan_purpose TEXT,
-            application_status TEXT DEFAULT 'pending',
-            interest_rate REAL,
-            loan_term_months INTEGER,
-            monthly_payment REAL,
-            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-        """)
+    def run_migrations(self):
+        """Apply schema migrations newer than the database's user_version"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            apply_migrations(conn)
+        finally:
+            conn.close()
 
-        # Bill payments table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS bill_payments (
-            payment_id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            bill_type TEXT NOT NULL,
-            amount REAL NOT NULL,
-            due_date DATE,
-            payment_date TIMESTAMP,
-            status TEXT DEFAULT 'pending',
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-        """)
+    def explain_service_queries(self) -> Dict[str, Dict[str, Any]]:
+        """Run EXPLAIN QUERY PLAN on each hot service query.
 
-        conn.commit()
-        conn.close()
-        print("Database initialized successfully")
+        A query fails the check when SQLite would scan a table or sort the
+        result in a temporary B-tree instead of walking an index.
+        """
+        self.initialize()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            results = {}
+            for name, query in SERVICE_QUERIES.items():
+                params = ("",) * query.count("?")
+                plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+                problems = [
+                    step for step in plan
+                    if (step.startswith("SCAN") and step != "SCAN CONSTANT ROW") or "TEMP B-TREE" in step
+                ]
+                results[name] = {"plan": plan, "ok": not problems, "problems": problems}
+            return results
+        finally:
+            conn.close()
 
     def populate_demo_data(self):
         """Populate database with single demo user data"""
@@ -170,11 +443,10 @@ class DatabaseManager:
             ("txn_005", "acc_002", "credit", 500.00, "Transfer from Checking", "Internal Transfer", "2024-01-10 16:45:00"),
         ]
 
-        for txn in transactions_data:
-            cursor.execute("""
-            INSERT INTO transactions (transaction_id, account_id, transaction_type, amount, description, merchant_name, transaction_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, txn)
+        cursor.executemany("""
+        INSERT INTO transactions (transaction_id, account_id, transaction_type, amount, description, merchant_name, transaction_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, transactions_data)
 
         # Insert demo loan applications
         cursor.execute("""
@@ -188,46 +460,61 @@ class DatabaseManager:
 
     @asynccontextmanager
     async def get_connection(self):
-        """Get async database connection with proper error handling"""
-        conn = None
+        """Check out a pooled connection with proper error handling"""
+        if not self.initialized:
+            await self.initialize_async()
+        waited = time.perf_counter()
+        conn = await self.pool.acquire()
+        acquired = time.perf_counter()
+        DB_CONNECTION_WAIT.observe(acquired - waited, *turn_labels.get())
+        discard = False
         try:
-            conn = await aiosqlite.connect(self.db_path)
-            conn.row_factory = aiosqlite.Row
-            yield conn
+            # Records a span per statement while the current turn is traced
+            yield traced_connection(conn)
         except Exception as e:
-            if conn:
-                try:
-                    await conn.rollback()
-                except:
-                    pass
+            try:
+                await conn.rollback()
+            except:
+                discard = True
             raise e
         finally:
-            if conn:
-                await conn.close()
+            await self.pool.release(conn, discard=discard)
+            DB_CONNECTION_HOLD.observe(time.perf_counter() - acquired)
+
+    async def close(self):
+        """Close pooled connections on shutdown"""
+        await self.pool.close()
 
 class UserService:
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
 
     async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.reads.get("get_user", user_id, lambda: self._fetch_user(user_id))
+
+    async def _fetch_user(self, user_id: str) -> Optional[Dict[str, Any]]:
         async with self.db.get_connection() as conn:
-            cursor = await conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+            cursor = await conn.execute(USER_QUERY, (user_id,))
             row = await cursor.fetchone()
             return dict(row) if row else None
 
+    async def get_data_version(self, user_id: str) -> int:
+        """Version bumped by every write to the user's cards, loans, accounts or transactions"""
+        async with self.db.get_connection() as conn:
+            cursor = await conn.execute(DATA_VERSION_QUERY, (user_id,))
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+
 class CardService:
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
 
     async def get_user_cards(self, user_id: str) -> List[Dict[str, Any]]:
+        return await self.db.reads.get("get_user_cards", user_id, lambda: self._fetch_user_cards(user_id))
+
+    async def _fetch_user_cards(self, user_id: str) -> List[Dict[str, Any]]:
         async with self.db.get_connection() as conn:
-            cursor = await conn.execute("""
-            SELECT c.*, a.account_number
-            FROM cards c
-            JOIN accounts a ON c.account_id = a.account_id
-            WHERE c.user_id = ?
-            ORDER BY c.created_at DESC
-            """, (user_id,))
+            cursor = await conn.execute(USER_CARDS_QUERY, (user_id,))
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
@@ -235,16 +522,13 @@ class CardService:
         """Block a card with guaranteed database persistence"""
         try:
             async with self.db.get_connection() as conn:
-                # Enable WAL mode for better concurrency
-                await conn.execute("PRAGMA journal_mode=WAL")
-                
                 # Start immediate transaction
                 await conn.execute("BEGIN IMMEDIATE")
                 
                 try:
                     # First verify card exists and get current status
                     cursor = await conn.execute(
-                        "SELECT card_id, card_status, card_number FROM cards WHERE card_id = ?", 
+                        "SELECT card_id, card_status, card_number, user_id FROM cards WHERE card_id = ?", 
                         (card_id,)
                     )
                     result = await cursor.fetchone()
@@ -255,6 +539,7 @@ class CardService:
                     
                     current_status = result[1]
                     card_number = result[2]
+                    user_id = result[3]
                     
                     if current_status == 'blocked':
                         await conn.execute("ROLLBACK")
@@ -282,9 +567,13 @@ class CardService:
                         await conn.execute("ROLLBACK")
                         return {"success": False, "error": "Failed to update card status in database"}
                     
-                    # Force commit and sync to disk
+                    await bump_data_version(conn, user_id)
+
+                    # Commit (pooled connections run WAL with synchronous=FULL)
                     await conn.execute("COMMIT")
-                    await conn.execute("PRAGMA synchronous=FULL")
+                    self.db.reads.invalidate(user_id)
+                    event_bus.publish(CARD_BLOCKED, user_id, card_id=card_id, card_last4=card_last4(card_number),
+                                      blocked_at=timestamp)
                     
                     # Double-check with fresh query
                     cursor = await conn.execute(
@@ -321,12 +610,16 @@ class CardService:
             INSERT INTO cards (card_id, user_id, account_id, card_number, card_type, credit_limit, available_credit)
             VALUES (?, ?, ?, ?, ?, ?, ?)
             """, (card_id, user_id, account_id, card_number, card_type, credit_limit, credit_limit))
+            await bump_data_version(conn, user_id)
             await conn.commit()
-            return card_id
+        self.db.reads.invalidate(user_id)
+        event_bus.publish(CARD_CREATED, user_id, card_id=card_id, card_type=card_type,
+                          card_last4=card_last4(card_number))
+        return card_id
 
     async def get_card_by_id(self, card_id: str, user_id: str) -> Optional[Dict[str, Any]]:
         async with self.db.get_connection() as conn:
-            cursor = await conn.execute("SELECT * FROM cards WHERE card_id = ? AND user_id = ?", (card_id, user_id))
+            cursor = await conn.execute(CARD_BY_ID_QUERY, (card_id, user_id))
             row = await cursor.fetchone()
             return dict(row) if row else None
 
@@ -343,16 +636,19 @@ class LoanService:
             VALUES (?, ?, ?, ?, ?, ?)
             """, (app_id, application_data["user_id"], application_data["loan_type"],
                   application_data["loan_amount"], application_data["loan_purpose"], "pending"))
+            await bump_data_version(conn, application_data["user_id"])
             await conn.commit()
-            return app_id
+        self.db.reads.invalidate(application_data["user_id"])
+        event_bus.publish(LOAN_APPLICATION_CREATED, application_data["user_id"], application_id=app_id,
+                          loan_type=application_data["loan_type"], loan_amount=application_data["loan_amount"])
+        return app_id
 
     async def get_user_loan_applications(self, user_id: str) -> List[Dict[str, Any]]:
+        return await self.db.reads.get("get_user_loan_applications", user_id, lambda: self._fetch_user_loan_applications(user_id))
+
+    async def _fetch_user_loan_applications(self, user_id: str) -> List[Dict[str, Any]]:
         async with self.db.get_connection() as conn:
-            cursor = await conn.execute("""
-            SELECT * FROM loan_applications
-            WHERE user_id = ?
-            ORDER BY applied_at DESC
-            """, (user_id,))
+            cursor = await conn.execute(USER_LOANS_QUERY, (user_id,))
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
@@ -371,7 +667,13 @@ class LoanService:
                 SET application_status = ?, interest_rate = ?, loan_term_months = ?, monthly_payment = ?
                 WHERE application_id = ?
                 """, (status, interest_rate, term_months, monthly_payment, app_id))
+                user_id = await self._bump_applicant_data_version(conn, app_id)
                 await conn.commit()
+            if user_id:
+                self.db.reads.invalidate(user_id)
+                event_bus.publish(LOAN_DECISION, user_id, application_id=app_id, status=status,
+                                  interest_rate=interest_rate, term_months=term_months,
+                                  monthly_payment=round(monthly_payment, 2))
                 
             return {
                 "status": status,
@@ -387,34 +689,171 @@ class LoanService:
                 SET application_status = 'declined'
                 WHERE application_id = ?
                 """, (app_id,))
+                user_id = await self._bump_applicant_data_version(conn, app_id)
                 await conn.commit()
+            if user_id:
+                self.db.reads.invalidate(user_id)
+                event_bus.publish(LOAN_DECISION, user_id, application_id=app_id, status="declined")
                 
             return {"status": "declined", "reason": "High debt-to-income ratio"}
 
+    async def _bump_applicant_data_version(self, conn: aiosqlite.Connection, app_id: str) -> Optional[str]:
+        """Bump the applicant's data version and return their user_id"""
+        cursor = await conn.execute("SELECT user_id FROM loan_applications WHERE application_id = ?", (app_id,))
+        row = await cursor.fetchone()
+        if row:
+            await bump_data_version(conn, row[0])
+            return row[0]
+        return None
+
 class AccountService:
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
 
     async def get_user_accounts(self, user_id: str) -> List[Dict[str, Any]]:
+        return await self.db.reads.get("get_user_accounts", user_id, lambda: self._fetch_user_accounts(user_id))
+
+    async def _fetch_user_accounts(self, user_id: str) -> List[Dict[str, Any]]:
         async with self.db.get_connection() as conn:
-            cursor = await conn.execute("SELECT * FROM accounts WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
+            cursor = await conn.execute(USER_ACCOUNTS_QUERY, (user_id,))
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
     async def get_account_transactions(self, account_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         async with self.db.get_connection() as conn:
-            cursor = await conn.execute("""
-            SELECT * FROM transactions
-            WHERE account_id = ?
-            ORDER BY transaction_date DESC
-            LIMIT ?
-            """, (account_id, limit))
+            cursor = await conn.execute(ACCOUNT_TRANSACTIONS_QUERY, (account_id, limit))
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
-# Initialize services
-db_manager = DatabaseManager()
+    async def get_transactions_page(self, user_id: str, limit: int = 10, cursor: Optional[str] = None,
+                                    start_date: Optional[str] = None, end_date: Optional[str] = None,
+                                    transaction_type: Optional[str] = None,
+                                    merchant: Optional[str] = None) -> Dict[str, Any]:
+        """One page of the user's transactions across all accounts, newest first.
+
+        start_date is inclusive and end_date exclusive (YYYY-MM-DD). The
+        returned next_cursor resumes after the last row with the same filters;
+        when a cursor is passed, the filters stored in it are used. Each page
+        costs one index seek of at most limit + 1 rows per account, however
+        deep it is.
+        """
+        if cursor:
+            decoded = decode_transaction_cursor(cursor)
+            filters = decoded["filters"]
+            upper = tuple(decoded["position"])
+        else:
+            filters = {key: value for key, value in (
+                ("start_date", start_date), ("end_date", end_date),
+                ("transaction_type", transaction_type), ("merchant", merchant)
+            ) if value}
+            upper = (filters["end_date"], "") if "end_date" in filters else _LATEST_KEY
+
+        accounts = await self.get_user_accounts(user_id)
+        account_numbers = {account["account_id"]: account["account_number"] for account in accounts}
+        kind = filters.get("transaction_type")
+        merchant_prefix = " ".join(filters.get("merchant", "").lower().split())
+        bounds = (upper[0], upper[1], filters.get("start_date", ""))
+        per_account = []
+        async with self.db.get_connection() as conn:
+            for account_id in account_numbers:
+                if merchant_prefix:
+                    query, params = TRANSACTIONS_PAGE_BY_MERCHANT_QUERY, (
+                        account_id, merchant_prefix.split()[0], merchant_prefix, *bounds, kind, kind, limit + 1
+                    )
+                elif kind:
+                    query, params = TRANSACTIONS_PAGE_BY_TYPE_QUERY, (account_id, kind, *bounds, limit + 1)
+                else:
+                    query, params = TRANSACTIONS_PAGE_QUERY, (account_id, *bounds, limit + 1)
+                rows = await conn.execute_fetchall(query, params)
+                per_account.append([dict(row) for row in rows])
+
+        # Each list is already ordered, so a k-way merge yields the page
+        merged = heapq.merge(*per_account, key=lambda row: (row["transaction_date"], row["transaction_id"]),
+                             reverse=True)
+        page = [row for _, row in zip(range(limit + 1), merged)]
+        has_more = len(page) > limit
+        page = page[:limit]
+        for row in page:
+            row["account_number"] = account_numbers[row["account_id"]]
+
+        next_cursor = None
+        if has_more:
+            last = page[-1]
+            next_cursor = encode_transaction_cursor(last["transaction_date"], last["transaction_id"], filters)
+        return {"transactions": page, "next_cursor": next_cursor, "filters": filters}
+
+class SpendingService:
+    def __init__(self, db_manager: DatabaseManager):
+        self.db = db_manager
+
+    async def get_spending_summary(self, user_id: str, start_date: Optional[str] = None,
+                                   end_date: Optional[str] = None, transaction_type: str = "debit",
+                                   category: Optional[str] = None,
+                                   merchant: Optional[str] = None) -> Dict[str, Any]:
+        """Exact totals and averages of the user's transactions over a date
+        range, read from the daily rollups.
+
+        start_date is inclusive and end_date exclusive (YYYY-MM-DD); an open
+        range spans the days that have matching transactions. Breakdowns by
+        category, merchant and account are sorted by total, largest first.
+        """
+        async with self.db.get_connection() as conn:
+            rows = await conn.execute_fetchall(SPENDING_ROLLUP_QUERY, (
+                user_id, start_date or "", end_date or _LATEST_KEY[0], transaction_type,
+                category, category, merchant, merchant
+            ))
+
+        total, count = 0.0, 0
+        first_day, last_day = None, None
+        by_category: Dict[str, List[float]] = {}
+        by_merchant: Dict[str, List[float]] = {}
+        by_account: Dict[str, List[float]] = {}
+        for row in rows:
+            total += row["total_amount"]
+            count += row["transaction_count"]
+            first_day = min(first_day or row["first_day"], row["first_day"])
+            last_day = max(last_day or row["last_day"], row["last_day"])
+            for breakdown, key in ((by_category, row["category"]), (by_merchant, row["merchant_name"]),
+                                   (by_account, row["account_number"])):
+                entry = breakdown.setdefault(key, [0.0, 0])
+                entry[0] += row["total_amount"]
+                entry[1] += row["transaction_count"]
+
+        range_start = start_date or first_day
+        range_end = end_date or (last_day and (datetime.fromisoformat(last_day) + timedelta(days=1)).date().isoformat())
+        days = (datetime.fromisoformat(range_end) - datetime.fromisoformat(range_start)).days if count else 0
+
+        def ranked(breakdown: Dict[str, List[float]], name: str) -> List[Dict[str, Any]]:
+            return [{name: key, "total": round(amount, 2), "transaction_count": entries}
+                    for key, (amount, entries) in sorted(breakdown.items(), key=lambda item: -item[1][0])]
+
+        return {
+            "transaction_type": transaction_type,
+            "start_date": range_start,
+            "end_date": range_end,
+            "category": category,
+            "merchant": merchant,
+            "total": round(total, 2),
+            "transaction_count": count,
+            "average_per_transaction": round(total / count, 2) if count else 0.0,
+            "days": days,
+            "average_per_day": round(total / days, 2) if days else 0.0,
+            "by_category": ranked(by_category, "category"),
+            "by_merchant": ranked(by_merchant, "merchant_name"),
+            "by_account": ranked(by_account, "account_number"),
+        }
+
+    async def rebuild_rollups(self):
+        """Recompute every rollup from the transactions table"""
+        async with self.db.get_connection() as conn:
+            for statement in ROLLUP_REBUILD_STATEMENTS:
+                await conn.execute(statement)
+            await conn.commit()
+
+# Initialize services; the database file is created on first use, not on import
+db_manager = DatabaseManager(os.getenv("DB_PATH", "banking_system.db"), lazy=True)
 user_service = UserService(db_manager)
 card_service = CardService(db_manager)
 loan_service = LoanService(db_manager)
 account_service = AccountService(db_manager)
+spending_service = SpendingService(db_manager)
@@ -0,0 +1,85 @@
+"""In-process publish/subscribe for banking events.
+
+Write paths publish after their transaction commits, e.g.
+event_bus.publish("card_blocked", user_id, card_last4="7890"). Subscribers are
+called inline, so they should only hand the event off (main.py queues it on
+the user's WebSocket connections); coroutine subscribers run as tasks.
+"""
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+CARD_BLOCKED = "card_blocked"
+CARD_CREATED = "card_created"
+LOAN_APPLICATION_CREATED = "loan_application_created"
+LOAN_DECISION = "loan_decision"
+
+
+@dataclass
+class Event:
+    type: str
+    user_id: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"event": self.type, "user_id": self.user_id, "data": self.data, "timestamp": self.timestamp}
+
+
+class EventBus:
+    """Subscribers per event type ("*" receives every event)"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callable[[Event], Any]]] = {}
+        self._tasks = set()
+        self.published = 0
+        self.errors = 0
+
+    def subscribe(self, handler: Callable[[Event], Any], event_types: Tuple[str, ...] = ("*",)) -> Callable[[], None]:
+        """Register handler; returns a function that unsubscribes it"""
+        for event_type in event_types:
+            self._subscribers.setdefault(event_type, []).append(handler)
+
+        def unsubscribe():
+            for event_type in event_types:
+                handlers = self._subscribers.get(event_type, [])
+                if handler in handlers:
+                    handlers.remove(handler)
+        return unsubscribe
+
+    def publish(self, event_type: str, user_id: str, **data: Any) -> Event:
+        event = Event(event_type, user_id, data)
+        self.published += 1
+        for handler in (*self._subscribers.get(event_type, ()), *self._subscribers.get("*", ())):
+            try:
+                result = handler(event)
+                if asyncio.iscoroutine(result):
+                    task = asyncio.ensure_future(result)
+                    # Keep a reference until it finishes
+                    self._tasks.add(task)
+                    task.add_done_callback(self._task_done)
+            except Exception as e:
+                self.errors += 1
+                print(f"Event Handler Error ({event_type}): {e}")
+        return event
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+            print(f"Event Handler Error: {task.exception()}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "published": self.published,
+            "errors": self.errors,
+            "subscribers": {event_type: len(handlers) for event_type, handlers in self._subscribers.items() if handlers}
+        }
+
+
+event_bus = EventBus()
+
+
+def card_last4(card_number: Optional[str]) -> str:
+    return str(card_number or "").replace("-", "")[-4:]
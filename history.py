@@ -0,0 +1,169 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from cache import LRUCache
+from models import ConversationContext
+from prompts import count_tokens
+from resilience import CircuitOpenError
+
+# (previous summary, messages to fold in) -> new summary
+Summarizer = Callable[[str, List[Dict[str, Any]]], Awaitable[str]]
+
+
+def format_entry(entry: Dict[str, Any]) -> str:
+    return f"{entry['role']}: {entry['message']}"
+
+
+class ConversationHistory:
+    """Bounded per-session history: a window of recent messages plus a rolling summary.
+
+    ``conversation_history`` works as a ring buffer holding the last ``window``
+    messages. Messages pushed out of it wait in ``unsummarized_history`` until a
+    background task folds them into ``history_summary``. The task runs after
+    the turn is saved and its result is applied at the start of the session's
+    next turn, so the context is only ever mutated by turns. If the queue of
+    pending messages outgrows ``max_pending`` (e.g. the summarizer is down), the
+    oldest messages are folded in with a cheap extractive summary instead.
+    """
+
+    def __init__(self, window: int = 8, max_pending: int = 16, summary_max_tokens: int = 200,
+                 summarizer: Optional[Summarizer] = None):
+        self.window = window
+        self.max_pending = max_pending
+        self.summary_max_tokens = summary_max_tokens
+        self.summarizer = summarizer
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # session_id -> (previous summary, messages covered, last covered timestamp, new summary)
+        self._ready = LRUCache(capacity=10000)
+        self.summaries = 0
+        self.extractive_folds = 0
+
+    def append(self, context: ConversationContext, role: str, message: str):
+        context.conversation_history.append({
+            "role": role,
+            "message": message,
+            "timestamp": datetime.now().isoformat()
+        })
+        overflow = len(context.conversation_history) - self.window
+        if overflow > 0:
+            context.unsummarized_history.extend(context.conversation_history[:overflow])
+            del context.conversation_history[:overflow]
+
+        overflow = len(context.unsummarized_history) - self.max_pending
+        if overflow > 0:
+            folded = context.unsummarized_history[:overflow]
+            del context.unsummarized_history[:overflow]
+            context.history_summary = self._extractive_summary(context.history_summary, folded)
+            context.summarized_messages += len(folded)
+            self.extractive_folds += 1
+
+    def message_count(self, context: ConversationContext) -> int:
+        return context.summarized_messages + len(context.unsummarized_history) + len(context.conversation_history)
+
+    def prompt_view(self, context: ConversationContext, max_tokens: int = 300,
+                    max_messages: Optional[int] = None) -> str:
+        """Most recent messages (newest first) that fit in max_tokens, preceded
+        by the rolling summary when there is room left for it"""
+        entries = context.conversation_history
+        if max_messages is not None:
+            entries = entries[-max_messages:] if max_messages > 0 else []
+
+        lines: List[str] = []
+        remaining = max_tokens
+        for entry in reversed(entries):
+            line = format_entry(entry)
+            cost = count_tokens(line) + 1
+            if cost > remaining:
+                if not lines and remaining > 1:
+                    # Always keep (the tail of) the latest message
+                    lines.append(line[-(remaining - 1) * 4:])
+                break
+            lines.append(line)
+            remaining -= cost
+        lines.reverse()
+
+        if context.history_summary:
+            summary = f"Earlier in this conversation: {context.history_summary}"
+            if count_tokens(summary) + 1 <= remaining:
+                lines.insert(0, summary)
+        return "\n".join(lines)
+
+    def apply_ready_summary(self, context: ConversationContext) -> bool:
+        """Install a finished background summary if the context still matches it"""
+        ready = self._ready.pop(context.session_id)
+        if ready is None:
+            return False
+        previous, covered, last_timestamp, summary = ready
+        pending = context.unsummarized_history
+        if (context.history_summary != previous or len(pending) < covered
+                or pending[covered - 1]["timestamp"] != last_timestamp):
+            return False
+        context.history_summary = summary
+        del pending[:covered]
+        context.summarized_messages += covered
+        return True
+
+    def schedule_summary(self, context: ConversationContext):
+        """Summarize pending messages in the background, off the request path"""
+        session_id = context.session_id
+        if not self.summarizer or not context.unsummarized_history or session_id in self._tasks:
+            return
+        previous = context.history_summary
+        entries = list(context.unsummarized_history)
+        task = asyncio.create_task(self._summarize(session_id, previous, entries))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+
+    async def _summarize(self, session_id: str, previous: str, entries: List[Dict[str, Any]]):
+        try:
+            summary = (await self.summarizer(previous, entries)).strip()
+        except (CircuitOpenError, asyncio.TimeoutError):
+            # Retried after the next turn; the local fallback bounds the backlog
+            return
+        except Exception as e:
+            print(f"History Summary Error: {type(e).__name__}: {e}")
+            return
+        if not summary:
+            return
+        self._ready.set(session_id, (previous, len(entries), entries[-1]["timestamp"],
+                                     self._truncate(summary)))
+        self.summaries += 1
+
+    def _extractive_summary(self, previous: str, entries: List[Dict[str, Any]]) -> str:
+        parts = [previous] if previous else []
+        parts.extend(f"{entry['role']} said: {entry['message'][:80]}." for entry in entries)
+        return self._truncate(" ".join(parts), keep_end=True)
+
+    def _truncate(self, summary: str, keep_end: bool = False) -> str:
+        limit = self.summary_max_tokens * 4
+        if len(summary) <= limit:
+            return summary
+        if keep_end:
+            return "..." + summary[-limit:].split(" ", 1)[-1]
+        return summary[:limit].rsplit(" ", 1)[0] + "..."
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window": self.window,
+            "summaries": self.summaries,
+            "extractive_folds": self.extractive_folds,
+            "in_flight": len(self._tasks)
+        }
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def create_conversation_history(summarizer: Optional[Summarizer] = None) -> ConversationHistory:
+    """Build the history manager configured by the HISTORY_* environment variables"""
+    return ConversationHistory(
+        window=int(os.getenv("HISTORY_WINDOW", "8")),
+        max_pending=int(os.getenv("HISTORY_MAX_PENDING", "16")),
+        summary_max_tokens=int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "200")),
+        summarizer=summarizer
+    )
@@ -0,0 +1,404 @@
+import calendar
+import json
+import math
+import os
+import re
+import zlib
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from models import ConversationContext, ConversationState, Intent
+
+# Keyword tables for the pattern-based fallback. Matching is plain substring
+# matching on the lowercased message, so "hi" also matches inside "this".
+KEYWORD_GROUPS: Dict[str, List[str]] = {
+    "block": ["block", "freeze", "stop", "lost", "stolen"],
+    "card": ["card"],
+    "card_application": ["apply for card", "new card", "create card", "get a card"],
+    "loan_inquiry": ["my loans", "loan status", "loan applications", "check loan"],
+    "loan_application": ["loan", "borrow", "apply"],
+    "balance": ["balance", "money", "amount"],
+    "transaction": ["transaction", "history", "statement"],
+    "greeting": ["hello", "hi", "hey", "good morning"],
+}
+
+# Checked in order; the first rule whose groups all matched wins
+INTENT_RULES: List[Tuple[Intent, Tuple[str, ...]]] = [
+    (Intent.CARD_BLOCKING, ("block", "card")),
+    (Intent.CARD_APPLICATION, ("card_application",)),
+    (Intent.LOAN_INQUIRY, ("loan_inquiry",)),
+    (Intent.LOAN_APPLICATION, ("loan_application",)),
+    (Intent.BALANCE_INQUIRY, ("balance",)),
+    (Intent.TRANSACTION_HISTORY, ("transaction",)),
+    (Intent.CARD_INQUIRY, ("card",)),
+    (Intent.GREETING, ("greeting",)),
+]
+
+AMOUNT_PATTERN = re.compile(r"\$?(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)")
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Regex alternation shaped like a trie so that, at any position, the
+    longest keyword starting there is the one captured"""
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A word may end here; the optional (greedy) tail still prefers longer words
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+# "Show me more" style follow-ups that continue the previous result list
+CONTINUATION_PATTERN = re.compile(
+    r"\b(?:(?:show|see|load|view|give)(?: me)? (?:some )?more|more (?:transactions|results|please)|"
+    r"next (?:page|ones|transactions)|older (?:ones|transactions)|keep going|continue)\b",
+    re.IGNORECASE
+)
+
+DEBIT_PATTERN = re.compile(r"\b(?:debits?|withdrawals?|purchases?|spending|spent|payments?|charges?)\b")
+# "credit card" names a card, not a credit transaction
+CREDIT_PATTERN = re.compile(r"\b(?:credits?(?! card)|deposits?|income|refunds?|received)\b")
+MERCHANT_PATTERN = re.compile(
+    r"\b(?:at|from)\s+(?!the last\b|last\b|this\b|\d)([a-z0-9&'.\- ]+?)"
+    r"(?=\s+(?:in|on|since|from|between|during|before|after|last|this|over)\b|[?!,]|\.?$)"
+)
+ISO_DATE_PATTERN = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+MONTH_PATTERN = re.compile(
+    r"\b(?:in|during|for)\s+(" + "|".join(name.lower() for name in calendar.month_name[1:]) + r")(?:\s+(\d{4}))?\b"
+)
+LAST_DAYS_PATTERN = re.compile(r"\b(?:last|past)\s+(\d+)\s+days?\b")
+
+# Words users name spending categories by, per category of the transaction
+# rollups (see SPENDING_CATEGORY_KEYWORDS in schema.py)
+SPENDING_CATEGORY_WORDS: Dict[str, Tuple[str, ...]] = {
+    "groceries": ("groceries", "grocery", "supermarket", "supermarkets", "food shopping"),
+    "fuel": ("fuel", "gas", "petrol", "gas station", "gas stations"),
+    "housing": ("rent", "housing", "mortgage"),
+    "dining": ("dining", "eating out", "restaurants", "restaurant", "coffee", "takeout"),
+    "utilities": ("utilities", "utility bills", "electricity", "internet", "phone bill"),
+    "shopping": ("shopping", "online shopping", "retail"),
+    "entertainment": ("entertainment", "subscriptions", "streaming", "movies"),
+    "travel": ("travel", "taxis", "taxi", "rides", "hotels", "flights"),
+    "transfers": ("transfers", "transfer"),
+    "income": ("income", "salary", "paycheck", "wages"),
+}
+_CATEGORY_BY_WORD = {word: category for category, words in SPENDING_CATEGORY_WORDS.items() for word in words}
+SPENDING_CATEGORY_PATTERN = re.compile(r"\b(" + _trie_pattern(_CATEGORY_BY_WORD) + r")\b")
+
+
+def _month_range(year: int, month: int) -> tuple:
+    start = date(year, month, 1)
+    end = date(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+
+def extract_transaction_filters(message: str, today: date = None) -> Dict[str, str]:
+    """Date range (start inclusive, end exclusive), transaction type and
+    merchant filters mentioned in a transaction history request"""
+    today = today or date.today()
+    text = message.lower()
+    filters: Dict[str, str] = {}
+
+    debit, credit = DEBIT_PATTERN.search(text), CREDIT_PATTERN.search(text)
+    if debit and not credit:
+        filters["transaction_type"] = "debit"
+    elif credit and not debit:
+        filters["transaction_type"] = "credit"
+
+    start = end = None
+    iso_dates = [date(int(y), int(m), int(d)) for y, m, d in ISO_DATE_PATTERN.findall(text)]
+    month = MONTH_PATTERN.search(text)
+    last_days = LAST_DAYS_PATTERN.search(text)
+    if len(iso_dates) >= 2:
+        start, end = min(iso_dates), max(iso_dates) + timedelta(days=1)
+    elif iso_dates:
+        if re.search(r"\b(?:before|until)\b", text):
+            end = iso_dates[0]
+        elif re.search(r"\b(?:since|after|from)\b", text):
+            start = iso_dates[0]
+        else:
+            start, end = iso_dates[0], iso_dates[0] + timedelta(days=1)
+    elif month:
+        month_number = list(calendar.month_name).index(month.group(1).capitalize())
+        # Without a year, the most recent such month
+        year = int(month.group(2)) if month.group(2) else today.year - (month_number > today.month)
+        start, end = _month_range(year, month_number)
+    elif last_days:
+        start, end = today - timedelta(days=int(last_days.group(1))), today + timedelta(days=1)
+    elif "today" in text:
+        start, end = today, today + timedelta(days=1)
+    elif "yesterday" in text:
+        start, end = today - timedelta(days=1), today
+    elif re.search(r"\b(?:last|past) week\b", text):
+        start, end = today - timedelta(days=7), today + timedelta(days=1)
+    elif "this week" in text:
+        start, end = today - timedelta(days=today.weekday()), today + timedelta(days=1)
+    elif re.search(r"\b(?:last|past) month\b", text):
+        start, end = _month_range(today.year - (today.month == 1), (today.month - 2) % 12 + 1)
+    elif "this month" in text:
+        start, end = date(today.year, today.month, 1), today + timedelta(days=1)
+    elif re.search(r"\b(?:last|past) year\b", text):
+        start, end = date(today.year - 1, 1, 1), date(today.year, 1, 1)
+    elif "this year" in text:
+        start, end = date(today.year, 1, 1), today + timedelta(days=1)
+    if start:
+        filters["start_date"] = start.isoformat()
+    if end:
+        filters["end_date"] = end.isoformat()
+
+    merchant = MERCHANT_PATTERN.search(text)
+    if merchant and not ISO_DATE_PATTERN.match(merchant.group(1)):
+        filters["merchant"] = re.sub(r"^(?:the|a|an)\s+", "", merchant.group(1).strip(" ."))
+    return filters
+
+
+def extract_spending_category(message: str) -> Optional[str]:
+    """Rollup category named in a spending question, if any"""
+    match = SPENDING_CATEGORY_PATTERN.search(message.lower())
+    return _CATEGORY_BY_WORD[match.group(1)] if match else None
+
+
+class KeywordIntentClassifier:
+    """Fallback intent classifier compiled once into a single scanning regex.
+
+    The scan restarts one character after each match, so every position where
+    a keyword starts is found, and the trie-shaped pattern captures the longest
+    keyword there. Shorter keywords at the same position are its prefixes, so
+    each match expands to a precomputed bitmask
+    of all groups it implies, and the rules are resolved ahead of time into a
+    table indexed by that mask. The result is identical to testing every
+    keyword with ``in``.
+    """
+
+    def __init__(self, keyword_groups: Dict[str, List[str]] = KEYWORD_GROUPS,
+                 rules: List[Tuple[Intent, Tuple[str, ...]]] = INTENT_RULES):
+        group_bits = {group: 1 << index for index, group in enumerate(keyword_groups)}
+
+        keyword_masks: Dict[str, int] = {}
+        for group, keywords in keyword_groups.items():
+            for keyword in keywords:
+                keyword_masks[keyword] = keyword_masks.get(keyword, 0) | group_bits[group]
+
+        # A match on "loan status" also means "loan" (a prefix) is present
+        self._match_masks = {
+            keyword: self._prefix_mask(keyword, keyword_masks) for keyword in keyword_masks
+        }
+        rule_masks = [(intent, sum(group_bits[group] for group in groups)) for intent, groups in rules]
+        self._intent_by_mask = [
+            next((intent for intent, required in rule_masks if mask & required == required), Intent.GENERAL_INQUIRY)
+            for mask in range(1 << len(group_bits))
+        ]
+        self._scanner = re.compile(_trie_pattern(keyword_masks))
+
+    @staticmethod
+    def _prefix_mask(keyword: str, keyword_masks: Dict[str, int]) -> int:
+        mask = 0
+        for other, other_mask in keyword_masks.items():
+            if keyword.startswith(other):
+                mask |= other_mask
+        return mask
+
+    def _group_mask(self, text: str) -> int:
+        mask = 0
+        search = self._scanner.search
+        match_masks = self._match_masks
+        match = search(text)
+        while match:
+            mask |= match_masks[match.group()]
+            match = search(text, match.start() + 1)
+        return mask
+
+    def classify(self, message: str) -> Intent:
+        return self._intent_by_mask[self._group_mask(message.lower())]
+
+    def classify_batch(self, messages: Iterable[str]) -> List[Intent]:
+        """Classify a list of messages in one call"""
+        group_mask = self._group_mask
+        intent_by_mask = self._intent_by_mask
+        return [intent_by_mask[group_mask(message.lower())] for message in messages]
+
+    def extract_entities(self, message: str) -> Dict[str, str]:
+        entities = {}
+        amount_match = AMOUNT_PATTERN.search(message)
+        if amount_match:
+            entities["amount"] = amount_match.group(1).replace(",", "")
+
+        message_lower = message.lower()
+        if "debit" in message_lower:
+            entities["card_type"] = "debit"
+        elif "credit" in message_lower:
+            entities["card_type"] = "credit"
+        return entities
+
+
+# Built once at import
+keyword_classifier = KeywordIntentClassifier()
+
+
+# Labeled examples the local intent model is trained on at import
+INTENT_CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_corpus.jsonl")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def load_intent_corpus(path: str = INTENT_CORPUS_PATH) -> List[Tuple[str, Intent]]:
+    """Read (text, intent) pairs from a JSON-lines corpus"""
+    examples = []
+    with open(path, encoding="utf-8") as corpus:
+        for line in corpus:
+            if line.strip():
+                row = json.loads(line)
+                examples.append((row["text"], Intent(row["intent"])))
+    return examples
+
+
+class HashedNgramIntentModel:
+    """Softmax regression over hashed, TF-IDF weighted n-grams.
+
+    Features are word unigrams and bigrams plus character trigrams (which
+    absorb typos and inflections), hashed with crc32 into a fixed number of
+    buckets so every worker builds identical weights. Weights are kept only
+    for buckets seen in training, so a prediction is a few dozen dict lookups.
+    """
+
+    def __init__(self, buckets: int = 1 << 18, epochs: int = 12, learning_rate: float = 2.0):
+        self.buckets = buckets
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.intents: List[Intent] = []
+        self.idf: Dict[int, float] = {}
+        self.weights: Dict[int, List[float]] = {}
+        self.bias: List[float] = []
+
+    def _ngram_counts(self, message: str) -> Dict[int, int]:
+        words = TOKEN_PATTERN.findall(message.lower())
+        grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            grams.extend("#" + padded[i:i + 3] for i in range(len(padded) - 2))
+        counts: Dict[int, int] = {}
+        buckets = self.buckets
+        for gram in grams:
+            bucket = zlib.crc32(gram.encode()) % buckets
+            counts[bucket] = counts.get(bucket, 0) + 1
+        return counts
+
+    def features(self, message: str) -> Dict[int, float]:
+        """L2-normalised sublinear TF-IDF vector; unseen buckets are dropped"""
+        idf = self.idf
+        vector = {bucket: (1.0 + math.log(count)) * idf[bucket]
+                  for bucket, count in self._ngram_counts(message).items() if bucket in idf}
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        return {bucket: value / norm for bucket, value in vector.items()} if norm else {}
+
+    def fit(self, examples: List[Tuple[str, Intent]]) -> "HashedNgramIntentModel":
+        self.intents = sorted({intent for _, intent in examples}, key=lambda intent: intent.value)
+        label_index = {intent: index for index, intent in enumerate(self.intents)}
+        classes = len(self.intents)
+
+        document_counts: Dict[int, int] = {}
+        for text, _ in examples:
+            for bucket in self._ngram_counts(text):
+                document_counts[bucket] = document_counts.get(bucket, 0) + 1
+        self.idf = {bucket: math.log((1 + len(examples)) / (1 + count)) + 1.0
+                    for bucket, count in document_counts.items()}
+
+        vectors = [(self.features(text), label_index[intent]) for text, intent in examples]
+        self.weights = {bucket: [0.0] * classes for bucket in self.idf}
+        self.bias = [0.0] * classes
+        # Deterministic shuffle so the trained weights are reproducible
+        order = sorted(range(len(vectors)), key=lambda i: zlib.crc32(examples[i][0].encode()))
+        for epoch in range(self.epochs):
+            rate = self.learning_rate / (1 + epoch)
+            for i in order:
+                vector, label = vectors[i]
+                probabilities = self._probabilities(vector)
+                probabilities[label] -= 1.0
+                for bucket, value in vector.items():
+                    row = self.weights[bucket]
+                    for k in range(classes):
+                        row[k] -= rate * probabilities[k] * value
+                for k in range(classes):
+                    self.bias[k] -= rate * probabilities[k]
+        return self
+
+    def _probabilities(self, vector: Dict[int, float]) -> List[float]:
+        scores = list(self.bias)
+        weights = self.weights
+        for bucket, value in vector.items():
+            for k, weight in enumerate(weights[bucket]):
+                scores[k] += weight * value
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict(self, message: str) -> Tuple[Intent, float]:
+        """Most likely intent and its probability"""
+        probabilities = self._probabilities(self.features(message))
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        return self.intents[best], probabilities[best]
+
+
+class LocalIntentRouter:
+    """First-tier intent analysis that answers confident, idle-state turns
+    locally and returns None to escalate everything else to the LLM"""
+
+    def __init__(self, model: HashedNgramIntentModel, threshold: float = 0.8, enabled: bool = True):
+        self.model = model
+        self.threshold = threshold
+        self.enabled = enabled
+        self.routed = 0
+        self.escalated = 0
+
+    def route(self, message: str, context: ConversationContext) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        # Mid-workflow replies ("yes", "the one ending 7890") need the LLM's
+        # view of the conversation
+        if context.conversation_state not in (ConversationState.IDLE, ConversationState.COMPLETED):
+            self.escalated += 1
+            return None
+        intent, confidence = self.model.predict(message)
+        if confidence < self.threshold:
+            self.escalated += 1
+            return None
+
+        self.routed += 1
+        return {
+            "intent": intent,
+            "entities": keyword_classifier.extract_entities(message),
+            "context_switch": bool(context.current_intent and intent != context.current_intent),
+            "confidence": confidence,
+            "reasoning": "Local intent model"
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        decisions = self.routed + self.escalated
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "routed": self.routed,
+            "escalated": self.escalated,
+            "escalation_rate": round(self.escalated / decisions, 4) if decisions else 0.0
+        }
+
+
+def create_intent_router() -> LocalIntentRouter:
+    """Train the local model on the shipped corpus and wrap it in a router
+    configured by INTENT_ROUTER and INTENT_ROUTER_THRESHOLD"""
+    return LocalIntentRouter(
+        HashedNgramIntentModel().fit(load_intent_corpus()),
+        threshold=float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.8")),
+        enabled=os.getenv("INTENT_ROUTER", "true").lower() in ("1", "true", "yes")
+    )
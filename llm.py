@@ -0,0 +1,264 @@
+"""LLM providers and per-task model routing.
+
+Every chat completion goes through an LLMProvider. Each provider keeps its
+own pooled keep-alive HTTP connections:
+
+- groq: the Groq SDK (GROQ_API_KEY, GROQ_BASE_URL)
+- openai: any OpenAI-compatible /chat/completions endpoint over httpx
+  (OPENAI_BASE_URL, OPENAI_API_KEY)
+- llamacpp: a local llama.cpp server (LLAMA_CPP_URL), which also reuses the
+  KV cache of the shared prompt prefix between requests
+
+LLM_PROVIDER and LLM_MODEL set the default for every task. LLM_MODEL_ANALYSIS,
+LLM_MODEL_FUSED, LLM_MODEL_RESPONSE and LLM_MODEL_SUMMARY override one task,
+either with a model name or as "provider:model", e.g.
+LLM_MODEL_ANALYSIS=llamacpp:qwen2.5-1.5b-instruct.
+"""
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+# Tasks that call the LLM; the purpose label of _chat_completion
+TASKS = ("analysis", "fused", "response", "summary")
+
+DEFAULT_MODELS = {
+    "groq": "meta-llama/llama-4-maverick-17b-128e-instruct",
+    "openai": "gpt-4o-mini",
+    "llamacpp": "local",
+}
+
+# Status codes worth retrying on another attempt
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """An LLM endpoint answered with an error status or an unreadable body"""
+
+
+@dataclass
+class ChatCompletion:
+    content: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    model: str = ""
+
+
+@dataclass
+class ModelRoute:
+    provider: "LLMProvider"
+    model: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider.name}:{self.model}"
+
+
+def _pool_limits(max_connections: int, keepalive: float) -> httpx.Limits:
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                        keepalive_expiry=keepalive)
+
+
+class LLMProvider:
+    """A chat completions backend with its own connection pool"""
+
+    name = "base"
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], timeout: float,
+                       **params: Any) -> ChatCompletion:
+        raise NotImplementedError
+
+    def stream(self, model: str, messages: List[Dict[str, str]], timeout: float,
+               **params: Any) -> AsyncIterator[str]:
+        """Async iterator over the reply's content chunks"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class GroqProvider(LLMProvider):
+    name = "groq"
+
+    def __init__(self, timeout: float, max_retries: int, max_connections: int, keepalive: float):
+        from groq import AsyncGroq
+
+        self.client = AsyncGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            timeout=timeout,
+            max_retries=max_retries,
+            http_client=httpx.AsyncClient(limits=_pool_limits(max_connections, keepalive), timeout=timeout)
+        )
+
+    async def complete(self, model, messages, timeout, **params):
+        # The client enforces the deadline too, since it may retry through a cancellation
+        response = await self.client.chat.completions.create(model=model, messages=messages, timeout=timeout,
+                                                              **params)
+        usage = response.usage
+        return ChatCompletion(
+            content=response.choices[0].message.content or "",
+            prompt_tokens=(usage.prompt_tokens or 0) if usage else 0,
+            completion_tokens=(usage.completion_tokens or 0) if usage else 0,
+            model=response.model or model
+        )
+
+    async def stream(self, model, messages, timeout, **params):
+        stream = await self.client.chat.completions.create(model=model, messages=messages, stream=True,
+                                                            timeout=timeout, **params)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def close(self):
+        await self.client.close()
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Plain httpx client for any OpenAI-compatible chat completions API"""
+
+    name = "openai"
+
+    def __init__(self, base_url: str, api_key: Optional[str], timeout: float, max_retries: int,
+                 max_connections: int, keepalive: float):
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = httpx.AsyncClient(base_url=base_url.rstrip("/"), headers=headers, timeout=timeout,
+                                        limits=_pool_limits(max_connections, keepalive))
+        self.max_retries = max_retries
+
+    def _body(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> Dict[str, Any]:
+        return {"model": model, "messages": messages, **params}
+
+    async def _post(self, body: Dict[str, Any], timeout: float) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                response = await self.client.post("/chat/completions", json=body, timeout=timeout)
+            except httpx.TimeoutException:
+                # Retrying would overrun the caller's deadline
+                raise asyncio.TimeoutError(f"{self.name} request timed out")
+            except httpx.TransportError:
+                if last:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last:
+                    return response
+            await asyncio.sleep(0.25 * (attempt + 1))
+
+    async def complete(self, model, messages, timeout, **params):
+        response = await self._post(self._body(model, messages, params), timeout)
+        if response.status_code >= 400:
+            raise LLMError(f"{self.name} returned {response.status_code}: {response.text[:200]}")
+        try:
+            payload = response.json()
+            usage = payload.get("usage") or {}
+            return ChatCompletion(
+                content=payload["choices"][0]["message"].get("content") or "",
+                prompt_tokens=usage.get("prompt_tokens") or 0,
+                completion_tokens=usage.get("completion_tokens") or 0,
+                model=payload.get("model") or model
+            )
+        except (ValueError, KeyError, IndexError) as e:
+            raise LLMError(f"{self.name} returned an unreadable completion: {e}")
+
+    async def stream(self, model, messages, timeout, **params):
+        body = {**self._body(model, messages, params), "stream": True}
+        try:
+            async with self.client.stream("POST", "/chat/completions", json=body, timeout=timeout) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise LLMError(f"{self.name} returned {response.status_code}: {response.text[:200]}")
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or []
+                    content = choices[0].get("delta", {}).get("content") if choices else None
+                    if content:
+                        yield content
+        except httpx.TimeoutException:
+            raise asyncio.TimeoutError(f"{self.name} stream timed out")
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class LlamaCppProvider(OpenAICompatibleProvider):
+    """llama.cpp server (llama-server) on its OpenAI-compatible route"""
+
+    name = "llamacpp"
+
+    def _body(self, model, messages, params):
+        # Keep the static system prefix in the slot's KV cache between requests
+        return {"model": model, "messages": messages, "cache_prompt": True, **params}
+
+
+class LLMRouter:
+    """Providers by name, created on first use, and the model route per task"""
+
+    def __init__(self, timeout: float, max_retries: int, max_connections: int, keepalive: float):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.keepalive = keepalive
+        self.providers: Dict[str, LLMProvider] = {}
+        default_provider = os.getenv("LLM_PROVIDER", "groq").lower()
+        default_model = os.getenv("LLM_MODEL") or DEFAULT_MODELS.get(default_provider, "")
+        self.routes: Dict[str, ModelRoute] = {}
+        for task in TASKS:
+            provider, model = self._parse(os.getenv(f"LLM_MODEL_{task.upper()}", ""), default_provider)
+            if not model:
+                model = default_model if provider == default_provider else DEFAULT_MODELS.get(provider, "")
+            self.routes[task] = ModelRoute(self.provider(provider), model)
+
+    @staticmethod
+    def _parse(spec: str, default_provider: str):
+        name, sep, model = spec.partition(":")
+        if sep and name.lower() in DEFAULT_MODELS:
+            return name.lower(), model
+        return default_provider, spec
+
+    def provider(self, name: str) -> LLMProvider:
+        if name not in self.providers:
+            self.providers[name] = self._create(name)
+        return self.providers[name]
+
+    def _create(self, name: str) -> LLMProvider:
+        pool = (self.timeout, self.max_retries, self.max_connections, self.keepalive)
+        if name == "groq":
+            return GroqProvider(*pool)
+        if name == "openai":
+            return OpenAICompatibleProvider(os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                                            os.getenv("OPENAI_API_KEY"), *pool)
+        if name == "llamacpp":
+            # One connection per server slot (llama-server --parallel)
+            return LlamaCppProvider(os.getenv("LLAMA_CPP_URL", "http://127.0.0.1:8080/v1"), None,
+                                    self.timeout, self.max_retries,
+                                    int(os.getenv("LLAMA_CPP_PARALLEL", "4")), self.keepalive)
+        raise ValueError(f"Unknown LLM provider {name!r} (expected one of {', '.join(DEFAULT_MODELS)})")
+
+    def route(self, task: str) -> ModelRoute:
+        return self.routes.get(task) or self.routes["response"]
+
+    def describe(self) -> Dict[str, str]:
+        return {task: route.name for task, route in self.routes.items()}
+
+    async def close(self):
+        for provider in self.providers.values():
+            try:
+                await provider.close()
+            except Exception as e:
+                print(f"LLM Provider Close Error ({provider.name}): {e}")
+
+
+def create_llm_router(timeout: float, max_connections: int) -> LLMRouter:
+    return LLMRouter(
+        timeout=timeout,
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "1")),
+        max_connections=int(os.getenv("LLM_POOL_SIZE", str(max_connections))),
+        keepalive=float(os.getenv("LLM_KEEPALIVE_SECONDS", "30"))
+    )
@@ -0,0 +1,651 @@
+"""Load testing tools for the AI Banking Conversation System.
+
+Starts a local stand-in for the Groq chat completions API so the conversation
+stack can be driven offline without an API key:
+
+    python loadtest.py llm-throughput --latency 0.3 --sessions 1,4,16,64
+    python loadtest.py full-stack --clients 100 --transport mixed --duration 60
+    python loadtest.py llm-outage --fault hang --outage 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+
+class MockLLMServer:
+    """Minimal OpenAI/Groq-compatible chat completions server.
+
+    Every call waits ``latency`` seconds before the first token; streamed
+    calls then emit one word per chunk at ``token_rate`` tokens per second
+    (0 sends all chunks at once). Set ``fault`` to inject an outage: "hang"
+    holds every call for ``fault_latency`` seconds, "error" answers 503.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2, token_rate: float = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.token_rate = token_rate
+        self.requests_served = 0
+        self.fault: Optional[str] = None
+        self.fault_latency = 60.0
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                body = b""
+                if "content-length" in headers:
+                    body = await reader.readexactly(int(headers["content-length"]))
+
+                if self.fault == "hang":
+                    await asyncio.sleep(self.fault_latency)
+                if self.fault == "error":
+                    status, payload = "503 Service Unavailable", {"error": {"message": "Injected outage"}}
+                elif method == "POST" and path.endswith("/chat/completions") and json.loads(body or b"{}").get("stream"):
+                    await self._stream_completion(json.loads(body), writer)
+                    continue
+
+                else:
+                    status, payload = await self._respond(method, path, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method: str, path: str, body: bytes):
+        if method != "POST" or not path.endswith("/chat/completions"):
+            return "404 Not Found", {"error": {"message": f"Unknown route {path}"}}
+
+        request = json.loads(body or b"{}")
+        prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+        await asyncio.sleep(self.latency)
+        self.requests_served += 1
+
+        content = self._completion_content(prompt)
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(content.split())
+        return "200 OK", {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    async def _stream_completion(self, request: Dict[str, Any], writer: asyncio.StreamWriter):
+        """Send the completion as SSE chunks using chunked transfer encoding"""
+        prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+        await asyncio.sleep(self.latency)
+
+        def write_event(data: str):
+            event = f"data: {data}\n\n".encode()
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+
+        words = self._completion_content(prompt).split(" ")
+        for index, word in enumerate(words):
+            if index and self.token_rate:
+                await asyncio.sleep(1 / self.token_rate)
+            write_event(json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word if index == 0 else f" {word}"},
+                    "finish_reason": None
+                }]
+            }))
+            await writer.drain()
+
+        write_event("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        self.requests_served += 1
+
+    def _completion_content(self, prompt: str) -> str:
+        """Return intent JSON for analysis prompts and plain text otherwise"""
+        if '"intent"' not in prompt:
+            return "Here is the information you requested. Is there anything else I can help you with?"
+
+        match = re.search(r'USER MESSAGE: "(.*)"', prompt)
+        message = match.group(1).lower() if match else ""
+        current = re.search(r"Current Intent: (\w+)", prompt)
+        current_intent = current.group(1) if current and current.group(1) != "none" else None
+        if "block" in message:
+            intent = "card_blocking"
+        elif "loan" in message:
+            intent = "loan_inquiry"
+        elif "card" in message:
+            intent = "card_inquiry"
+        elif "transaction" in message:
+            intent = "transaction_history"
+        elif any(word in message for word in ["hello", "hi", "hey"]):
+            intent = "greeting"
+        elif "balance" in message or not current_intent:
+            intent = "balance_inquiry"
+        else:
+            # Follow-up answers (card numbers, dates, "yes") stay in the current flow
+            intent = current_intent
+
+        analysis = {
+            "intent": intent,
+            "entities": {},
+            "context_switch": False,
+            "confidence": 0.9,
+            "reasoning": "mock classification"
+        }
+        if '"response"' in prompt:
+            analysis["response"] = "Here is the information you requested. Is there anything else I can help you with?"
+        return json.dumps(analysis)
+
+
+def use_mock_llm(server: MockLLMServer):
+    """Point every LLM provider at the mock server (must run before importing services)"""
+    os.environ["GROQ_API_KEY"] = "mock-key"
+    os.environ["GROQ_BASE_URL"] = server.base_url
+    os.environ["OPENAI_BASE_URL"] = os.environ["LLAMA_CPP_URL"] = f"{server.base_url}/v1"
+
+
+def use_llm_path():
+    """Send every turn through the LLM: no response cache, local intent router or
+    templated replies (must run before importing services)"""
+    os.environ["RESPONSE_CACHE_TTL"] = "0"
+    os.environ["INTENT_ROUTER"] = "false"
+    os.environ["LLM_FREE_MODE"] = "false"
+    os.environ["LLM_FREE_ACTIONS"] = ""
+
+
+async def run_llm_throughput(args):
+    server = MockLLMServer(latency=args.latency)
+    await server.start()
+    use_mock_llm(server)
+    use_llm_path()
+
+    from database import db_manager
+    from services import workflow_engine
+
+    print(f"Mock LLM at {server.base_url} (latency {args.latency * 1000:.0f} ms per call)")
+    print(f"{'sessions':>10} {'turns':>8} {'seconds':>9} {'turns/s':>9}")
+
+    for sessions in [int(s) for s in args.sessions.split(",")]:
+        async def session_worker():
+            session_id = f"load_{uuid.uuid4().hex[:8]}"
+            for _ in range(args.turns):
+                await workflow_engine.handle_conversation(args.user_id, "What's my balance?", session_id)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[session_worker() for _ in range(sessions)])
+        elapsed = time.perf_counter() - started
+
+        total_turns = sessions * args.turns
+        print(f"{sessions:>10} {total_turns:>8} {elapsed:>9.2f} {total_turns / elapsed:>9.1f}")
+
+    await db_manager.close()
+    await server.stop()
+
+
+async def run_pipeline_compare(args):
+    server = MockLLMServer(latency=args.latency)
+    await server.start()
+    use_mock_llm(server)
+    use_llm_path()
+
+    from database import db_manager
+    from services import workflow_engine
+
+    messages = ["Hello", "What's my balance?", "Show my cards", "Show my recent transactions",
+                "What is my loan status?", "Block my credit card"]
+    for fused in (False, True):
+        workflow_engine.fused_pipeline = fused
+        for turn in range(args.turns):
+            await workflow_engine.handle_conversation(
+                args.user_id, messages[turn % len(messages)], f"compare_{uuid.uuid4().hex[:8]}"
+            )
+
+    print(f"Mock LLM latency {args.latency * 1000:.0f} ms per call, {args.turns} turns per mode")
+    print(f"{'mode':>15} {'turns':>6} {'latency ms':>11} {'llm calls':>10} {'prompt tok':>11} {'compl tok':>10}")
+    for mode, stats in workflow_engine.get_pipeline_stats()["modes"].items():
+        print(f"{mode:>15} {stats['turns']:>6} {stats['avg_latency_ms']:>11.1f} {stats['avg_llm_calls']:>10.2f} "
+              f"{stats['avg_prompt_tokens']:>11.1f} {stats['avg_completion_tokens']:>10.1f}")
+
+    await db_manager.close()
+    await server.stop()
+
+
+def _handoff_worker(base_url: str, session_db: str, requests, replies):
+    """Worker process for session-handoff: handles turns against the shared store"""
+    os.environ.update({
+        "GROQ_API_KEY": "mock-key",
+        "GROQ_BASE_URL": base_url,
+        "SESSION_STORE": "sqlite",
+        "SESSION_DB_PATH": session_db,
+        # The next scripted turn arrives faster than a person types
+        "SESSION_FLUSH_INTERVAL": "0"
+    })
+
+    async def serve():
+        from database import db_manager
+        from services import conversation_ai, workflow_engine
+
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await loop.run_in_executor(None, requests.get)
+            if job is None:
+                break
+            session_id, message = job
+            response = await workflow_engine.handle_conversation("user_demo1", message, session_id)
+            context = await conversation_ai.sessions.get(session_id)
+            replies.put({
+                "pid": os.getpid(),
+                "workflow_step": context.workflow_step,
+                "state": context.conversation_state.value,
+                "workflow_active": response.get("workflow_active", False)
+            })
+        await conversation_ai.sessions.close()
+        await db_manager.close()
+
+    asyncio.run(serve())
+
+
+def run_session_handoff(args):
+    import multiprocessing
+    import tempfile
+    import threading
+
+    server = MockLLMServer(latency=0.01)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    session_db = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    ctx = multiprocessing.get_context("spawn")
+    workers = []
+    for _ in range(2):
+        requests, replies = ctx.Queue(), ctx.Queue()
+        process = ctx.Process(target=_handoff_worker, args=(server.base_url, session_db, requests, replies))
+        process.start()
+        workers.append((process, requests, replies))
+
+    # Card blocking with DOB verification, cancelled at the final confirmation
+    # so the demo cards stay active; each turn goes to the other worker
+    script = [
+        ("Block my card", "card_selection"),
+        ("1", "dob_verification"),
+        ("1990-01-01", "reason_collection"),
+        ("I lost it", "final_confirmation"),
+        ("no", "final_confirmation"),
+    ]
+    session_id = f"handoff_{uuid.uuid4().hex[:8]}"
+    failures = 0
+    for turn, (message, expected_step) in enumerate(script):
+        _, requests, replies = workers[turn % len(workers)]
+        requests.put((session_id, message))
+        reply = replies.get(timeout=60)
+        ok = reply["workflow_step"] == expected_step
+        failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] worker pid {reply['pid']}: {message!r} -> "
+              f"step={reply['workflow_step']} state={reply['state']}")
+
+    for process, requests, _ in workers:
+        requests.put(None)
+        process.join(timeout=30)
+    print("Session handed off across workers" if not failures else f"{failures} turns lost session state")
+    raise SystemExit(1 if failures else 0)
+
+
+# Scripted conversations replayed by full-stack clients. Card blocking is
+# cancelled at the final confirmation so the demo cards stay active.
+SCENARIOS: Dict[str, List[str]] = {
+    "card_blocking": ["Block my card", "1", "1990-01-01", "I lost it", "no"],
+    "balance_check": ["Hello", "What's my balance?", "Show my recent transactions", "Thanks, bye"],
+    "context_switch": ["Block my card", "Wait, what's my balance?", "Show my loan status", "Block my card", "1",
+                       "1990-01-01", "I lost it", "no"],
+}
+
+
+class TurnRecorder:
+    """Per (transport, scenario) turn latencies and errors"""
+
+    def __init__(self):
+        self.latencies: Dict[tuple, List[float]] = {}
+        self.errors: Dict[tuple, int] = {}
+        self.error_samples: List[str] = []
+
+    def record(self, key: tuple, elapsed: float):
+        self.latencies.setdefault(key, []).append(elapsed)
+
+    def fail(self, key: tuple, error: str):
+        self.errors[key] = self.errors.get(key, 0) + 1
+        if len(self.error_samples) < 5:
+            self.error_samples.append(f"{key[0]}/{key[1]}: {error}")
+
+
+async def _rest_conversation(client, base_url: str, user_id: str, scenario: str, recorder: TurnRecorder,
+                             think_time: float):
+    session_id = None
+    for message in SCENARIOS[scenario]:
+        key = ("rest", scenario)
+        params = {"user_id": user_id, **({"session_id": session_id} if session_id else {})}
+        started = time.perf_counter()
+        try:
+            reply = await client.post(f"{base_url}/api/v1/chat", params=params, json={"message": message})
+            if reply.status_code != 200:
+                raise RuntimeError(f"HTTP {reply.status_code}")
+            body = reply.json()
+            if body.get("error"):
+                raise RuntimeError(f"handler error: {body.get('response', '')[:80]}")
+        except Exception as e:
+            recorder.fail(key, str(e) or type(e).__name__)
+            return
+        recorder.record(key, time.perf_counter() - started)
+        session_id = body["session_id"]
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def _ws_conversation(base_url: str, user_id: str, scenario: str, recorder: TurnRecorder,
+                           think_time: float, stream: bool, timeout: float):
+    import websockets
+
+    url = f"{base_url.replace('http', 'ws', 1)}/ws?user_id={user_id}&stream={'true' if stream else 'false'}"
+    key = ("ws", scenario)
+    try:
+        async with websockets.connect(url, open_timeout=timeout, max_queue=None) as socket:
+            await asyncio.wait_for(socket.recv(), timeout)  # welcome message
+            for message in SCENARIOS[scenario]:
+                started = time.perf_counter()
+                await socket.send(json.dumps({"message": message}))
+                while True:
+                    frame = json.loads(await asyncio.wait_for(socket.recv(), timeout))
+                    if frame.get("type") == "assistant":
+                        break
+                recorder.record(key, time.perf_counter() - started)
+                if think_time:
+                    await asyncio.sleep(think_time)
+    except Exception as e:
+        recorder.fail(key, str(e) or type(e).__name__)
+
+
+async def _wait_until_ready(base_url: str, process, timeout: float = 60):
+    import httpx
+
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                if (await client.get(f"{base_url}/", timeout=1)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} not ready after {timeout:.0f}s")
+
+
+async def run_full_stack(args):
+    import socket
+    import subprocess
+    import sys
+    import httpx
+    from benchmarks import latency_summary
+
+    process = None
+    server = None
+    base_url = args.url
+    if not base_url:
+        server = MockLLMServer(latency=args.latency, token_rate=args.token_rate)
+        await server.start()
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        base_url = f"http://127.0.0.1:{port}"
+        env = {**os.environ, "GROQ_API_KEY": "mock-key", "GROQ_BASE_URL": server.base_url,
+               "OPENAI_BASE_URL": f"{server.base_url}/v1", "LLAMA_CPP_URL": f"{server.base_url}/v1"}
+        log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        print(f"Mock LLM at {server.base_url} (latency {args.latency * 1000:.0f} ms, "
+              f"{args.token_rate or 'unlimited'} tokens/s); app at {base_url} with {args.workers} worker(s)")
+
+    try:
+        await _wait_until_ready(base_url, process)
+        recorder = TurnRecorder()
+        scenarios = [name for name in args.scenarios.split(",") if name]
+        transports = ["ws", "rest"] if args.transport == "mixed" else [args.transport]
+        deadline = time.perf_counter() + args.duration
+
+        async with httpx.AsyncClient(timeout=args.timeout,
+                                     limits=httpx.Limits(max_connections=args.clients)) as client:
+            async def run_client(index: int):
+                transport = transports[index % len(transports)]
+                user_id = args.user_ids[index % len(args.user_ids)]
+                iteration = 0
+                while time.perf_counter() < deadline:
+                    scenario = scenarios[(index + iteration) % len(scenarios)]
+                    iteration += 1
+                    if transport == "rest":
+                        await _rest_conversation(client, base_url, user_id, scenario, recorder, args.think_time)
+                    else:
+                        await _ws_conversation(base_url, user_id, scenario, recorder, args.think_time,
+                                               args.stream, args.timeout)
+
+            started = time.perf_counter()
+            await asyncio.gather(*[run_client(i) for i in range(args.clients)])
+            elapsed = time.perf_counter() - started
+
+        print(f"{args.clients} clients ({args.transport}) for {elapsed:.1f}s, scenarios: {', '.join(scenarios)}")
+        print(f"{'transport':>9} {'scenario':>15} {'turns':>7} {'errors':>7} {'err %':>6} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'turns/s':>8}")
+        keys = sorted(set(recorder.latencies) | set(recorder.errors))
+        groups = [(key[0], key[1], [key]) for key in keys]
+        groups += [(transport, "all", [key for key in keys if key[0] == transport]) for transport in transports]
+        groups.append(("all", "all", keys))
+        for transport, scenario, members in groups:
+            samples = [latency for key in members for latency in recorder.latencies.get(key, [])]
+            errors = sum(recorder.errors.get(key, 0) for key in members)
+            summary = latency_summary(samples)
+            attempts = len(samples) + errors
+            print(f"{transport:>9} {scenario:>15} {len(samples):>7} {errors:>7} "
+                  f"{errors / attempts if attempts else 0:>6.1%} {summary['p50_ms']:>8.1f} "
+                  f"{summary['p95_ms']:>8.1f} {summary['p99_ms']:>8.1f} {len(samples) / elapsed:>8.1f}")
+        for sample in recorder.error_samples:
+            print(f"  error: {sample}")
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if server is not None:
+            await server.stop()
+
+
+async def run_llm_outage(args):
+    """Steady load through a healthy phase, an injected LLM outage and recovery"""
+    server = MockLLMServer(latency=args.latency)
+    await server.start()
+    use_mock_llm(server)
+    os.environ["LLM_TIMEOUT"] = str(args.llm_timeout)
+    os.environ["TURN_LATENCY_BUDGET"] = str(args.budget)
+    os.environ["LLM_BREAKER_OPEN_SECONDS"] = str(args.open_seconds)
+
+    from benchmarks import latency_summary
+    from database import db_manager
+    from agents import banking_agent
+    from services import conversation_ai, workflow_engine
+
+    # Cached replies would hide the LLM entirely
+    workflow_engine.response_cache = None
+    messages = ["What's my balance?", "Show my cards", "Show my recent transactions", "What is my loan status?",
+                "Hello"]
+    phases = [("healthy", args.healthy), ("outage", args.outage), ("recovery", args.recovery)]
+    print(f"Mock LLM latency {args.latency * 1000:.0f} ms; outage = {args.fault} for {args.outage:g}s; "
+          f"LLM_TIMEOUT {args.llm_timeout:g}s, TURN_LATENCY_BUDGET {args.budget:g}s, {args.sessions} sessions")
+
+    for breaker_enabled in ([False, True] if args.compare else [True]):
+        conversation_ai.breaker.reset()
+        conversation_ai.breaker.enabled = breaker_enabled
+        server.fault = None
+        results: Dict[str, List[float]] = {name: [] for name, _ in phases}
+        degraded: Dict[str, int] = {name: 0 for name, _ in phases}
+        phase = {"name": phases[0][0]}
+
+        async def session_worker(index: int):
+            session_id = f"outage_{uuid.uuid4().hex[:8]}"
+            turn = index
+            while phase["name"] is not None:
+                name = phase["name"]
+                started = time.perf_counter()
+                await banking_agent.process_message(args.user_id, messages[turn % len(messages)], session_id)
+                results[name].append(time.perf_counter() - started)
+                turn += 1
+                if args.think_time:
+                    await asyncio.sleep(args.think_time)
+
+        async def drive_phases():
+            for name, seconds in phases:
+                phase["name"] = name
+                server.fault = args.fault if name == "outage" else None
+                await asyncio.sleep(seconds)
+            phase["name"] = None
+
+        before = dict(workflow_engine.pipeline_stats.get("degraded", {"turns": 0}))
+        await asyncio.gather(drive_phases(), *[session_worker(i) for i in range(args.sessions)])
+        degraded_turns = workflow_engine.pipeline_stats.get("degraded", {"turns": 0})["turns"] - before["turns"]
+
+        print(f"\ncircuit breaker {'on' if breaker_enabled else 'off'}: {degraded_turns} degraded turns, "
+              f"opened {conversation_ai.breaker.opened} time(s)")
+        print(f"{'phase':>9} {'turns':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, _ in phases:
+            summary = latency_summary(results[name])
+            print(f"{name:>9} {len(results[name]):>7} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} "
+                  f"{summary['p99_ms']:>9.1f} {summary['max_ms']:>9.1f}")
+
+    await conversation_ai.history.close()
+    await conversation_ai.sessions.close()
+    await db_manager.close()
+    await server.stop()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    throughput = commands.add_parser("llm-throughput", help="Turn throughput vs. concurrent sessions")
+    throughput.add_argument("--latency", type=float, default=0.3, help="Mock LLM latency per call (seconds)")
+    throughput.add_argument("--sessions", default="1,4,16,64", help="Comma-separated concurrency levels")
+    throughput.add_argument("--turns", type=int, default=3, help="Turns per session")
+    throughput.add_argument("--user-id", default="user_demo1")
+    throughput.set_defaults(handler=run_llm_throughput)
+
+    compare = commands.add_parser("pipeline-compare", help="Per-turn latency and tokens: fused vs. two-call")
+    compare.add_argument("--latency", type=float, default=0.3, help="Mock LLM latency per call (seconds)")
+    compare.add_argument("--turns", type=int, default=30, help="Turns per mode")
+    compare.add_argument("--user-id", default="user_demo1")
+    compare.set_defaults(handler=run_pipeline_compare)
+
+    handoff = commands.add_parser("session-handoff", help="Card blocking flow alternating between two worker processes")
+    handoff.set_defaults(handler=run_session_handoff)
+
+    full_stack = commands.add_parser("full-stack", help="Scripted multi-turn conversations over WebSocket and REST against the app")
+    full_stack.add_argument("--url", help="Target an already running app instead of starting one with the mock LLM")
+    full_stack.add_argument("--latency", type=float, default=0.2, help="Mock LLM latency per call (seconds)")
+    full_stack.add_argument("--token-rate", type=float, default=0, help="Mock LLM streamed tokens/s (0 = unlimited)")
+    full_stack.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    full_stack.add_argument("--clients", type=int, default=50)
+    full_stack.add_argument("--transport", choices=["ws", "rest", "mixed"], default="mixed")
+    full_stack.add_argument("--scenarios", default=",".join(SCENARIOS))
+    full_stack.add_argument("--duration", type=float, default=30, help="Seconds to keep starting conversations")
+    full_stack.add_argument("--think-time", type=float, default=0, help="Pause between turns (seconds)")
+    full_stack.add_argument("--stream", action="store_true", help="Stream replies on WebSocket clients")
+    full_stack.add_argument("--timeout", type=float, default=30, help="Per-turn timeout (seconds)")
+    full_stack.add_argument("--user-ids", nargs="+", default=["user_demo1"])
+    full_stack.add_argument("--server-log", help="File for the app's output")
+    full_stack.set_defaults(handler=run_full_stack)
+
+    outage = commands.add_parser("llm-outage", help="Turn latency before, during and after an injected LLM outage")
+    outage.add_argument("--fault", choices=["hang", "error"], default="hang")
+    outage.add_argument("--latency", type=float, default=0.2, help="Mock LLM latency per call when healthy (seconds)")
+    outage.add_argument("--sessions", type=int, default=32)
+    outage.add_argument("--healthy", type=float, default=10, help="Seconds before the outage")
+    outage.add_argument("--outage", type=float, default=20, help="Seconds of outage")
+    outage.add_argument("--recovery", type=float, default=15, help="Seconds after the outage")
+    outage.add_argument("--llm-timeout", type=float, default=5)
+    outage.add_argument("--budget", type=float, default=8, help="TURN_LATENCY_BUDGET (seconds)")
+    outage.add_argument("--open-seconds", type=float, default=5, help="LLM_BREAKER_OPEN_SECONDS")
+    outage.add_argument("--think-time", type=float, default=0.1, help="Pause between turns (seconds)")
+    outage.add_argument("--compare", action="store_true", help="Run once without the circuit breaker first")
+    outage.add_argument("--user-id", default="user_demo1")
+    outage.set_defaults(handler=run_llm_outage)
+
+    args = parser.parse_args(argv)
+    if asyncio.iscoroutinefunction(args.handler):
+        asyncio.run(args.handler(args))
+    else:
+        args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
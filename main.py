@@ -1,18 +1,41 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from typing import Optional
+import asyncio
 import json
+import os
 import uuid
 from datetime import datetime
 
 from agents import banking_agent
+from connections import create_connection_manager
+from database import db_manager, account_service
+from events import Event, event_bus
+from metrics import metrics
+from tracing import tracer
 from models import ChatMessage
+from services import conversation_ai
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db_manager.initialize_async()
+    conversation_ai.sessions.start_sweeper(float(os.getenv("SESSION_SWEEP_INTERVAL", "60")))
+    yield
+    await manager.close()
+    await conversation_ai.history.close()
+    await conversation_ai.llm.close()
+    tracer.close()
+    await conversation_ai.sessions.close()
+    await db_manager.close()
 
 # FastAPI app
 app = FastAPI(
     title="AI Banking Conversation System",
     description="Advanced conversational AI for banking with multi-turn understanding",
-    version="5.0.0"
+    version="5.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -23,27 +46,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# WebSocket manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+# WebSocket connections by session and by user (see connections.py)
+manager = create_connection_manager()
+
+# Card and loan events from the write paths go to all of the user's open sockets
+def _notify_user(event: Event):
+    manager.send_to_user(event.user_id, json.dumps({"type": "notification", **event.to_dict()}))
 
-    async def connect(self, websocket: WebSocket, session_id: str):
-        await websocket.accept()
-        self.active_connections[session_id] = websocket
+event_bus.subscribe(_notify_user)
 
-    def disconnect(self, session_id: str):
-        if session_id in self.active_connections:
-            del self.active_connections[session_id]
+# Pool, session and socket counts are read when /metrics is scraped
+def _pool_gauge():
+    stats = db_manager.pool.stats()
+    return {("open",): stats["size"], ("idle",): stats["idle"], ("max",): stats["max_size"]}
 
-    async def send_message(self, session_id: str, message: str):
-        if session_id in self.active_connections:
-            try:
-                await self.active_connections[session_id].send_text(message)
-            except:
-                self.disconnect(session_id)
+def _session_gauge():
+    # Only the in-memory store knows its size without a query
+    stats = conversation_ai.sessions.stats()
+    return {(): stats["size"]} if "size" in stats else {}
 
-manager = ConnectionManager()
+metrics.gauge("banking_db_pool_connections", "Pooled database connections by state", ("state",), _pool_gauge)
+metrics.gauge("banking_sessions", "Sessions held by the in-memory session store", (), _session_gauge)
+metrics.gauge("banking_websocket_connections", "Open WebSocket connections", (),
+              lambda: {(): len(manager.connections)})
+metrics.gauge("banking_websocket_queued_messages", "Messages waiting in WebSocket send queues", (),
+              lambda: {(): manager.queued()})
+metrics.gauge("banking_llm_circuit_state", "1 for the LLM circuit breaker's current state", ("state",),
+              lambda: {(state,): int(conversation_ai.breaker.state == state) for state in ("closed", "open", "half_open")})
 
 @app.get("/")
 async def root():
@@ -64,11 +93,12 @@ async def root():
     }
 
 @app.post("/api/v1/chat")
-async def chat(message: ChatMessage, user_id: str = "user_demo1"):
-    """Main chat endpoint - simplified without authentication"""
-    session_id = f"session_{uuid.uuid4().hex[:8]}"
+async def chat(message: ChatMessage, user_id: str = "user_demo1", session_id: Optional[str] = None):
+    """Main chat endpoint - simplified without authentication; pass the returned session_id to continue a conversation"""
+    session_id = session_id or f"session_{uuid.uuid4().hex[:8]}"
     
-    response = await banking_agent.process_message(user_id, message.message, session_id)
+    with tracer.start_trace("http.chat", user_id=user_id, session_id=session_id):
+        response = await banking_agent.process_message(user_id, message.message, session_id)
     
     return {
         **response,
@@ -76,11 +106,86 @@ async def chat(message: ChatMessage, user_id: str = "user_demo1"):
         "session_id": session_id
     }
 
+@app.post("/api/v1/chat/stream")
+async def chat_stream(message: ChatMessage, user_id: str = "user_demo1", session_id: Optional[str] = None):
+    """Server-Sent Events variant of the chat endpoint that streams the reply"""
+    session_id = session_id or f"session_{uuid.uuid4().hex[:8]}"
+    deltas: asyncio.Queue = asyncio.Queue()
+
+    async def on_delta(delta: str):
+        await deltas.put(delta)
+
+    async def run_turn():
+        try:
+            return await banking_agent.process_message(user_id, message.message, session_id, on_delta=on_delta)
+        finally:
+            await deltas.put(None)
+
+    async def event_stream():
+        turn = asyncio.create_task(run_turn())
+        try:
+            while (delta := await deltas.get()) is not None:
+                data = {"type": "assistant_delta", "delta": delta, "session_id": session_id}
+                yield f"event: assistant_delta\ndata: {json.dumps(data)}\n\n"
+
+            response = await turn
+            final = {
+                "type": "assistant",
+                **response,
+                "message": response["response"],
+                "user_id": user_id,
+                "session_id": session_id
+            }
+            yield f"event: assistant\ndata: {json.dumps(final)}\n\n"
+        finally:
+            if not turn.done():
+                turn.cancel()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.get("/api/v1/transactions")
+async def list_transactions(user_id: str = "user_demo1", limit: int = 10, cursor: Optional[str] = None,
+                            start_date: Optional[str] = None, end_date: Optional[str] = None,
+                            transaction_type: Optional[str] = None, merchant: Optional[str] = None):
+    """Transactions across all of the user's accounts, newest first; pass next_cursor back to get the next page"""
+    try:
+        return await account_service.get_transactions_page(
+            user_id, max(1, min(limit, 100)), cursor, start_date, end_date, transaction_type, merchant
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/v1/pipeline/stats")
+async def pipeline_stats():
+    """Per-turn latency and LLM token usage for the fused and two-call pipelines"""
+    return banking_agent.workflow_engine.get_pipeline_stats()
+
+@app.get("/api/v1/sessions/stats")
+async def session_stats():
+    """Session store size, hit/miss/eviction counters and history summarization counts"""
+    return {**conversation_ai.sessions.stats(), "history": conversation_ai.history.stats()}
+
+@app.get("/api/v1/cache/stats")
+async def cache_stats():
+    """Response cache size and hit rate, plus shared DB read counters"""
+    cache = banking_agent.workflow_engine.response_cache
+    return {**(cache.stats() if cache else {"enabled": False}), "db_reads": db_manager.reads.stats()}
+
+@app.get("/api/v1/connections/stats")
+async def connection_stats():
+    """Open WebSocket connections and users, queued messages, slow-client disconnects and event counts"""
+    return {**manager.stats(), "events": event_bus.stats()}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Latency histograms, LLM token counters and pool gauges in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, user_id: str = "user_demo1"):
-    """WebSocket for real-time conversation"""
+async def websocket_endpoint(websocket: WebSocket, user_id: str = "user_demo1", stream: bool = False):
+    """WebSocket for real-time conversation (stream=true sends assistant_delta frames)"""
     session_id = f"ws_{uuid.uuid4().hex[:8]}"
-    await manager.connect(websocket, session_id)
+    await manager.connect(websocket, session_id, user_id)
     
     try:
         # Send welcome message
@@ -105,31 +210,41 @@ What can I help you with today?""",
             "session_id": session_id,
             "user_id": user_id
         }
-        await manager.send_message(session_id, json.dumps(welcome_msg))
+        manager.send(session_id, json.dumps(welcome_msg))
         
         while True:
             data = await websocket.receive_text()
-            message_data = json.loads(data)
-            user_message = message_data.get("message", "")
+            # The turn's root span starts once the message has arrived
+            with tracer.start_trace("ws.receive", user_id=user_id, session_id=session_id, bytes=len(data)):
+                message_data = json.loads(data)
+                user_message = message_data.get("message", "")
             
-            if user_message.strip():
-                response = await banking_agent.process_message(user_id, user_message, session_id)
+                if user_message.strip():
+                    async def send_delta(delta: str):
+                        manager.send_delta(session_id, delta)
+
+                    response = await banking_agent.process_message(
+                        user_id, user_message, session_id,
+                        on_delta=send_delta if stream or message_data.get("stream") else None
+                    )
                 
-                response_data = {
-                    "type": "assistant",
-                    "message": response["response"],
-                    "intent": response.get("intent"),
-                    "workflow_active": response.get("workflow_active"),
-                    "completed": response.get("completed"),
-                    "context_switched": response.get("context_switched"),
-                    "session_id": session_id,
-                    "user_id": user_id,
-                    "timestamp": datetime.now().isoformat()
-                }
+                    response_data = {
+                        "type": "assistant",
+                        "message": response["response"],
+                        "intent": response.get("intent"),
+                        "workflow_active": response.get("workflow_active"),
+                        "completed": response.get("completed"),
+                        "context_switched": response.get("context_switched"),
+                        "session_id": session_id,
+                        "user_id": user_id,
+                        "timestamp": datetime.now().isoformat()
+                    }
                 
-                await manager.send_message(session_id, json.dumps(response_data))
+                    manager.send(session_id, json.dumps(response_data))
                 
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(session_id)
 
 if __name__ == "__main__":
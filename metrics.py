@@ -0,0 +1,211 @@
+import bisect
+import math
+import os
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Latency buckets in seconds, from sub-millisecond DB reads to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter; label values are passed positionally in labelnames order"""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        if self.registry.enabled:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class _HistogramTimer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: "Histogram", labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class Histogram:
+    """Fixed-bucket histogram; each observation is one bisect and three adds"""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        if not self.registry.enabled:
+            return
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, *labels: str) -> _HistogramTimer:
+        """Context manager observing the elapsed seconds of its block"""
+        return _HistogramTimer(self, labels)
+
+    def snapshot(self, *labels: str) -> Dict[str, float]:
+        series = self._series.get(labels)
+        if series is None:
+            return {"count": 0, "sum": 0.0}
+        return {"count": series[2], "sum": series[1]}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time, so the hot path pays nothing"""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.function = function
+        self._failing = False
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.function() if self.function else {}
+            self._failing = False
+        except Exception as e:
+            # Reported once per failure streak, not on every scrape
+            if not self._failing:
+                print(f"Metrics Gauge Error ({self.name}): {type(e).__name__}: {e}")
+            self._failing = True
+            values = {}
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """In-process metrics rendered in the Prometheus text exposition format.
+
+    Updates are plain dict and list operations on the event loop thread, so
+    they need no locks. With METRICS_ENABLED=false every update returns
+    immediately.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(self, name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+              function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None) -> Gauge:
+        return self._register(Gauge(self, name, help, labelnames, function))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(enabled=os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes"))
+
+# (intent, workflow_step) of the turn being handled, for metrics recorded
+# below the services layer; "none" outside a turn or before intent analysis
+turn_labels: ContextVar[Tuple[str, str]] = ContextVar("turn_labels", default=("none", "none"))
+
+# Hot-path metrics shared by the services, the database layer and main.py
+TURN_LATENCY = metrics.histogram(
+    "banking_turn_seconds", "End-to-end conversation turn latency", ("mode", "intent"))
+STAGE_LATENCY = metrics.histogram(
+    "banking_stage_seconds", "Time spent per turn stage (intent_analysis, route, handler, "
+    "response_generation, response_template, response_cleanup)", ("stage", "intent", "workflow_step"))
+LLM_LATENCY = metrics.histogram(
+    "banking_llm_call_seconds", "LLM call latency including the wait for a concurrency slot",
+    ("purpose", "outcome"))
+LLM_SLOT_WAIT = metrics.histogram(
+    "banking_llm_slot_wait_seconds", "Wait for one of the LLM_MAX_CONCURRENCY call slots")
+LLM_TOKENS = metrics.counter(
+    "banking_llm_tokens_total", "LLM tokens reported by the provider", ("purpose", "kind", "intent", "workflow_step"))
+LLM_FALLBACKS = metrics.counter(
+    "banking_llm_fallbacks_total", "LLM calls answered by a fallback instead (circuit_open, budget, timeout, error)",
+    ("purpose", "reason"))
+LLM_HEDGES = metrics.counter(
+    "banking_llm_hedged_requests_total", "Second requests sent for LLM calls slower than the recent p95",
+    ("purpose",))
+WS_DISCONNECTS = metrics.counter(
+    "banking_websocket_disconnects_total", "WebSocket clients dropped by the server (queue_full, send_timeout, "
+    "send_error)", ("reason",))
+DB_PREFETCH = metrics.counter(
+    "banking_db_prefetch_total", "Handler reads started during intent analysis (used, unused, stale)",
+    ("read", "outcome"))
+DB_CONNECTION_WAIT = metrics.histogram(
+    "banking_db_connection_wait_seconds", "Wait to check out a pooled database connection",
+    ("intent", "workflow_step"))
+DB_CONNECTION_HOLD = metrics.histogram(
+    "banking_db_connection_hold_seconds", "Time a pooled database connection stays checked out")
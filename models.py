@@ -11,6 +11,7 @@ class Intent(str, Enum):
     CARD_APPLICATION = "card_application"
     BALANCE_INQUIRY = "balance_inquiry"
     TRANSACTION_HISTORY = "transaction_history"
+    SPENDING_SUMMARY = "spending_summary"
     GENERAL_INQUIRY = "general_inquiry"
     GREETING = "greeting"
     GOODBYE = "goodbye"
@@ -30,6 +31,12 @@ class ConversationContext(BaseModel):
     conversation_state: ConversationState = ConversationState.IDLE
     collected_data: Dict[str, Any] = {}
     conversation_history: List[Dict[str, Any]] = []
+    # Older messages pushed out of conversation_history (see history.py)
+    unsummarized_history: List[Dict[str, Any]] = []
+    history_summary: str = ""
+    summarized_messages: int = 0
+    # Resumes transaction history for "show me more" (see AccountService.get_transactions_page)
+    transaction_cursor: str = ""
     workflow_step: str = ""
     interruption_stack: List[Dict[str, Any]] = []
     ai_confidence: float = 0.0
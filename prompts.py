@@ -0,0 +1,255 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional
+    _ENCODING = None
+
+# Static instructions come first and are sent as the system message, so every
+# prompt of a kind starts with the same bytes and provider-side prefix caching
+# can reuse them. Only the CONVERSATION CONTEXT block that follows varies.
+
+INTENT_CATALOG = """AVAILABLE INTENTS:
+- loan_application: User wants to apply for a new loan
+- loan_inquiry: User wants to check existing loan applications or loan status
+- card_blocking: User wants to block/freeze a card
+- card_application: User wants to apply for a new card
+- card_inquiry: User asking about existing cards or card status
+- balance_inquiry: User wants to check account balance
+- transaction_history: User wants to see transactions
+- spending_summary: User asks how much they spent or received (totals, averages, by category or merchant)
+- general_inquiry: General questions or greetings
+- greeting: Hello, hi, good morning etc.
+- goodbye: Bye, see you later etc."""
+
+ANALYSIS_FIELDS = (
+    '"intent": "intent_name",\n'
+    '"entities": {\n'
+    '"amount": "extracted_amount_if_any",\n'
+    '"card_type": "debit/credit_if_mentioned",\n'
+    '"loan_purpose": "purpose_if_mentioned",\n'
+    '"card_last_4": "last_4_digits_if_mentioned"\n'
+    '},\n'
+    '"context_switch": true/false,\n'
+    '"confidence": 0.0-1.0,\n'
+    '"reasoning": "brief_explanation"'
+)
+
+ANALYSIS_PREFIX = f"""You are an expert banking conversation analyst. Analyze the user message and provide structured output.
+
+{INTENT_CATALOG}
+
+Respond ONLY with valid JSON:
+{{
+{ANALYSIS_FIELDS}
+}}"""
+
+FUSED_PREFIX = f"""You are a professional AI Banking Assistant. Classify the user message and write the reply in one step.
+
+{INTENT_CATALOG}
+
+RESPONSE GUIDELINES:
+1. Be conversational, helpful, and professional
+2. If showing data, use only the SYSTEM DATA and format it clearly with numbers and lists
+3. Keep responses concise but informative
+4. DO NOT use any emojis, symbols, or special characters
+5. Use plain text formatting only
+6. Use "Number:" for lists instead of bullets
+
+Respond ONLY with valid JSON:
+{{
+{ANALYSIS_FIELDS},
+"response": "reply_to_the_user"
+}}"""
+
+RESPONSE_PREFIX = """You are a professional AI Banking Assistant. Generate a helpful, conversational response.
+
+RESPONSE GUIDELINES:
+1. Be conversational, helpful, and professional
+2. If collecting information, ask specific questions
+3. If showing data, format it clearly with numbers and lists
+4. Keep responses concise but informative
+5. DO NOT use any emojis, symbols, or special characters
+6. Use plain text formatting only
+7. Use "Number:" for lists instead of bullets
+8. If SYSTEM DATA says has_more, mention that the user can ask to see more
+9. Spending totals and averages in SYSTEM DATA are exact; quote them instead of adding up amounts yourself
+
+Generate a natural, helpful response."""
+
+SUMMARY_PREFIX = """Update the running summary of a conversation between a bank customer and a banking assistant.
+Keep requests made, amounts, card endings, decisions and anything still unresolved; drop greetings and small talk.
+Write plain text only."""
+
+# Row fields the model needs to answer, per kind of row
+ACCOUNT_FIELDS = ("account_number", "account_type", "balance", "status")
+CARD_FIELDS = ("card_number", "card_type", "card_status", "credit_limit", "available_credit", "account_number")
+TRANSACTION_FIELDS = ("transaction_date", "transaction_type", "amount", "description", "merchant_name", "status",
+                      "account_number")
+LOAN_FIELDS = ("application_id", "loan_type", "loan_amount", "loan_purpose", "application_status",
+               "interest_rate", "loan_term_months", "monthly_payment", "applied_at")
+
+# System data keys sent for each handler action, with the row fields kept for
+# each (None keeps the value as is). Keys not listed are dropped; actions not
+# listed send everything.
+ACTION_FIELDS: Dict[str, Dict[str, Optional[Tuple[str, ...]]]] = {
+    "show_balance": {"accounts": ACCOUNT_FIELDS},
+    "show_cards": {"cards": CARD_FIELDS},
+    "show_transactions": {"accounts": ACCOUNT_FIELDS, "transactions": TRANSACTION_FIELDS, "filters": None,
+                          "has_more": None},
+    "show_loans": {"loan_applications": LOAN_FIELDS},
+    "show_spending_summary": {"summary": None},
+    "no_active_cards": {"active_cards": CARD_FIELDS},
+    "select_card_to_block": {"active_cards": CARD_FIELDS},
+    "invalid_card_selection": {"active_cards": CARD_FIELDS},
+    "ask_dob_verification": {"selected_card": CARD_FIELDS},
+    "final_confirmation": {"selected_card": CARD_FIELDS, "block_reason": None},
+    "block_successful_verified": {"selected_card": CARD_FIELDS, "blocked_card": ("card_status", "blocked_at"),
+                                  "block_result": ("message",)},
+    "block_verification_failed": {"selected_card": CARD_FIELDS},
+}
+
+# Collected workflow data is rendered with the same row whitelists
+COLLECTED_FIELDS: Dict[str, Optional[Tuple[str, ...]]] = {
+    "user_cards": CARD_FIELDS,
+    "selected_card": CARD_FIELDS,
+}
+
+_APPROX_TOKEN_PATTERN = re.compile(r"\d{1,3}|[A-Za-z]+|[^\sA-Za-z\d]")
+# Each full run of 8 letters counts as one extra subword token
+_LONG_WORD_PATTERN = re.compile(r"[A-Za-z]{8}")
+
+
+def count_tokens(text: str) -> int:
+    """Token count from tiktoken when installed, otherwise a close
+    approximation (words, 3-digit groups and punctuation marks)"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(_APPROX_TOKEN_PATTERN.findall(text)) + len(_LONG_WORD_PATTERN.findall(text))
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def _pick(row: Any, fields: Optional[Tuple[str, ...]]) -> Any:
+    if fields is None or not isinstance(row, dict):
+        return row
+    return {field: row[field] for field in fields if row.get(field) is not None}
+
+
+def _whitelist(data: Dict[str, Any], key_fields: Dict[str, Optional[Tuple[str, ...]]],
+               keep_unknown: bool) -> Dict[str, Any]:
+    selected = {}
+    for key, value in data.items():
+        if key in key_fields:
+            fields = key_fields[key]
+            selected[key] = [_pick(row, fields) for row in value] if isinstance(value, list) else _pick(value, fields)
+        elif keep_unknown:
+            selected[key] = value
+    return selected
+
+
+def _trim_list(data: Dict[str, Any], key: str, count: int):
+    omitted = len(data[key]) - count + data.get(f"{key}_omitted", 0)
+    if count:
+        data[key] = data[key][:count]
+    else:
+        del data[key]
+    data[f"{key}_omitted"] = omitted
+
+
+def _trim_scalar(data: Dict[str, Any], key: str, excess_chars: int):
+    """Shorten a string field by about excess_chars, or drop the field if
+    that would leave only a few words of it (or it is not a string)"""
+    value = data[key]
+    if isinstance(value, str) and len(value) - excess_chars > 40:
+        data[key] = value[:len(value) - excess_chars - 1] + "…"
+    else:
+        del data[key]
+        data[f"{key}_omitted"] = True
+
+
+def _fit(data: Dict[str, Any], budget: int) -> Dict[str, Any]:
+    """Drop rows from the costliest lists, then shorten or drop the largest
+    other fields, until data fits in budget tokens"""
+    text = compact_json(data)
+    # Every token covers at least one character
+    if len(text) <= budget:
+        return data
+    # Far oversized payloads are measured on a sample; trimming only needs an estimate
+    sample = text[:budget * 8]
+    total = count_tokens(sample) * len(text) / len(sample)
+    if total <= budget and len(sample) == len(text):
+        return data
+
+    # Rows of a list look alike, so each is charged the list's average share
+    # of the total, by serialized length
+    tokens_per_char = total / len(text)
+    data = dict(data)
+    row_cost = {key: len(compact_json(value)) * tokens_per_char / len(value)
+                for key, value in data.items() if isinstance(value, list) and value}
+    kept = {key: len(data[key]) for key in row_cost}
+    while total > budget and any(kept.values()):
+        key = max(kept, key=lambda name: row_cost[name] * kept[name])
+        kept[key] -= 1
+        total -= row_cost[key]
+    for key, count in kept.items():
+        if count < len(data[key]):
+            _trim_list(data, key, count)
+
+    # Large scalar fields (a long error or description) only go when the
+    # lists alone cannot make room; the action is always kept
+    scalars = sorted((key for key in data if key != "action" and key not in row_cost and not key.endswith("_omitted")),
+                     key=lambda name: len(compact_json(data[name])), reverse=True)
+    for key in scalars:
+        if total <= budget:
+            break
+        cost = len(compact_json(data[key])) * tokens_per_char
+        _trim_scalar(data, key, int((total - budget) / tokens_per_char) + 1)
+        total -= cost - len(compact_json(data.get(key, ""))) * tokens_per_char
+
+    # The estimate can be off by a few tokens; settle on the exact count
+    while count_tokens(compact_json(data)) > budget:
+        lists = [key for key in row_cost if data.get(key)]
+        others = [key for key in data if key != "action" and not key.endswith("_omitted") and key not in row_cost]
+        if lists:
+            key = max(lists, key=lambda name: len(compact_json(data[name])))
+            _trim_list(data, key, len(data[key]) - 1)
+        elif others:
+            key = max(others, key=lambda name: len(compact_json(data[name])))
+            _trim_scalar(data, key, max(1, len(compact_json(data[key])) // 4))
+        else:
+            break
+    return data
+
+
+def render_system_data(system_data: Dict[str, Any], budget: int) -> str:
+    """Compact JSON of the whitelisted fields for the data's action, cut to budget tokens"""
+    action = system_data.get("action")
+    fields = ACTION_FIELDS.get(action)
+    if fields is not None:
+        data = {"action": action, **_whitelist(system_data, fields, keep_unknown=False)}
+        # Errors are always worth showing
+        if "error" in system_data:
+            data["error"] = system_data["error"]
+    else:
+        data = system_data
+    return compact_json(_fit(data, budget))
+
+
+def render_collected_data(collected_data: Dict[str, Any], budget: int) -> str:
+    if not collected_data:
+        return "{}"
+    return compact_json(_fit(_whitelist(collected_data, COLLECTED_FIELDS, keep_unknown=True), budget))
+
+
+def build_messages(prefix: str, context_lines: List[str]) -> List[Dict[str, str]]:
+    """Chat messages for a precompiled prefix plus the turn-specific context"""
+    return [
+        {"role": "system", "content": prefix},
+        {"role": "user", "content": "\n".join(context_lines)}
+    ]
@@ -0,0 +1,297 @@
+"""Resilience controls for the LLM dependency.
+
+- CircuitBreaker: trips on the error rate or the slow-call rate over the
+  last LLM_BREAKER_WINDOW_CALLS calls (within LLM_BREAKER_WINDOW seconds).
+  While it is open, calls fail immediately, so turns fall back to keyword
+  intent analysis and templated replies instead of waiting out the client
+  timeout. After LLM_BREAKER_OPEN_SECONDS a single probe call decides
+  whether it closes again.
+- Hedged requests: when a call has not answered by the recent p95 latency
+  for its purpose, a second identical request is sent and the first reply
+  wins (LLM_HEDGE=true).
+- Turn latency budget: every LLM call in a turn gets at most the time left
+  in TURN_LATENCY_BUDGET seconds.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, NamedTuple, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the LLM while the circuit breaker is open"""
+
+
+class LatencyBudgetExceeded(TimeoutError):
+    """Raised when too little of the turn's latency budget is left for a call"""
+
+
+class BreakerTicket(NamedTuple):
+    """Handed out by CircuitBreaker.allow() and passed back with the outcome"""
+    generation: int
+    probe: bool = False
+
+
+class CircuitBreaker:
+    """Closed -> open on too many failed or slow calls -> half-open probe -> closed"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: float = 30.0, window_calls: int = 20, min_calls: int = 10, error_rate: float = 0.5,
+                 slow_call_seconds: float = 5.0, slow_rate: float = 0.8, open_seconds: float = 10.0,
+                 enabled: bool = True):
+        self.window = window
+        self.window_calls = window_calls
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.enabled = enabled
+        self.state = self.CLOSED
+        # (finished_at, failed, slow) for the last window_calls calls within window seconds
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+        self._failures = 0
+        self._slow = 0
+        self._opened_at = 0.0
+        self._probing = False
+        # Bumped on every open and close; outcomes of calls allowed before
+        # the last state change are ignored
+        self._generation = 0
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self) -> Optional[BreakerTicket]:
+        """A ticket if a call may go ahead now, else None; at most one probe
+        while half-open"""
+        if not self.enabled or self.state == self.CLOSED:
+            return BreakerTicket(self._generation)
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self.state = self.HALF_OPEN
+            print("LLM circuit half-open, sending a probe call")
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return BreakerTicket(self._generation, probe=True)
+        self.rejected += 1
+        return None
+
+    def record(self, ticket: BreakerTicket, success: bool, elapsed: float, slow: Optional[bool] = None):
+        """Add the outcome of the call ticket was issued for; slow defaults
+        to elapsed >= slow_call_seconds"""
+        if not self.enabled or ticket.generation != self._generation:
+            # Disabled, or the call started before the circuit last opened or closed
+            return
+        if slow is None:
+            slow = elapsed >= self.slow_call_seconds
+        if ticket.probe:
+            self._probing = False
+            if success and not slow:
+                self._close()
+            else:
+                self._open("probe call failed" if not success else "probe call was slow")
+            return
+        if self.state != self.CLOSED:
+            return
+
+        now = time.monotonic()
+        self._calls.append((now, not success, slow))
+        self._failures += not success
+        self._slow += slow
+        while self._calls and (len(self._calls) > self.window_calls or now - self._calls[0][0] > self.window):
+            _, failed, was_slow = self._calls.popleft()
+            self._failures -= failed
+            self._slow -= was_slow
+
+        calls = len(self._calls)
+        if calls >= self.min_calls:
+            if self._failures / calls >= self.error_rate:
+                self._open(f"{self._failures}/{calls} calls failed")
+            elif self._slow / calls >= self.slow_rate:
+                self._open(f"{self._slow}/{calls} calls took over {self.slow_call_seconds:g}s")
+
+    def abandon(self, ticket: BreakerTicket):
+        """The call was cut short for reasons of its own; if it was the probe,
+        lets another one through"""
+        if ticket.probe and ticket.generation == self._generation:
+            self._probing = False
+
+    def _open(self, reason: str):
+        self.state = self.OPEN
+        self._generation += 1
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        print(f"LLM circuit opened: {reason}")
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._generation += 1
+        self._calls.clear()
+        self._failures = self._slow = 0
+        print("LLM circuit closed")
+
+    def reset(self):
+        """Back to closed with an empty window and zeroed counters"""
+        self.state = self.CLOSED
+        self._calls.clear()
+        self._failures = self._slow = 0
+        self._probing = False
+        self._generation += 1
+        self.opened = self.rejected = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "state": self.state,
+            "window_calls": len(self._calls),
+            "window_failures": self._failures,
+            "window_slow_calls": self._slow,
+            "times_opened": self.opened,
+            "rejected_calls": self.rejected
+        }
+
+
+class LatencyWindow:
+    """Recent successful call latencies per purpose, for the hedge delay"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20, percentile: float = 0.95,
+                 recompute_every: int = 10):
+        self.size = size
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.recompute_every = recompute_every
+        self._samples: Dict[str, Deque[float]] = {}
+        # purpose -> (samples added since the last sort, cached percentile)
+        self._cached: Dict[str, Tuple[int, Optional[float]]] = {}
+
+    def add(self, purpose: str, elapsed: float):
+        samples = self._samples.get(purpose)
+        if samples is None:
+            samples = self._samples[purpose] = deque(maxlen=self.size)
+        samples.append(elapsed)
+        added, value = self._cached.get(purpose, (0, None))
+        self._cached[purpose] = (added + 1, value)
+
+    def quantile(self, purpose: str) -> Optional[float]:
+        """The configured percentile, re-sorted every recompute_every samples"""
+        samples = self._samples.get(purpose)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        added, value = self._cached[purpose]
+        if value is None or added >= self.recompute_every:
+            ordered = sorted(samples)
+            value = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+            self._cached[purpose] = (0, value)
+        return value
+
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: float,
+                 on_hedge: Optional[Callable[[], None]] = None) -> T:
+    """Run call(); if it has not finished after delay seconds, start a second
+    attempt and return whichever succeeds first, cancelling the other"""
+    tasks = [asyncio.ensure_future(call())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+        if on_hedge:
+            on_hedge()
+        tasks.append(asyncio.ensure_future(call()))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+# Monotonic deadline of the turn being handled, if it has a latency budget
+turn_deadline: ContextVar[Optional[float]] = ContextVar("turn_deadline", default=None)
+
+
+def call_timeout(timeout: float, min_seconds: float = 0.05) -> float:
+    """The call timeout capped by what is left of the turn's budget"""
+    deadline = turn_deadline.get()
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining < min_seconds:
+        raise LatencyBudgetExceeded("Turn latency budget exhausted")
+    return min(timeout, remaining)
+
+
+DEGRADED_DATA_REPLY = ("I can't show your {what} right now because our assistant service is temporarily "
+                       "unavailable. Please try again in a few minutes.")
+DEGRADED_ERROR_REPLY = ("I apologize, but I'm having trouble processing your request right now. "
+                        "Could you please try again?")
+
+# Replies used when the LLM cannot be reached, per handler action
+DEGRADED_REPLIES = {
+    "greeting": "Hello! I can help with balances, cards, transactions, spending, loans and blocking a card. "
+                "What would you like to do?",
+    "goodbye": "Thank you for banking with us. Goodbye!",
+    "general_help": "I can help with balances, cards, transactions, spending, loans and blocking a card. "
+                    "What would you like to do?",
+    "show_balance": DEGRADED_DATA_REPLY.format(what="balances"),
+    "show_cards": DEGRADED_DATA_REPLY.format(what="cards"),
+    "show_transactions": DEGRADED_DATA_REPLY.format(what="transactions"),
+    "show_spending_summary": DEGRADED_DATA_REPLY.format(what="spending summary"),
+    "show_loans": DEGRADED_DATA_REPLY.format(what="loan applications"),
+    "no_active_cards": "You have no active cards to block.",
+    "select_card_to_block": "Which card would you like to block? Reply with its number:\n{cards}",
+    "invalid_card_selection": "I couldn't match that to one of your cards. Reply with its number or its "
+                              "last 4 digits:\n{cards}",
+    "ask_dob_verification": "To verify your identity, please enter your date of birth (YYYY-MM-DD).",
+    "wrong_dob_retry": "That date of birth doesn't match our records. Please try once more (YYYY-MM-DD).",
+    "security_verification_failed": "We couldn't verify your identity, so the request has been cancelled.",
+    "ask_block_reason": "Thank you, you're verified. Why would you like to block this card, for example "
+                        "lost or stolen?",
+    "reason_too_short": "Please give a short reason for blocking the card.",
+    "final_confirmation": "Please confirm: block card ending {last4}? Reply yes to block it or no to cancel.",
+    "block_successful_verified": "Your card ending {last4} is now blocked.",
+    "block_cancelled": "Okay, your card has not been blocked.",
+    "card_blocking_help": "I can block a card for you. Just say \"block my card\".",
+    "card_application_help": "You can apply for a new card in online banking or at any branch.",
+    "loan_application_help": "You can apply for a loan in online banking or at any branch.",
+}
+
+
+def _last4(card: Optional[Dict[str, Any]]) -> str:
+    return str((card or {}).get("card_number", ""))[-4:] or "unknown"
+
+
+def degraded_reply(system_data: Optional[Dict[str, Any]]) -> str:
+    """Templated reply for a handler action, used when the LLM is unavailable"""
+    system_data = system_data or {}
+    template = DEGRADED_REPLIES.get(system_data.get("action"))
+    if template is None:
+        return DEGRADED_ERROR_REPLY
+    cards = system_data.get("active_cards") or []
+    return template.format(
+        cards="\n".join(f"{index}. {str(card.get('card_type', '')).title()} card ending {_last4(card)}"
+                        for index, card in enumerate(cards, 1)),
+        last4=_last4(system_data.get("selected_card"))
+    )
+
+
+def create_circuit_breaker(llm_timeout: float) -> CircuitBreaker:
+    return CircuitBreaker(
+        window=float(os.getenv("LLM_BREAKER_WINDOW", "30")),
+        window_calls=int(os.getenv("LLM_BREAKER_WINDOW_CALLS", "20")),
+        min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS", "10")),
+        error_rate=float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5")),
+        slow_call_seconds=float(os.getenv("LLM_BREAKER_SLOW_SECONDS", str(llm_timeout / 2))),
+        slow_rate=float(os.getenv("LLM_BREAKER_SLOW_RATE", "0.8")),
+        open_seconds=float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "10")),
+        enabled=os.getenv("LLM_CIRCUIT_BREAKER", "true").lower() in ("1", "true", "yes")
+    )
@@ -0,0 +1,371 @@
+"""Table definitions, versioned migrations and the transaction rollup SQL.
+
+Plain constants and functions over a sqlite3 connection, so tools that write
+the database file directly (bulk_loader.py) can use them without importing
+database.py and its services.
+"""
+import sqlite3
+
+# Base tables, created if missing before migrations run
+SCHEMA_TABLES = [
+    # Users table
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id TEXT PRIMARY KEY,
+        full_name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        phone TEXT,
+        monthly_income REAL,
+        employment_status TEXT,
+        credit_score INTEGER DEFAULT 790,
+        date_of_birth TEXT DEFAULT '1990-01-01',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Accounts table
+    """
+    CREATE TABLE IF NOT EXISTS accounts (
+        account_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        account_number TEXT UNIQUE NOT NULL,
+        account_type TEXT NOT NULL,
+        balance REAL DEFAULT 0.0,
+        status TEXT DEFAULT 'active',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    )
+    """,
+    # Cards table with additional blocking fields
+    """
+    CREATE TABLE IF NOT EXISTS cards (
+        card_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        account_id TEXT NOT NULL,
+        card_number TEXT UNIQUE NOT NULL,
+        card_type TEXT NOT NULL,
+        card_status TEXT DEFAULT 'active',
+        credit_limit REAL DEFAULT 0,
+        available_credit REAL DEFAULT 0,
+        blocked_at TEXT,
+        block_reason TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (user_id),
+        FOREIGN KEY (account_id) REFERENCES accounts (account_id)
+    )
+    """,
+    # Transactions table
+    """
+    CREATE TABLE IF NOT EXISTS transactions (
+        transaction_id TEXT PRIMARY KEY,
+        account_id TEXT NOT NULL,
+        transaction_type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        description TEXT,
+        merchant_name TEXT,
+        transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        status TEXT DEFAULT 'completed',
+        FOREIGN KEY (account_id) REFERENCES accounts (account_id)
+    )
+    """,
+    # Loan applications table
+    """
+    CREATE TABLE IF NOT EXISTS loan_applications (
+        application_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        loan_type TEXT NOT NULL,
+        loan_amount REAL NOT NULL,
+        loan_purpose TEXT,
+        application_status TEXT DEFAULT 'pending',
+        interest_rate REAL,
+        loan_term_months INTEGER,
+        monthly_payment REAL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    )
+    """,
+    # Bill payments table
+    """
+    CREATE TABLE IF NOT EXISTS bill_payments (
+        payment_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        bill_type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        due_date DATE,
+        payment_date TIMESTAMP,
+        status TEXT DEFAULT 'pending',
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    )
+    """,
+]
+
+# Seed keywords for spending categories. A transaction gets the category of
+# the longest keyword found in its merchant name or description, else "other".
+SPENDING_CATEGORY_KEYWORDS = {
+    "groceries": ("grocery", "supermarket", "freshmart", "whole foods", "trader joe", "aldi", "kroger"),
+    "fuel": ("gas station", "fuel", "shell", "chevron", "exxon", "petrol"),
+    "housing": ("rent", "property management", "mortgage", "landlord"),
+    "dining": ("restaurant", "cafe", "coffee", "starbucks", "mcdonald", "pizza", "doordash"),
+    "utilities": ("electric", "water bill", "utility", "internet", "telecom"),
+    "shopping": ("amazon", "walmart", "target", "best buy"),
+    "entertainment": ("netflix", "spotify", "cinema", "theater"),
+    "travel": ("airline", "hotel", "uber", "lyft", "airbnb"),
+    "transfers": ("transfer",),
+    "income": ("salary", "payroll", "direct deposit"),
+}
+
+_ROLLUP_KEY = "account_id, day, transaction_type, category, merchant_name"
+
+def _rollup_category(row: str) -> str:
+    return f"""COALESCE((
+        SELECT category FROM spending_categories
+        WHERE lower(COALESCE({row}.merchant_name, '') || ' ' || COALESCE({row}.description, ''))
+              LIKE '%' || keyword || '%'
+        ORDER BY length(keyword) DESC LIMIT 1
+    ), 'other')"""
+
+def _rollup_key_values(row: str) -> str:
+    return (f"{row}.account_id, COALESCE(date({row}.transaction_date), ''), {row}.transaction_type, "
+            f"{_rollup_category(row)}, COALESCE({row}.merchant_name, '')")
+
+def _rollup_add(row: str) -> str:
+    return f"""
+        INSERT INTO transaction_rollups ({_ROLLUP_KEY}, total_amount, transaction_count)
+        VALUES ({_rollup_key_values(row)}, {row}.amount, 1)
+        ON CONFLICT ({_ROLLUP_KEY}) DO UPDATE SET
+            total_amount = total_amount + excluded.total_amount,
+            transaction_count = transaction_count + 1;"""
+
+def _rollup_remove(row: str) -> str:
+    return f"""
+        UPDATE transaction_rollups
+        SET total_amount = total_amount - {row}.amount, transaction_count = transaction_count - 1
+        WHERE ({_ROLLUP_KEY}) = ({_rollup_key_values(row)});
+        DELETE FROM transaction_rollups
+        WHERE ({_ROLLUP_KEY}) = ({_rollup_key_values(row)}) AND transaction_count <= 0;"""
+
+# Triggers keeping the rollups in step with every insert, delete and update
+# of a transaction, inside the writer's own transaction
+ROLLUP_TRIGGERS = {
+    "trg_transactions_rollup_insert": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_insert AFTER INSERT ON transactions
+    BEGIN{_rollup_add("NEW")}
+    END""",
+    "trg_transactions_rollup_delete": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_delete AFTER DELETE ON transactions
+    BEGIN{_rollup_remove("OLD")}
+    END""",
+    "trg_transactions_rollup_update": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_update
+    AFTER UPDATE OF account_id, transaction_type, amount, description, merchant_name, transaction_date
+    ON transactions
+    BEGIN{_rollup_remove("OLD")}{_rollup_add("NEW")}
+    END""",
+}
+
+def _rollup_month(value: str) -> str:
+    return f"COALESCE(substr(date({value}), 1, 7), '')"
+
+def _rollup_insert(source: str, ctes: str = "") -> str:
+    """Aggregate the rows of source into the rollups; categories are looked
+    up once per distinct merchant and description, not once per row"""
+    return f"""
+    WITH {ctes}categories AS MATERIALIZED (
+        SELECT merchant_name, description, {_rollup_category("m")} AS category
+        FROM (SELECT DISTINCT merchant_name, description FROM {source}) m
+    )
+    INSERT INTO transaction_rollups ({_ROLLUP_KEY}, total_amount, transaction_count)
+    SELECT t.account_id, COALESCE(date(t.transaction_date), ''), t.transaction_type, c.category,
+           COALESCE(t.merchant_name, ''), SUM(t.amount), COUNT(*)
+    FROM {source} t
+    JOIN categories c ON c.merchant_name IS t.merchant_name AND c.description IS t.description
+    GROUP BY 1, 2, 3, 4, 5
+    """
+
+# Recomputes every rollup from the raw rows, e.g. after the category
+# keywords change or after loading into an empty table with the triggers dropped
+ROLLUP_REBUILD_STATEMENTS = [
+    "DELETE FROM transaction_rollups",
+    _rollup_insert("transactions"),
+]
+
+# Recomputes only the months of the accounts listed in bulk_load_rollup_months,
+# after a delta load with the triggers dropped, then clears the list
+ROLLUP_REBUILD_MONTHS_STATEMENTS = [
+    """
+    DELETE FROM transaction_rollups
+    WHERE account_id IN (SELECT account_id FROM bulk_load_rollup_months)
+      AND substr(day, 1, 7) IN (
+          SELECT month FROM bulk_load_rollup_months k WHERE k.account_id = transaction_rollups.account_id)
+    """,
+    _rollup_insert("affected", f"""affected AS MATERIALIZED (
+        SELECT t.* FROM transactions t
+        WHERE t.account_id IN (SELECT account_id FROM bulk_load_rollup_months)
+          AND {_rollup_month("t.transaction_date")} IN (
+              SELECT month FROM bulk_load_rollup_months k WHERE k.account_id = t.account_id)
+    ),
+    """),
+    "DELETE FROM bulk_load_rollup_months",
+]
+
+# Records the rollup month of a transaction row (VALUES) or of the stored row
+# it is about to replace (SELECT) for ROLLUP_REBUILD_MONTHS_STATEMENTS
+ROLLUP_MONTH_INSERT = ("INSERT OR IGNORE INTO bulk_load_rollup_months (account_id, month) "
+                       f"VALUES (?, {_rollup_month('?')})")
+ROLLUP_REPLACED_MONTH_INSERT = ("INSERT OR IGNORE INTO bulk_load_rollup_months (account_id, month) "
+                                f"SELECT account_id, {_rollup_month('transaction_date')} "
+                                "FROM transactions WHERE transaction_id = ?")
+
+def _bump_data_version(user_id: str) -> str:
+    return f"""
+        INSERT INTO user_data_versions (user_id, version) {user_id}
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1;"""
+
+def _bump_account_owner(row: str) -> str:
+    return _bump_data_version(f"SELECT user_id, 1 FROM accounts WHERE account_id = {row}.account_id")
+
+# Triggers bumping the owner's data version whenever an account or one of
+# its transactions changes, whoever writes it (core banking feeds, bulk
+# loads, scripts), so cached balance replies are never served stale
+DATA_VERSION_TRIGGERS = {
+    "trg_accounts_data_version_insert": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_accounts_data_version_insert AFTER INSERT ON accounts
+    BEGIN{_bump_data_version("VALUES (NEW.user_id, 1)")}
+    END""",
+    "trg_accounts_data_version_update": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_accounts_data_version_update AFTER UPDATE ON accounts
+    BEGIN{_bump_data_version("VALUES (OLD.user_id, 1)")}{_bump_data_version("VALUES (NEW.user_id, 1)")}
+    END""",
+    "trg_accounts_data_version_delete": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_accounts_data_version_delete AFTER DELETE ON accounts
+    BEGIN{_bump_data_version("VALUES (OLD.user_id, 1)")}
+    END""",
+    "trg_transactions_data_version_insert": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_data_version_insert AFTER INSERT ON transactions
+    BEGIN{_bump_account_owner("NEW")}
+    END""",
+    "trg_transactions_data_version_update": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_data_version_update AFTER UPDATE ON transactions
+    BEGIN{_bump_account_owner("OLD")}{_bump_account_owner("NEW")}
+    END""",
+    "trg_transactions_data_version_delete": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_data_version_delete AFTER DELETE ON transactions
+    BEGIN{_bump_account_owner("OLD")}
+    END""",
+}
+
+# First word of the lowercased merchant name ("shell" for "Shell Gas Station").
+# Queries must repeat this expression verbatim for SQLite to use its index.
+MERCHANT_KEY_SQL = "lower(substr(trim(merchant_name), 1, instr(trim(merchant_name) || ' ', ' ') - 1))"
+
+# Versioned schema migrations, applied in order and tracked in PRAGMA user_version
+SCHEMA_MIGRATIONS = [
+    (1, "Indexes for per-user and per-account lookups in recency order", [
+        "CREATE INDEX IF NOT EXISTS idx_accounts_user_created ON accounts (user_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_cards_user_created ON cards (user_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions (account_id, transaction_date DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_loan_applications_user_applied ON loan_applications (user_id, applied_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_bill_payments_user_due ON bill_payments (user_id, due_date)",
+    ]),
+    (2, "Per-user data versions for invalidating cached replies", [
+        """
+        CREATE TABLE IF NOT EXISTS user_data_versions (
+            user_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+    ]),
+    (3, "Keyset pagination index for transaction history", [
+        "CREATE INDEX IF NOT EXISTS idx_transactions_account_date_id ON transactions "
+        "(account_id, transaction_date DESC, transaction_id DESC)",
+        # Superseded by the index above, which has the same leading columns
+        "DROP INDEX IF EXISTS idx_transactions_account_date",
+    ]),
+    (4, "Per-account daily spending rollups by category and merchant", [
+        """
+        CREATE TABLE IF NOT EXISTS spending_categories (
+            keyword TEXT PRIMARY KEY,
+            category TEXT NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO spending_categories (keyword, category) VALUES " + ", ".join(
+            f"('{keyword}', '{category}')"
+            for category, keywords in SPENDING_CATEGORY_KEYWORDS.items() for keyword in keywords
+        ),
+        # Clustered on the key, so a date range of one account is a single
+        # range scan that never touches the transactions table
+        """
+        CREATE TABLE IF NOT EXISTS transaction_rollups (
+            account_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            transaction_type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            merchant_name TEXT NOT NULL,
+            total_amount REAL NOT NULL DEFAULT 0,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (account_id, day, transaction_type, category, merchant_name)
+        ) WITHOUT ROWID
+        """,
+        *ROLLUP_TRIGGERS.values(),
+        *ROLLUP_REBUILD_STATEMENTS,
+    ]),
+    (5, "Bulk load progress and schema objects deferred during a load", [
+        """
+        CREATE TABLE IF NOT EXISTS bulk_load_progress (
+            path TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            file_mtime REAL NOT NULL,
+            byte_offset INTEGER NOT NULL DEFAULT 0,
+            rows_loaded INTEGER NOT NULL DEFAULT 0,
+            started_at TEXT,
+            updated_at TEXT,
+            completed_at TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS bulk_load_deferred (
+            name TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            sql TEXT NOT NULL
+        )
+        """,
+    ]),
+    (6, "Account months whose rollups a delta bulk load has to recompute", [
+        """
+        CREATE TABLE IF NOT EXISTS bulk_load_rollup_months (
+            account_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            PRIMARY KEY (account_id, month)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (7, "Bump data versions on every account and transaction write", [
+        *DATA_VERSION_TRIGGERS.values(),
+    ]),
+    (8, "Keyset pagination indexes for transaction history filtered by type or merchant", [
+        "CREATE INDEX IF NOT EXISTS idx_transactions_account_type_date_id ON transactions "
+        "(account_id, transaction_type, transaction_date DESC, transaction_id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_account_merchant_date_id ON transactions "
+        f"(account_id, {MERCHANT_KEY_SQL}, transaction_date DESC, transaction_id DESC)",
+    ]),
+]
+
+
+def create_tables(conn: sqlite3.Connection):
+    with conn:
+        for statement in SCHEMA_TABLES:
+            conn.execute(statement)
+
+
+def apply_migrations(conn: sqlite3.Connection):
+    """Apply migrations newer than the database's user_version"""
+    current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, description, statements in SCHEMA_MIGRATIONS:
+        if version <= current_version:
+            continue
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+        print(f"Applied migration {version}: {description}")
@@ -1,75 +1,279 @@
+import asyncio
 import json
 import os
 import re
-from typing import List, Dict, Any, Optional, Tuple
-from groq import Groq
+import time
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
 from datetime import datetime
 from models import *
-from database import user_service, card_service, loan_service, account_service
+from database import (user_service, card_service, loan_service, account_service, spending_service,
+                      prefetched_reads)
+from session_store import SessionStore, create_session_store
+from history import ConversationHistory, create_conversation_history, format_entry
+from llm import ChatCompletion, LLMRouter, create_llm_router
+from cache import ResponseCache
+from metrics import (DB_PREFETCH, LLM_FALLBACKS, LLM_HEDGES, LLM_LATENCY, LLM_SLOT_WAIT, LLM_TOKENS, STAGE_LATENCY,
+                     TURN_LATENCY, turn_labels)
+from resilience import (BreakerTicket, CircuitOpenError, LatencyBudgetExceeded, LatencyWindow, call_timeout,
+                        create_circuit_breaker, degraded_reply, hedged, turn_deadline)
+from templates import TemplateRenderer, create_template_renderer
+from tracing import tracer
+from prompts import (ANALYSIS_PREFIX, FUSED_PREFIX, RESPONSE_PREFIX, SUMMARY_PREFIX, build_messages,
+                     render_collected_data, render_system_data)
+from intent_classifier import (keyword_classifier, create_intent_router, extract_spending_category,
+                               extract_transaction_filters, CONTINUATION_PATTERN)
+
+# Strips emojis and symbols from generated replies; applied per character so
+# it can run on streamed chunks as well as on complete responses
+RESPONSE_CLEANUP_PATTERN = re.compile(r'[^\w\s\-.,!?:;()\[\]{}"]')
+
+# When set for the current turn, generate_response streams the reply and
+# forwards each cleaned chunk to this callback
+response_stream: ContextVar[Optional[Callable[[str], Awaitable[None]]]] = ContextVar("response_stream", default=None)
+
+# LLM call and token accounting for the turn being handled
+turn_usage: ContextVar[Optional[Dict[str, int]]] = ContextVar("turn_usage", default=None)
+
+# Read-only intents whose handler data does not depend on the classified
+# intent's details, so it can be fetched before the single fused LLM call
+FUSED_INTENTS = {
+    Intent.BALANCE_INQUIRY, Intent.CARD_INQUIRY, Intent.TRANSACTION_HISTORY, Intent.LOAN_INQUIRY,
+    Intent.GREETING, Intent.GOODBYE, Intent.GENERAL_INQUIRY
+}
+
+# Handler action of the fused intents that show banking data
+FUSED_ACTIONS = {
+    Intent.BALANCE_INQUIRY: "show_balance", Intent.CARD_INQUIRY: "show_cards",
+    Intent.TRANSACTION_HISTORY: "show_transactions", Intent.LOAN_INQUIRY: "show_loans"
+}
+
+# Read-only intents whose replies depend only on the user's banking data.
+# Transaction history is left out: its replies depend on the requested
+# filters and on the paging cursor kept in the session.
+CACHEABLE_INTENTS = {
+    Intent.BALANCE_INQUIRY, Intent.CARD_INQUIRY, Intent.LOAN_INQUIRY
+}
+
+# Reads each handler starts with, started while the turn's intent is still
+# being analysed: by the fallback classifier's intent when idle, by the
+# workflow step otherwise. Names match the ReadCoalescer keys.
+PREFETCH_INTENT_READS = {
+    Intent.BALANCE_INQUIRY: ("get_user_accounts",),
+    Intent.TRANSACTION_HISTORY: ("get_user_accounts",),
+    Intent.CARD_INQUIRY: ("get_user_cards",),
+    Intent.CARD_BLOCKING: ("get_user_cards",),
+    Intent.LOAN_INQUIRY: ("get_user_loan_applications",),
+}
+PREFETCH_STEP_READS = {
+    "dob_verification": ("get_user",),
+}
+PREFETCH_LOADERS = {
+    "get_user": user_service.get_user,
+    "get_user_accounts": account_service.get_user_accounts,
+    "get_user_cards": card_service.get_user_cards,
+    "get_user_loan_applications": loan_service.get_user_loan_applications,
+}
+
+# Transactions shown per page of history
+TRANSACTION_PAGE_SIZE = int(os.getenv("TRANSACTION_PAGE_SIZE", "5"))
+
+# Suspended workflows kept on a session's interruption stack
+MAX_INTERRUPTIONS = 5
 
 class ConversationAI:
     def __init__(self):
-        self.groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        self.model = "meta-llama/llama-4-maverick-17b-128e-instruct"
-        self.contexts: Dict[str, ConversationContext] = {}
+        # Per-call timeout (seconds) and max in-flight LLM calls per worker
+        self.llm_timeout = float(os.getenv("LLM_TIMEOUT", "20"))
+        self.llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+        # Provider and model per task (see llm.py)
+        self.llm: LLMRouter = create_llm_router(self.llm_timeout, self.llm_max_concurrency)
+        self.llm_semaphore = asyncio.Semaphore(self.llm_max_concurrency)
+        # Fails calls fast while the LLM is erroring or slow (see resilience.py)
+        self.breaker = create_circuit_breaker(self.llm_timeout)
+        # Send a second request when a call outlasts the recent p95 for its purpose
+        self.hedge_requests = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes")
+        self.hedge_min_delay = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.1"))
+        self.latencies = LatencyWindow()
+        # Data-only replies rendered from templates instead of the LLM (see templates.py)
+        self.templates: TemplateRenderer = create_template_renderer()
+        self.sessions: SessionStore = create_session_store()
+        self.history: ConversationHistory = create_conversation_history(summarizer=self.summarize_history)
+        # Token budget for the history included in each prompt
+        self.history_prompt_tokens = int(os.getenv("HISTORY_PROMPT_TOKENS", "300"))
+        # Token budget for system and collected data serialized into a prompt
+        self.data_prompt_tokens = int(os.getenv("PROMPT_DATA_TOKENS", "1000"))
+
+    async def _chat_completion(self, purpose: str = "response", **kwargs) -> ChatCompletion:
+        """Run a chat completion on the task's provider under the concurrency limit.
+
+        purpose (analysis, fused, response or summary) picks the provider and
+        model and labels the call's metrics.
+        Raises CircuitOpenError or LatencyBudgetExceeded without calling the LLM
+        when the circuit breaker is open or the turn's budget is spent.
+        """
+        timeout, ticket = self._call_timeout(purpose)
+        route = self.llm.route(purpose)
+        # When the provider first got the request (None while waiting for a slot)
+        provider_started = None
+
+        async def _request():
+            nonlocal provider_started
+            waited = time.perf_counter()
+            async with self.llm_semaphore:
+                LLM_SLOT_WAIT.observe(time.perf_counter() - waited)
+                requested = time.perf_counter()
+                if provider_started is None:
+                    provider_started = requested
+                response = await route.provider.complete(route.model, timeout=timeout, **kwargs)
+                self.latencies.add(purpose, time.perf_counter() - requested)
+                return response
+
+        # Waiting for a slot counts against the timeout so an overloaded
+        # worker falls back quickly instead of queueing requests forever
+        async def _call():
+            delay = self.latencies.quantile(purpose) if self.hedge_requests else None
+            if delay is None:
+                return await _request()
+            return await hedged(_request, max(delay, self.hedge_min_delay), on_hedge=lambda: LLM_HEDGES.inc(purpose))
+
+        started = time.perf_counter()
+        outcome = "error"
+        with tracer.span("llm.chat", purpose=purpose, provider=route.provider.name, model=route.model) as span:
+            try:
+                response = await asyncio.wait_for(_call(), timeout=timeout)
+                outcome = "ok"
+            except asyncio.TimeoutError:
+                outcome = "timeout" if timeout >= self.llm_timeout else "budget"
+                raise
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                finished = time.perf_counter()
+                self._record_outcome(purpose, ticket, outcome, finished - started,
+                                     finished - provider_started if provider_started is not None else None)
+                span.set_attribute("outcome", outcome)
+            prompt_tokens, completion_tokens = self._record_usage(response, purpose)
+            span.set_attributes({"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens})
+        return response
+
+    def _call_timeout(self, purpose: str) -> Tuple[float, BreakerTicket]:
+        """Timeout and breaker ticket for the next call, or an error when it must not be made"""
+        try:
+            timeout = call_timeout(self.llm_timeout)
+        except LatencyBudgetExceeded:
+            self._record_fallback(purpose, "budget")
+            raise
+        ticket = self.breaker.allow()
+        if ticket is None:
+            self._record_fallback(purpose, "circuit_open")
+            raise CircuitOpenError("LLM circuit breaker is open")
+        return timeout, ticket
+
+    def _record_outcome(self, purpose: str, ticket: BreakerTicket, outcome: str, elapsed: float,
+                        provider_elapsed: Optional[float]):
+        """Feed a finished call to the latency histogram and the circuit breaker.
+
+        provider_elapsed is how long the provider had the request, or None if
+        the call ended while still waiting for a slot.
+        """
+        LLM_LATENCY.observe(elapsed, purpose, outcome)
+        if outcome == "cancelled" or provider_elapsed is None:
+            # Cut short by the turn or by local queueing, not by the LLM
+            self.breaker.abandon(ticket)
+        elif outcome == "budget":
+            # The turn's deadline passed while the provider still had the
+            # request: a slow call, even if the budget left was short
+            self.breaker.record(ticket, True, provider_elapsed, slow=True)
+        else:
+            # "timeout" is LLM_TIMEOUT running out: a failed call
+            self.breaker.record(ticket, outcome == "ok", provider_elapsed)
+        if outcome != "ok" and outcome != "cancelled":
+            self._record_fallback(purpose, outcome)
+
+    def _record_fallback(self, purpose: str, reason: str):
+        LLM_FALLBACKS.inc(purpose, reason)
+        usage = turn_usage.get()
+        if usage is not None:
+            usage["fallbacks"] += 1
+
+    def _record_usage(self, response: Optional[ChatCompletion] = None, purpose: str = "response"):
+        """Add one LLM call (and its token usage if reported) to the turn's
+        totals and to the token counters; returns (prompt, completion) tokens"""
+        prompt_tokens = completion_tokens = 0
+        if response is not None:
+            prompt_tokens = response.prompt_tokens
+            completion_tokens = response.completion_tokens
+            intent, step = turn_labels.get()
+            LLM_TOKENS.inc(purpose, "prompt", intent, step, amount=prompt_tokens)
+            LLM_TOKENS.inc(purpose, "completion", intent, step, amount=completion_tokens)
+        usage = turn_usage.get()
+        if usage is not None:
+            usage["llm_calls"] += 1
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+        return prompt_tokens, completion_tokens
+
+    async def _stream_completion(self, purpose: str = "response", **kwargs):
+        """Stream a chat completion, yielding content chunks as they arrive"""
+        timeout, ticket = self._call_timeout(purpose)
+        route = self.llm.route(purpose)
+        started = time.perf_counter()
+        provider_started = None
+        outcome = "error"
+        # Not made current: the caller's own spans run between the chunks
+        span = tracer.span("llm.stream", purpose=purpose, provider=route.provider.name, model=route.model)
+        chunks = 0
+        try:
+            async with self.llm_semaphore:
+                provider_started = time.perf_counter()
+                LLM_SLOT_WAIT.observe(provider_started - started)
+                stream = route.provider.stream(route.model, timeout=timeout, **kwargs)
+                try:
+                    # The first chunk must arrive within the timeout; the rest follow at the model's pace
+                    try:
+                        delta = await asyncio.wait_for(
+                            stream.__anext__(), timeout=max(0.0, timeout - (time.perf_counter() - started))
+                        )
+                    except StopAsyncIteration:
+                        delta = None
+                    self._record_usage(purpose=purpose)
+                    span.set_attribute("first_chunk_ms", round((time.perf_counter() - started) * 1000, 3))
+                    while delta is not None:
+                        chunks += 1
+                        yield delta
+                        delta = await stream.__anext__()
+                except StopAsyncIteration:
+                    pass
+                finally:
+                    await stream.aclose()
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            outcome = "timeout" if timeout >= self.llm_timeout else "budget"
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        finally:
+            finished = time.perf_counter()
+            self._record_outcome(purpose, ticket, outcome, finished - started,
+                                 finished - provider_started if provider_started is not None else None)
+            span.set_attributes({"outcome": outcome, "chunks": chunks})
+            span.end()
 
     async def analyze_intent_and_entities(self, message: str, context: ConversationContext) -> Dict[str, Any]:
         """AI-powered intent and entity analysis with context awareness"""
-        history_text = ""
-        if context.conversation_history:
-            recent_history = context.conversation_history[-3:]
-            history_text = "\n".join([f"{msg['role']}: {msg['message']}" for msg in recent_history])
-
-        current_intent_text = context.current_intent.value if context.current_intent else "none"
-        current_state = context.conversation_state.value if context.conversation_state else "idle"
-        collected_data = json.dumps(context.collected_data) if context.collected_data else "{}"
-
-        prompt = f"""
-You are an expert banking conversation analyst. Analyze the user message and provide structured output.
-
-CONVERSATION CONTEXT:
-- Current Intent: {current_intent_text}
-- Current State: {current_state}
-- Collected Data: {collected_data}
-- Recent History: {history_text}
-
-USER MESSAGE: "{message}"
-
-AVAILABLE INTENTS:
-- loan_application: User wants to apply for a new loan
-- loan_inquiry: User wants to check existing loan applications or loan status
-- card_blocking: User wants to block/freeze a card
-- card_application: User wants to apply for a new card
-- card_inquiry: User asking about existing cards or card status
-- balance_inquiry: User wants to check account balance
-- transaction_history: User wants to see transactions
-- general_inquiry: General questions or greetings
-- greeting: Hello, hi, good morning etc.
-- goodbye: Bye, see you later etc.
-
-Respond ONLY with valid JSON:
-{{
-"intent": "intent_name",
-"entities": {{
-"amount": "extracted_amount_if_any",
-"card_type": "debit/credit_if_mentioned",
-"loan_purpose": "purpose_if_mentioned",
-"card_last_4": "last_4_digits_if_mentioned"
-}},
-"context_switch": true/false,
-"confidence": 0.0-1.0,
-"reasoning": "brief_explanation"
-}}
-"""
+        messages = self._analysis_messages(message, context)
 
         try:
-            response = self.groq_client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+            response = await self._chat_completion(
+                "analysis",
+                messages=messages,
                 temperature=0.1,
                 max_tokens=300
             )
-            analysis = json.loads(response.choices[0].message.content)
+            analysis = json.loads(response.content)
             entities = {k: v for k, v in analysis.get("entities", {}).items() if v and v != ""}
             return {
                 "intent": Intent(analysis["intent"]),
@@ -78,44 +282,101 @@ Respond ONLY with valid JSON:
                 "confidence": analysis.get("confidence", 0.5),
                 "reasoning": analysis.get("reasoning", "")
             }
+        except (CircuitOpenError, LatencyBudgetExceeded, asyncio.TimeoutError):
+            # Expected while the LLM is down or slow; counted in LLM_FALLBACKS
+            return self._fallback_analysis(message, context)
         except Exception as e:
-            print(f"AI Analysis Error: {e}")
+            print(f"AI Analysis Error: {type(e).__name__}: {e}")
             return self._fallback_analysis(message, context)
 
+    async def analyze_and_respond(self, message: str, context: ConversationContext,
+                                  system_data: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """Single LLM call returning intent analysis plus the user-facing reply"""
+        lines = [*self._context_lines(context, max_messages=4), "", f'USER MESSAGE: "{message}"']
+        if system_data:
+            lines.append(f"SYSTEM DATA (fetched for the expected intent): "
+                         f"{render_system_data(system_data, self.data_prompt_tokens)}")
+        messages = build_messages(FUSED_PREFIX, lines)
+
+        try:
+            response = await self._chat_completion(
+                "fused",
+                messages=messages,
+                temperature=0.2,
+                max_tokens=800
+            )
+            analysis = json.loads(response.content)
+            entities = {k: v for k, v in analysis.get("entities", {}).items() if v and v != ""}
+            reply = RESPONSE_CLEANUP_PATTERN.sub('', str(analysis.get("response") or "").strip())
+            return {
+                "intent": Intent(analysis["intent"]),
+                "entities": entities,
+                "context_switch": analysis.get("context_switch", False),
+                "confidence": analysis.get("confidence", 0.5),
+                "reasoning": analysis.get("reasoning", ""),
+                "response": reply or None
+            }
+        except (CircuitOpenError, LatencyBudgetExceeded, asyncio.TimeoutError):
+            # Expected while the LLM is down or slow; counted in LLM_FALLBACKS
+            return None
+        except Exception as e:
+            print(f"AI Fused Analysis Error: {type(e).__name__}: {e}")
+            return None
+
+    async def summarize_history(self, previous_summary: str, entries: List[Dict[str, Any]]) -> str:
+        """Fold older messages into the rolling conversation summary"""
+        messages = build_messages(SUMMARY_PREFIX, [
+            f"SUMMARY SO FAR: {previous_summary or 'none'}",
+            "",
+            "NEW MESSAGES:",
+            *(format_entry(entry) for entry in entries),
+            "",
+            f"Write the updated summary in at most {self.history.summary_max_tokens // 2} words."
+        ])
+        response = await self._chat_completion(
+            "summary",
+            messages=messages,
+            temperature=0.1,
+            max_tokens=self.history.summary_max_tokens
+        )
+        return RESPONSE_CLEANUP_PATTERN.sub('', response.content)
+
+    def _analysis_messages(self, message: str, context: ConversationContext) -> List[Dict[str, str]]:
+        return build_messages(ANALYSIS_PREFIX, [
+            *self._context_lines(context, max_messages=3),
+            "",
+            f'USER MESSAGE: "{message}"'
+        ])
+
+    def _response_messages(self, context: ConversationContext, user_message: str,
+                           system_data: Dict[str, Any] = None) -> List[Dict[str, str]]:
+        lines = [
+            *self._context_lines(context, max_messages=4, include_workflow_step=True),
+            "",
+            f'USER MESSAGE: "{user_message}"'
+        ]
+        if system_data:
+            lines.append(f"SYSTEM DATA: {render_system_data(system_data, self.data_prompt_tokens)}")
+        return build_messages(RESPONSE_PREFIX, lines)
+
+    def _context_lines(self, context: ConversationContext, max_messages: int,
+                       include_workflow_step: bool = False) -> List[str]:
+        """CONVERSATION CONTEXT block shared by the analysis and response prompts"""
+        lines = [
+            "CONVERSATION CONTEXT:",
+            f"- Current Intent: {context.current_intent.value if context.current_intent else 'none'}",
+            f"- Current State: {context.conversation_state.value if context.conversation_state else 'idle'}"
+        ]
+        if include_workflow_step:
+            lines.append(f"- Workflow Step: {context.workflow_step or 'none'}")
+        lines.append(f"- Collected Data: {render_collected_data(context.collected_data, self.data_prompt_tokens)}")
+        lines.append(f"- Recent History: {self.history.prompt_view(context, self.history_prompt_tokens, max_messages)}")
+        return lines
+
     def _fallback_analysis(self, message: str, context: ConversationContext) -> Dict[str, Any]:
         """Fallback pattern-based analysis"""
-        message_lower = message.lower()
-        
-        # Enhanced pattern-based intent recognition
-        if any(word in message_lower for word in ["block", "freeze", "stop", "lost", "stolen"]) and "card" in message_lower:
-            intent = Intent.CARD_BLOCKING
-        elif any(phrase in message_lower for phrase in ["apply for card", "new card", "create card", "get a card"]):
-            intent = Intent.CARD_APPLICATION
-        elif any(phrase in message_lower for phrase in ["my loans", "loan status", "loan applications", "check loan"]):
-            intent = Intent.LOAN_INQUIRY
-        elif any(word in message_lower for word in ["loan", "borrow"]) or "apply" in message_lower:
-            intent = Intent.LOAN_APPLICATION
-        elif any(word in message_lower for word in ["balance", "money", "amount"]):
-            intent = Intent.BALANCE_INQUIRY
-        elif any(word in message_lower for word in ["transaction", "history", "statement"]):
-            intent = Intent.TRANSACTION_HISTORY
-        elif "card" in message_lower:
-            intent = Intent.CARD_INQUIRY
-        elif any(word in message_lower for word in ["hello", "hi", "hey", "good morning"]):
-            intent = Intent.GREETING
-        else:
-            intent = Intent.GENERAL_INQUIRY
-
-        # Extract basic entities
-        entities = {}
-        amount_match = re.search(r"\$?(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)", message)
-        if amount_match:
-            entities["amount"] = amount_match.group(1).replace(",", "")
-        
-        if "debit" in message_lower:
-            entities["card_type"] = "debit"
-        elif "credit" in message_lower:
-            entities["card_type"] = "credit"
+        intent = keyword_classifier.classify(message)
+        entities = keyword_classifier.extract_entities(message)
 
         return {
             "intent": intent,
@@ -128,106 +389,352 @@ Respond ONLY with valid JSON:
     async def generate_response(self, context: ConversationContext, user_message: str,
                               system_data: Dict[str, Any] = None) -> str:
         """Generate AI-powered conversational responses"""
-        history_text = ""
-        if context.conversation_history:
-            recent_history = context.conversation_history[-4:]
-            history_text = "\n".join([f"{msg['role']}: {msg['message']}" for msg in recent_history])
-
-        current_intent = context.current_intent.value if context.current_intent else "none"
-        current_state = context.conversation_state.value if context.conversation_state else "idle"
-        workflow_step = context.workflow_step or "none"
-        collected_data = json.dumps(context.collected_data, indent=2) if context.collected_data else "{}"
-
-        system_context = ""
-        if system_data:
-            system_context = f"\nSYSTEM DATA: {json.dumps(system_data, indent=2)}"
-
-        prompt = f"""
-You are a professional AI Banking Assistant. Generate a helpful, conversational response.
-
-CONVERSATION CONTEXT:
-- Current Intent: {current_intent}
-- Conversation State: {current_state}
-- Workflow Step: {workflow_step}
-- Collected Data: {collected_data}
-- Recent History: {history_text}
-
-USER MESSAGE: "{user_message}"
-{system_context}
-
-RESPONSE GUIDELINES:
-1. Be conversational, helpful, and professional
-2. If collecting information, ask specific questions
-3. If showing data, format it clearly with numbers and lists
-4. Keep responses concise but informative
-5. DO NOT use any emojis, symbols, or special characters
-6. Use plain text formatting only
-7. Use "Number:" for lists instead of bullets
-
-Generate a natural, helpful response:
-"""
+        labels = (context.current_intent.value if context.current_intent else "none", context.workflow_step or "none")
+        if system_data and self.templates.selected(system_data.get("action")):
+            reply = await self._template_response(system_data, labels)
+            if reply is not None:
+                return reply
+        messages = self._response_messages(context, user_message, system_data)
 
         try:
-            response = self.groq_client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=500
-            )
+            on_delta = response_stream.get()
+            if on_delta:
+                with STAGE_LATENCY.time("response_generation", *labels):
+                    return await self._stream_response(messages, on_delta)
+
+            with STAGE_LATENCY.time("response_generation", *labels):
+                response = await self._chat_completion(
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=500
+                )
             
             # Clean response of any remaining emojis or symbols
-            response_text = response.choices[0].message.content.strip()
-            response_text = re.sub(r'[^\w\s\-.,!?:;()\[\]{}"]', '', response_text)
+            with STAGE_LATENCY.time("response_cleanup", *labels):
+                response_text = response.content.strip()
+                response_text = RESPONSE_CLEANUP_PATTERN.sub('', response_text)
             return response_text
+        except (CircuitOpenError, LatencyBudgetExceeded, asyncio.TimeoutError):
+            # Expected while the LLM is down or slow; counted in LLM_FALLBACKS
+            return self.templates.render(system_data) or degraded_reply(system_data)
         except Exception as e:
-            print(f"AI Response Generation Error: {e}")
-            return "I apologize, but I'm having trouble processing your request right now. Could you please try again?"
+            print(f"AI Response Generation Error: {type(e).__name__}: {e}")
+            return self.templates.render(system_data) or degraded_reply(system_data)
+
+    async def _template_response(self, system_data: Dict[str, Any], labels: Tuple[str, str]) -> Optional[str]:
+        """Render the action's template, sent as a single delta when streaming"""
+        with STAGE_LATENCY.time("response_template", *labels), \
+                tracer.span("response_template", action=system_data["action"]):
+            reply = self.templates.render(system_data)
+        on_delta = response_stream.get()
+        if reply is not None and on_delta:
+            await on_delta(reply)
+        return reply
+
+    async def _stream_response(self, messages: List[Dict[str, str]], on_delta: Callable[[str], Awaitable[None]]) -> str:
+        """Stream a response, cleaning each chunk before forwarding it"""
+        parts = []
+        pending_whitespace = ""
+        async for delta in self._stream_completion(
+            messages=messages,
+            temperature=0.3,
+            max_tokens=500
+        ):
+            text = RESPONSE_CLEANUP_PATTERN.sub('', delta)
+            if not parts:
+                text = text.lstrip()
+            # Hold back trailing whitespace so the final reply comes out stripped
+            text = pending_whitespace + text
+            chunk = text.rstrip()
+            pending_whitespace = text[len(chunk):]
+            if chunk:
+                parts.append(chunk)
+                await on_delta(chunk)
+        return "".join(parts)
 
 class AdvancedWorkflowEngine:
     def __init__(self, conversation_ai: ConversationAI):
         self.conversation_ai = conversation_ai
         self.active_workflows: Dict[str, Dict[str, Any]] = {}
+        # One LLM call per turn for read-only intents (see _fused_turn)
+        self.fused_pipeline = os.getenv("FUSED_PIPELINE", "false").lower() in ("1", "true", "yes")
+        self.pipeline_stats: Dict[str, Dict[str, float]] = {}
+        # Replies for read-only intents, invalidated by the user's data version
+        response_cache_ttl = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+        self.response_cache: Optional[ResponseCache] = ResponseCache(
+            capacity=int(os.getenv("RESPONSE_CACHE_SIZE", "10000")),
+            ttl=response_cache_ttl
+        ) if response_cache_ttl > 0 else None
+        # Local n-gram model that classifies confident idle-state turns without the LLM
+        self.intent_router = create_intent_router()
+        # Seconds a turn may spend in total on LLM calls (0 disables the budget)
+        self.turn_latency_budget = float(os.getenv("TURN_LATENCY_BUDGET", "15"))
+        # Overlap the handler's first DB reads with intent analysis
+        self.prefetch_reads = os.getenv("PREFETCH_READS", "true").lower() in ("1", "true", "yes")
+        self.prefetch_stats = {"started": 0, "unused": 0}
 
     async def handle_conversation(self, user_id: str, message: str, session_id: str) -> Dict[str, Any]:
         """Main conversation handling with AI integration"""
         # Get or create context
-        if session_id not in self.conversation_ai.contexts:
-            self.conversation_ai.contexts[session_id] = ConversationContext(
-                session_id=session_id,
-                user_id=user_id
-            )
-
-        context = self.conversation_ai.contexts[session_id]
+        context = await self.conversation_ai.sessions.get_or_create(session_id, user_id)
+        history = self.conversation_ai.history
+        history.apply_ready_summary(context)
 
         # Add message to history
-        context.conversation_history.append({
-            "role": "user",
-            "message": message,
-            "timestamp": datetime.now().isoformat()
-        })
+        history.append(context, "user", message)
 
-        # AI-powered intent and entity analysis
-        analysis = await self.conversation_ai.analyze_intent_and_entities(message, context)
+        usage = {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "fallbacks": 0}
+        usage_token = turn_usage.set(usage)
+        deadline_token = turn_deadline.set(
+            time.monotonic() + self.turn_latency_budget if self.turn_latency_budget > 0 else None
+        )
+        labels_token = turn_labels.set(
+            (context.current_intent.value if context.current_intent else "none", context.workflow_step or "none")
+        )
+        prefetched = {}
+        prefetch_token = prefetched_reads.set(prefetched)
+        # intent -> data version already looked up (and missed) in the reply cache this turn
+        cache_misses: Dict[Intent, int] = {}
+        started = time.perf_counter()
+        try:
+            with tracer.span("intent_analysis") as span:
+                analysis, response, mode = await self._cached_turn(context, message, cache_misses)
+                if analysis is None:
+                    self._start_prefetch(context, message, prefetched)
+                    analysis = self._continuation_analysis(context, message)
+                if analysis is None:
+                    analysis = self.intent_router.route(message, context)
+                    if analysis is not None:
+                        mode = "local_intent"
+                        self._remember_intent(context, message, analysis["intent"])
+                if analysis is None and self.fused_pipeline and response_stream.get() is None:
+                    analysis, response = await self._fused_turn(context, message)
+                    mode = "fused" if response else "fused_fallback"
 
-        # Handle context switching
-        if analysis["context_switch"]:
-            await self._handle_context_switch(context, analysis["intent"])
+                # AI-powered intent and entity analysis
+                if analysis is None:
+                    analysis = await self.conversation_ai.analyze_intent_and_entities(message, context)
+                    self._remember_intent(context, message, analysis["intent"])
+                span.set_attributes({
+                    "mode": mode, "intent": analysis["intent"].value, "confidence": analysis.get("confidence"),
+                    "context_switch": bool(analysis.get("context_switch"))
+                })
+            STAGE_LATENCY.observe(time.perf_counter() - started, "intent_analysis",
+                                  analysis["intent"].value, context.workflow_step or "none")
 
-        # Update current intent
-        context.current_intent = analysis["intent"]
+            # Handle context switching
+            if analysis["context_switch"]:
+                await self._handle_context_switch(context, analysis["intent"])
 
-        # Route to appropriate handler
-        response = await self._route_to_handler(context, message, analysis)
+            # Update current intent
+            context.current_intent = analysis["intent"]
+            turn_labels.set((context.current_intent.value, context.workflow_step or "none"))
+
+            # Route to appropriate handler
+            if response is None:
+                response = await self._route_to_handler(context, message, analysis, cache_misses)
+        finally:
+            self._finish_prefetch(prefetched)
+            prefetched_reads.reset(prefetch_token)
+            turn_labels.reset(labels_token)
+            turn_usage.reset(usage_token)
+            turn_deadline.reset(deadline_token)
+        elapsed = time.perf_counter() - started
+        if usage["fallbacks"]:
+            # Answered at least partly without the LLM
+            mode = "degraded"
+        self._record_pipeline_stats(mode, elapsed, usage)
+        TURN_LATENCY.observe(elapsed, mode, analysis["intent"].value)
 
         # Add response to history
-        context.conversation_history.append({
-            "role": "assistant",
-            "message": response["response"],
-            "timestamp": datetime.now().isoformat()
-        })
+        history.append(context, "assistant", response["response"])
 
+        await self.conversation_ai.sessions.save(context)
+        history.schedule_summary(context)
         return response
 
+    def _start_prefetch(self, context: ConversationContext, message: str, prefetched: Dict[Any, asyncio.Task]):
+        """Start the reads the handler will most likely make, so they run
+        while the LLM classifies the message"""
+        if not self.prefetch_reads:
+            return
+        if self._is_idle(context):
+            names = PREFETCH_INTENT_READS.get(self.conversation_ai._fallback_analysis(message, context)["intent"], ())
+        else:
+            names = PREFETCH_STEP_READS.get(context.workflow_step, ())
+        for name in names:
+            task = asyncio.create_task(self._prefetch(name, context.user_id))
+            # A failed read nobody asked for is not worth a warning
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            prefetched[(name, context.user_id)] = task
+            self.prefetch_stats["started"] += 1
+
+    async def _prefetch(self, name: str, user_id: str) -> Any:
+        # The read itself must not pick up its own task
+        prefetched_reads.set(None)
+        with tracer.span("prefetch", read=name):
+            return await PREFETCH_LOADERS[name](user_id)
+
+    def _finish_prefetch(self, prefetched: Dict[Any, asyncio.Task]):
+        """Cancel the reads no handler asked for"""
+        for (name, _), task in prefetched.items():
+            task.cancel()
+            DB_PREFETCH.inc(name, "unused")
+            self.prefetch_stats["unused"] += 1
+        prefetched.clear()
+
+    def _continuation_analysis(self, context: ConversationContext, message: str) -> Optional[Dict[str, Any]]:
+        """Route "show me more" straight back to transaction history while a page cursor is open"""
+        if (context.current_intent != Intent.TRANSACTION_HISTORY or not context.transaction_cursor
+                or not CONTINUATION_PATTERN.search(message)):
+            return None
+        return {
+            "intent": Intent.TRANSACTION_HISTORY,
+            "entities": {},
+            "context_switch": False,
+            "confidence": 1.0,
+            "reasoning": "Continuation of transaction history"
+        }
+
+    def _is_idle(self, context: ConversationContext) -> bool:
+        return context.conversation_state in (ConversationState.IDLE, ConversationState.COMPLETED)
+
+    def _remember_intent(self, context: ConversationContext, message: str, intent: Intent):
+        """Memoize the intent of read-only questions asked outside a workflow"""
+        if self.response_cache and intent in CACHEABLE_INTENTS and self._is_idle(context):
+            self.response_cache.remember_intent(message, intent.value)
+
+    async def _cached_turn(self, context: ConversationContext, message: str,
+                           cache_misses: Dict[Intent, int]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]], str]:
+        """Answer a repeated read-only question from cache without any LLM call.
+
+        A miss is recorded in cache_misses so routing does not look it up again.
+        """
+        if not self.response_cache or not self._is_idle(context):
+            return None, None, "two_call"
+        intent_value = self.response_cache.known_intent(message)
+        if intent_value is None:
+            return None, None, "two_call"
+
+        intent = Intent(intent_value)
+        version = await self._cacheable_data_version(context, intent)
+        if version is None:
+            return None, None, "two_call"
+        cached_reply = self.response_cache.get(context.user_id, intent.value, version)
+        if cached_reply is None:
+            cache_misses[intent] = version
+            return None, None, "two_call"
+
+        analysis = {
+            "intent": intent,
+            "entities": {},
+            "context_switch": bool(context.current_intent and intent != context.current_intent),
+            "confidence": 1.0,
+            "reasoning": "Cached reply for unchanged data"
+        }
+        return analysis, await self._replay_cached_reply(cached_reply), "cached"
+
+    async def _cacheable_data_version(self, context: ConversationContext, intent: Intent) -> Optional[int]:
+        """Current data version if intent's reply may be cached, else None"""
+        if not self.response_cache or intent not in CACHEABLE_INTENTS:
+            return None
+        try:
+            return await user_service.get_data_version(context.user_id)
+        except Exception as e:
+            print(f"Data Version Error: {e}")
+            return None
+
+    async def _replay_cached_reply(self, reply: str) -> Dict[str, Any]:
+        on_delta = response_stream.get()
+        if on_delta:
+            await on_delta(reply)
+        return {"response": reply, "completed": True, "cached": True}
+
+    async def _fused_turn(self, context: ConversationContext, message: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Classify and answer in one LLM call using speculatively fetched data.
+
+        Returns (analysis, response). The response is None when the turn has to
+        go through the regular handler, e.g. because the classified intent does
+        not match the data that was fetched; analysis is None when the fused
+        call itself failed.
+        """
+        if context.conversation_state not in (ConversationState.IDLE, ConversationState.COMPLETED):
+            return None, None
+
+        expected_intent = self.conversation_ai._fallback_analysis(message, context)["intent"]
+        if expected_intent not in FUSED_INTENTS:
+            return None, None
+        # A templated reply needs no generation, so the analysis-only call is cheaper
+        if self.conversation_ai.templates.selected(FUSED_ACTIONS.get(expected_intent)):
+            return None, None
+
+        # Read the data version before the data so a concurrent write can't be
+        # cached under the newer version
+        version = await self._cacheable_data_version(context, expected_intent)
+        system_data = await self._speculative_system_data(context, expected_intent, message)
+        analysis = await self.conversation_ai.analyze_and_respond(message, context, system_data)
+        if analysis is None:
+            return None, None
+        self._remember_intent(context, message, analysis["intent"])
+        if analysis["intent"] != expected_intent or not analysis["response"]:
+            return analysis, None
+        if "next_cursor" in system_data:
+            context.transaction_cursor = system_data["next_cursor"] or ""
+        if version is not None:
+            self.response_cache.set(context.user_id, expected_intent.value, version, analysis["response"])
+        return analysis, {"response": analysis["response"], "completed": True}
+
+    async def _speculative_system_data(self, context: ConversationContext, intent: Intent, message: str) -> Dict[str, Any]:
+        """Fetch the data the read-only handler for intent would show"""
+        if intent == Intent.BALANCE_INQUIRY:
+            return {"accounts": await account_service.get_user_accounts(context.user_id), "action": "show_balance"}
+        elif intent == Intent.CARD_INQUIRY:
+            return {"cards": await card_service.get_user_cards(context.user_id), "action": "show_cards"}
+        elif intent == Intent.LOAN_INQUIRY:
+            return {
+                "loan_applications": await loan_service.get_user_loan_applications(context.user_id),
+                "action": "show_loans"
+            }
+        elif intent == Intent.TRANSACTION_HISTORY:
+            return await self._transaction_page_data(context, message)
+        elif intent == Intent.GREETING:
+            return {"action": "greeting"}
+        elif intent == Intent.GOODBYE:
+            return {"action": "goodbye"}
+        return {"action": "general_help"}
+
+    def _record_pipeline_stats(self, mode: str, elapsed: float, usage: Dict[str, int]):
+        """Accumulate per-mode turn latency and LLM usage"""
+        stats = self.pipeline_stats.setdefault(mode, {
+            "turns": 0, "total_latency_ms": 0.0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0
+        })
+        stats["turns"] += 1
+        stats["total_latency_ms"] += elapsed * 1000
+        for key in ("llm_calls", "prompt_tokens", "completion_tokens"):
+            stats[key] += usage[key]
+
+    def get_pipeline_stats(self) -> Dict[str, Any]:
+        """Per-turn averages for each pipeline mode"""
+        summary = {
+            "fused_pipeline": self.fused_pipeline,
+            "intent_router": self.intent_router.stats(),
+            "llm_models": self.conversation_ai.llm.describe(),
+            "llm_circuit_breaker": self.conversation_ai.breaker.stats(),
+            "templates": self.conversation_ai.templates.stats(),
+            "prefetch": {"enabled": self.prefetch_reads, **self.prefetch_stats},
+            "modes": {}
+        }
+        for mode, stats in self.pipeline_stats.items():
+            turns = stats["turns"] or 1
+            summary["modes"][mode] = {
+                "turns": stats["turns"],
+                "avg_latency_ms": round(stats["total_latency_ms"] / turns, 2),
+                "avg_llm_calls": round(stats["llm_calls"] / turns, 2),
+                "avg_prompt_tokens": round(stats["prompt_tokens"] / turns, 1),
+                "avg_completion_tokens": round(stats["completion_tokens"] / turns, 1)
+            }
+        return summary
+
     async def _handle_context_switch(self, context: ConversationContext, new_intent: Intent):
         """Handle context switching between different banking tasks"""
         if context.current_intent and context.conversation_state != ConversationState.COMPLETED:
@@ -239,15 +746,52 @@ class AdvancedWorkflowEngine:
                 "workflow_step": context.workflow_step,
                 "timestamp": datetime.now().isoformat()
             })
+            # Only the most recent interruptions are kept so the context stays bounded
+            del context.interruption_stack[:-MAX_INTERRUPTIONS]
 
         # Reset for new intent
         context.collected_data = {}
         context.conversation_state = ConversationState.IDLE
         context.workflow_step = ""
 
-    async def _route_to_handler(self, context: ConversationContext, message: str, analysis: Dict[str, Any]) -> Dict[str, Any]:
+    async def _route_to_handler(self, context: ConversationContext, message: str, analysis: Dict[str, Any],
+                                cache_misses: Optional[Dict[Intent, int]] = None) -> Dict[str, Any]:
+        """Route message to its handler, serving read-only replies from cache.
+
+        Intents in cache_misses were already looked up this turn; their
+        version is reused and the cache is not asked again.
+        """
+        intent = analysis["intent"]
+        step = context.workflow_step or "none"
+        with STAGE_LATENCY.time("route", intent.value, step), tracer.span("route", intent=intent.value):
+            missed = cache_misses is not None and intent in cache_misses
+            version = cache_misses[intent] if missed else await self._cacheable_data_version(context, intent)
+            if version is not None and not missed:
+                cached_reply = self.response_cache.get(context.user_id, intent.value, version)
+                if cached_reply is not None:
+                    with tracer.span("cached_reply", intent=intent.value):
+                        return await self._replay_cached_reply(cached_reply)
+
+            response = await self._dispatch_to_handler(context, message, analysis)
+            # Degraded replies are not cached, so they stop as soon as the LLM is back
+            usage = turn_usage.get()
+            if version is not None and not response.get("error") and not (usage and usage["fallbacks"]):
+                self.response_cache.set(context.user_id, intent.value, version, response["response"])
+            return response
+
+    async def _dispatch_to_handler(self, context: ConversationContext, message: str, analysis: Dict[str, Any]) -> Dict[str, Any]:
         """Route message to appropriate workflow handler"""
         intent = analysis["intent"]
+        step = context.workflow_step or "none"
+        with STAGE_LATENCY.time("handler", intent.value, step), \
+                tracer.span("handler", intent=intent.value, workflow_step=step) as span:
+            response = await self._run_handler(context, message, analysis)
+            span.set_attributes({"completed": bool(response.get("completed")), "error": bool(response.get("error"))})
+            return response
+
+    async def _run_handler(self, context: ConversationContext, message: str, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Call the intent's handler, replying with an error message if it fails"""
+        intent = analysis["intent"]
         
         try:
             if intent == Intent.CARD_BLOCKING:
@@ -262,6 +806,8 @@ class AdvancedWorkflowEngine:
                 return await self._handle_balance_inquiry_ai(context, message)
             elif intent == Intent.TRANSACTION_HISTORY:
                 return await self._handle_transaction_history_ai(context, message)
+            elif intent == Intent.SPENDING_SUMMARY:
+                return await self._handle_spending_summary_ai(context, message)
             elif intent == Intent.CARD_INQUIRY:
                 return await self._handle_card_inquiry_ai(context, message)
             elif intent == Intent.GREETING:
@@ -518,15 +1064,49 @@ class AdvancedWorkflowEngine:
         return {"response": response, "completed": True}
 
     async def _handle_transaction_history_ai(self, context: ConversationContext, message: str) -> Dict[str, Any]:
-        """Transaction history"""
+        """Transaction history, one page at a time across all accounts"""
+        system_data = await self._transaction_page_data(context, message)
+        context.transaction_cursor = system_data["next_cursor"] or ""
+
+        response = await self.conversation_ai.generate_response(context, message, system_data)
+        return {"response": response, "completed": True}
+
+    async def _transaction_page_data(self, context: ConversationContext, message: str) -> Dict[str, Any]:
+        """Next page for "show me more" follow-ups, otherwise the first page
+        matching the filters in the message"""
         accounts = await account_service.get_user_accounts(context.user_id)
-        transactions = []
-        if accounts:
-            transactions = await account_service.get_account_transactions(accounts[0]["account_id"], 5)
-        
+        if context.transaction_cursor and CONTINUATION_PATTERN.search(message):
+            page = await account_service.get_transactions_page(
+                context.user_id, TRANSACTION_PAGE_SIZE, cursor=context.transaction_cursor
+            )
+        else:
+            page = await account_service.get_transactions_page(
+                context.user_id, TRANSACTION_PAGE_SIZE, **extract_transaction_filters(message)
+            )
+        return {
+            "accounts": accounts,
+            "transactions": page["transactions"],
+            "filters": page["filters"],
+            "has_more": page["next_cursor"] is not None,
+            "next_cursor": page["next_cursor"],
+            "action": "show_transactions"
+        }
+
+    async def _handle_spending_summary_ai(self, context: ConversationContext, message: str) -> Dict[str, Any]:
+        """Spending totals and averages from the precomputed rollups"""
+        filters = extract_transaction_filters(message)
+        category = extract_spending_category(message)
+        # A named merchant is more specific than the category it belongs to
+        if filters.get("merchant"):
+            category = None
+        transaction_type = filters.get("transaction_type") or ("credit" if category == "income" else "debit")
+        summary = await spending_service.get_spending_summary(
+            context.user_id, filters.get("start_date"), filters.get("end_date"), transaction_type,
+            category, filters.get("merchant")
+        )
         response = await self.conversation_ai.generate_response(
             context, message,
-            {"accounts": accounts, "transactions": transactions, "action": "show_transactions"}
+            {"summary": summary, "action": "show_spending_summary"}
         )
         return {"response": response, "completed": True}
 
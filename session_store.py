@@ -0,0 +1,270 @@
+import asyncio
+import os
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+import aiosqlite
+
+from cache import LRUCache
+from models import ConversationContext
+
+
+class SessionStore:
+    """Storage interface for per-session ConversationContext objects"""
+
+    def __init__(self):
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def get(self, session_id: str) -> Optional[ConversationContext]:
+        raise NotImplementedError
+
+    async def save(self, context: ConversationContext):
+        raise NotImplementedError
+
+    async def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    async def sweep(self) -> int:
+        """Evict expired sessions and return how many were removed"""
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+    async def get_or_create(self, session_id: str, user_id: str) -> ConversationContext:
+        context = await self.get(session_id)
+        if context is None:
+            context = ConversationContext(session_id=session_id, user_id=user_id)
+            await self.save(context)
+        return context
+
+    def start_sweeper(self, interval: float = 60.0):
+        """Run sweep() every interval seconds on the current event loop"""
+        if self._sweeper and not self._sweeper.done():
+            return
+
+        async def sweep_forever():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    removed = await self.sweep()
+                    if removed:
+                        print(f"Session sweeper evicted {removed} idle sessions")
+                except Exception as e:
+                    print(f"Session Sweeper Error: {e}")
+
+        self._sweeper = asyncio.create_task(sweep_forever())
+
+    async def close(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store bounded by LRU capacity and an idle TTL"""
+
+    def __init__(self, capacity: int = 10000, idle_ttl: Optional[float] = 1800.0):
+        super().__init__()
+        self._contexts = LRUCache(capacity=capacity, ttl=idle_ttl, sliding=True)
+
+    async def get(self, session_id: str) -> Optional[ConversationContext]:
+        return self._contexts.get(session_id)
+
+    async def save(self, context: ConversationContext):
+        self._contexts.set(context.session_id, context)
+
+    async def delete(self, session_id: str) -> bool:
+        return self._contexts.pop(session_id) is not None
+
+    async def sweep(self) -> int:
+        return self._contexts.sweep()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self._contexts.stats()}
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session store shared by every worker process through a SQLite (WAL) table.
+
+    Contexts are stored as zlib-compressed JSON. save() only snapshots the
+    context; a background task writes pending snapshots in one transaction
+    every flush_interval seconds, so a turn never waits on a commit. Reads
+    always go to the table (or this process's pending snapshot), so another
+    worker sees a turn only once it is flushed. With flush_interval <= 0,
+    save() commits before returning (write-through), which is what
+    multi-worker deployments without sticky sessions need.
+    """
+
+    def __init__(self, db_path: str = "sessions.db", idle_ttl: Optional[float] = 1800.0,
+                 flush_interval: float = 0.05):
+        super().__init__()
+        self.db_path = db_path
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+        self._pending: Dict[str, Tuple[str, bytes, float]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_wakeup = asyncio.Event()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.flushes = 0
+        self.expirations = 0
+
+    async def _connection(self) -> aiosqlite.Connection:
+        async with self._connect_lock:
+            if self._conn is None:
+                conn = await aiosqlite.connect(self.db_path)
+                await conn.execute("PRAGMA journal_mode=WAL")
+                await conn.execute("PRAGMA synchronous=NORMAL")
+                await conn.execute("PRAGMA busy_timeout=5000")
+                await conn.execute("""
+                CREATE TABLE IF NOT EXISTS conversation_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """)
+                await conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_conversation_sessions_updated ON conversation_sessions (updated_at)"
+                )
+                await conn.commit()
+                self._conn = conn
+            return self._conn
+
+    @staticmethod
+    def serialize(context: ConversationContext) -> bytes:
+        return zlib.compress(context.model_dump_json(exclude_defaults=True).encode())
+
+    @staticmethod
+    def deserialize(payload: bytes) -> ConversationContext:
+        return ConversationContext.model_validate_json(zlib.decompress(payload))
+
+    async def get(self, session_id: str) -> Optional[ConversationContext]:
+        pending = self._pending.get(session_id)
+        if pending is not None:
+            self.hits += 1
+            return self.deserialize(pending[1])
+
+        conn = await self._connection()
+        cursor = await conn.execute(
+            "SELECT payload, updated_at FROM conversation_sessions WHERE session_id = ?", (session_id,)
+        )
+        row = await cursor.fetchone()
+        if row is None or (self.idle_ttl is not None and time.time() - row[1] > self.idle_ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.deserialize(row[0])
+
+    async def save(self, context: ConversationContext):
+        self._pending[context.session_id] = (context.user_id, self.serialize(context), time.time())
+        self.writes += 1
+        if self.flush_interval <= 0:
+            await self.flush()
+            return
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+        self._flush_wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            await self._flush_wakeup.wait()
+            self._flush_wakeup.clear()
+            # Let more turns finish so they share one commit
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Session Flush Error: {e}")
+
+    async def flush(self):
+        """Write all pending snapshots in a single transaction"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        conn = await self._connection()
+        try:
+            await conn.executemany(
+                "INSERT OR REPLACE INTO conversation_sessions (session_id, user_id, payload, updated_at) VALUES (?, ?, ?, ?)",
+                [(session_id, user_id, payload, updated_at)
+                 for session_id, (user_id, payload, updated_at) in batch.items()]
+            )
+            await conn.commit()
+            self.flushes += 1
+        except BaseException:
+            # Requeue the batch without clobbering snapshots taken since
+            self._pending = {**batch, **self._pending}
+            if conn.in_transaction:
+                await conn.rollback()
+            raise
+
+    async def delete(self, session_id: str) -> bool:
+        was_pending = self._pending.pop(session_id, None) is not None
+        conn = await self._connection()
+        cursor = await conn.execute("DELETE FROM conversation_sessions WHERE session_id = ?", (session_id,))
+        await conn.commit()
+        return was_pending or cursor.rowcount > 0
+
+    async def sweep(self) -> int:
+        if self.idle_ttl is None:
+            return 0
+        conn = await self._connection()
+        cursor = await conn.execute(
+            "DELETE FROM conversation_sessions WHERE updated_at < ?", (time.time() - self.idle_ttl,)
+        )
+        await conn.commit()
+        self.expirations += cursor.rowcount
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "pending": len(self._pending),
+            "expirations": self.expirations
+        }
+
+    async def close(self):
+        await super().close()
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        if self._conn:
+            await self._conn.close()
+            self._conn = None
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store selected by the SESSION_STORE environment variable"""
+    backend = os.getenv("SESSION_STORE", "memory").lower()
+    if backend == "memory":
+        return InMemorySessionStore(
+            capacity=int(os.getenv("SESSION_CAPACITY", "10000")),
+            idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "1800"))
+        )
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            db_path=os.getenv("SESSION_DB_PATH", "sessions.db"),
+            idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "1800")),
+            flush_interval=float(os.getenv("SESSION_FLUSH_INTERVAL", "0.05"))
+        )
+    raise ValueError(f"Unknown SESSION_STORE backend: {backend}")
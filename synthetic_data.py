@@ -0,0 +1,321 @@
+"""Deterministic synthetic data for the banking schema.
+
+Generates users, accounts, cards, transactions, loan applications and bill
+payments shaped like a retail bank's book:
+
+    python synthetic_data.py --users 100000 --out extract_100k     # CSV extract
+    python synthetic_data.py --users 100000 --db bench_100k.db     # extract + bulk load
+
+Every user is generated from its own RNG seeded with (seed, user index), so
+the same seed always produces the same rows and a smaller population is a
+prefix of a larger one. Dates are relative to a fixed as-of date, not today.
+"""
+import argparse
+import csv
+import math
+import os
+import random
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+TABLE_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "users": ("user_id", "full_name", "email", "phone", "monthly_income", "employment_status", "credit_score",
+              "date_of_birth", "created_at"),
+    "accounts": ("account_id", "user_id", "account_number", "account_type", "balance", "status", "created_at"),
+    "cards": ("card_id", "user_id", "account_id", "card_number", "card_type", "card_status", "credit_limit",
+              "available_credit", "blocked_at", "block_reason", "created_at"),
+    "transactions": ("transaction_id", "account_id", "transaction_type", "amount", "description",
+                     "merchant_name", "transaction_date", "status"),
+    "loan_applications": ("application_id", "user_id", "loan_type", "loan_amount", "loan_purpose",
+                          "application_status", "interest_rate", "loan_term_months", "monthly_payment",
+                          "applied_at"),
+    "bill_payments": ("payment_id", "user_id", "bill_type", "amount", "due_date", "payment_date", "status"),
+}
+
+FIRST_NAMES = ("James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David",
+               "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Priya", "Wei",
+               "Carlos", "Aisha", "Mohammed", "Sofia", "Hiroshi", "Olga", "Kwame", "Ana")
+LAST_NAMES = ("Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+              "Martinez", "Patel", "Chen", "Kim", "Nguyen", "Okafor", "Silva", "Rossi", "Muller", "Tanaka")
+
+EMPLOYMENT_STATUSES = (("employed", 68), ("self_employed", 12), ("retired", 9), ("student", 6),
+                       ("unemployed", 5))
+
+# Card purchases: (merchant, description, share of purchases, median amount)
+MERCHANTS = (
+    ("FreshMart Grocery", "Grocery Store Purchase", 22, 65.0),
+    ("Whole Foods Market", "Grocery Store Purchase", 6, 80.0),
+    ("Shell Gas Station", "Gas Station", 9, 45.0),
+    ("Chevron", "Gas Station", 5, 48.0),
+    ("Starbucks", "Coffee Shop", 12, 7.5),
+    ("Corner Cafe", "Restaurant", 8, 28.0),
+    ("Pizza Palace", "Restaurant", 5, 35.0),
+    ("Amazon Marketplace", "Online Purchase", 12, 42.0),
+    ("Walmart", "Retail Purchase", 7, 55.0),
+    ("Netflix", "Subscription", 2, 15.5),
+    ("Spotify", "Subscription", 2, 10.99),
+    ("Uber Trip", "Ride Share", 6, 18.0),
+    ("Delta Airline", "Airfare", 1, 320.0),
+    ("Marriott Hotel", "Hotel Stay", 1, 210.0),
+    ("City Electric", "Utility Payment", 2, 95.0),
+)
+_MERCHANT_WEIGHTS = [merchant[2] for merchant in MERCHANTS]
+
+LOAN_TYPES = (
+    # (loan type, purpose, median amount, term months, share)
+    ("personal", "Debt consolidation", 12000, 36, 40),
+    ("personal", "Home renovation", 15000, 48, 15),
+    ("auto", "Vehicle purchase", 25000, 60, 25),
+    ("home", "Home purchase", 280000, 360, 10),
+    ("education", "Tuition", 20000, 120, 10),
+)
+BILL_TYPES = (("electricity", 95.0), ("water", 45.0), ("internet", 65.0), ("phone", 55.0), ("insurance", 140.0))
+
+
+def _weighted(rng: random.Random, choices: Tuple[Tuple[Any, int], ...]) -> Any:
+    return rng.choices([value for value, _ in choices], weights=[weight for _, weight in choices])[0]
+
+
+def _lognormal(rng: random.Random, median: float, sigma: float) -> float:
+    return median * math.exp(rng.gauss(0, sigma))
+
+
+def _card_number(prefix: str, index: int, ordinal: int, rng: random.Random) -> str:
+    digits = f"{prefix}{index:011d}{ordinal}{rng.randint(0, 999):03d}"
+    return "-".join(digits[i:i + 4] for i in range(0, 16, 4))
+
+
+def _timestamp(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class SyntheticBankData:
+    """Seeded generator of per-user rows for every table in the schema"""
+
+    def __init__(self, users: int, seed: int = 42, as_of: str = "2024-06-30", history_days: int = 365,
+                 transactions_per_account: float = 40):
+        self.users = users
+        self.seed = seed
+        self.as_of = datetime.fromisoformat(as_of)
+        self.history_days = history_days
+        self.transactions_per_account = transactions_per_account
+
+    @staticmethod
+    def user_id(index: int) -> str:
+        return f"user_{index:08d}"
+
+    @staticmethod
+    def account_id(index: int, ordinal: int = 0) -> str:
+        """Every user has at least the checking account with ordinal 0"""
+        return f"acc_{index:08d}_{ordinal}"
+
+    def generate_user(self, index: int) -> Dict[str, List[Dict[str, Any]]]:
+        """All rows belonging to one user, keyed by table"""
+        rng = random.Random(f"{self.seed}:{index}")
+        user_id = self.user_id(index)
+        rows: Dict[str, List[Dict[str, Any]]] = {table: [] for table in TABLE_COLUMNS}
+
+        employment = _weighted(rng, EMPLOYMENT_STATUSES)
+        income = _lognormal(rng, 4500, 0.5) * (0.35 if employment in ("student", "unemployed") else 1)
+        age = int(rng.triangular(18, 85, 38))
+        joined = self.as_of - timedelta(days=rng.randint(30, 3650))
+        rows["users"].append({
+            "user_id": user_id,
+            "full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "email": f"user{index}@example.com",
+            "phone": f"+1-555-{rng.randint(0, 9999999):07d}",
+            "monthly_income": round(income, 2),
+            "employment_status": employment,
+            "credit_score": max(300, min(850, int(rng.gauss(690, 70)))),
+            "date_of_birth": (self.as_of - timedelta(days=age * 365 + rng.randint(0, 364))).date().isoformat(),
+            "created_at": _timestamp(joined),
+        })
+
+        # One checking account, often a savings account, sometimes more
+        account_count = rng.choices((1, 2, 3, 4), weights=(45, 35, 15, 5))[0]
+        account_types = ["checking", "savings", "checking", "savings"][:account_count]
+        for ordinal, account_type in enumerate(account_types):
+            rows["accounts"].append({
+                "account_id": self.account_id(index, ordinal),
+                "user_id": user_id,
+                "account_number": f"ACC-{index:09d}{ordinal}",
+                "account_type": account_type,
+                "balance": round(_lognormal(rng, 2500 if account_type == "checking" else 8000, 1.0), 2),
+                "status": "active" if rng.random() < 0.97 else "closed",
+                "created_at": _timestamp(joined + timedelta(days=rng.randint(0, 365) * ordinal)),
+            })
+
+        for account in rows["accounts"]:
+            if account["account_type"] == "checking" and rng.random() < 0.9:
+                rows["cards"].append(self._card(rng, index, len(rows["cards"]), account, "debit", 0))
+        for _ in range(rng.choices((0, 1, 2), weights=(40, 45, 15))[0]):
+            limit = max(500, round(income * rng.uniform(0.5, 2.5) / 500) * 500)
+            rows["cards"].append(self._card(rng, index, len(rows["cards"]), rows["accounts"][0], "credit", limit))
+
+        for ordinal, account in enumerate(rows["accounts"]):
+            rows["transactions"].extend(self._transactions(rng, index, ordinal, account, income))
+
+        for ordinal in range(rng.choices((0, 1, 2), weights=(70, 25, 5))[0]):
+            rows["loan_applications"].append(self._loan_application(rng, index, ordinal, user_id))
+
+        for ordinal in range(rng.choices((0, 1, 2, 3, 4), weights=(20, 25, 25, 20, 10))[0]):
+            bill_type, median = rng.choice(BILL_TYPES)
+            due = self.as_of + timedelta(days=rng.randint(-20, 30))
+            paid = due < self.as_of and rng.random() < 0.9
+            rows["bill_payments"].append({
+                "payment_id": f"bill_{index:08d}_{ordinal}",
+                "user_id": user_id,
+                "bill_type": bill_type,
+                "amount": round(_lognormal(rng, median, 0.3), 2),
+                "due_date": due.date().isoformat(),
+                "payment_date": _timestamp(due - timedelta(days=rng.randint(0, 5))) if paid else None,
+                "status": "paid" if paid else ("overdue" if due < self.as_of else "pending"),
+            })
+        return rows
+
+    def _card(self, rng: random.Random, index: int, ordinal: int, account: Dict[str, Any], card_type: str,
+              limit: float) -> Dict[str, Any]:
+        status = rng.choices(("active", "blocked", "expired"), weights=(88, 7, 5))[0]
+        blocked_at = None
+        if status == "blocked":
+            blocked_at = _timestamp(self.as_of - timedelta(days=rng.randint(1, 400)))
+        return {
+            "card_id": f"card_{index:08d}_{ordinal}",
+            "user_id": account["user_id"],
+            "account_id": account["account_id"],
+            "card_number": _card_number("4" if card_type == "debit" else "5", index, ordinal, rng),
+            "card_type": card_type,
+            "card_status": status,
+            "credit_limit": limit,
+            "available_credit": round(limit * rng.uniform(0.2, 1.0), 2) if limit else 0,
+            "blocked_at": blocked_at,
+            "block_reason": rng.choice(("Lost card", "Stolen card", "Suspicious activity")) if blocked_at else None,
+            "created_at": account["created_at"],
+        }
+
+    def _transactions(self, rng: random.Random, index: int, ordinal: int, account: Dict[str, Any],
+                      income: float) -> Iterator[Dict[str, Any]]:
+        """Monthly salary and rent on the first checking account plus a
+        heavy-tailed number of card purchases, oldest first"""
+        start = self.as_of - timedelta(days=self.history_days)
+        events: List[Tuple[datetime, str, float, str, str]] = []
+        if ordinal == 0:
+            renter = rng.random() < 0.6
+            rent = round(_lognormal(rng, 1400, 0.35), 2)
+            month = datetime(start.year, start.month, 1)
+            while month <= self.as_of:
+                if month >= start:
+                    events.append((month + timedelta(minutes=1), "credit", round(income, 2),
+                                   "Salary Deposit", "Employer Payroll"))
+                    if renter:
+                        events.append((month + timedelta(days=rng.randint(0, 4), hours=8), "debit", rent,
+                                       "Rent Payment", "Property Management Co"))
+                month = (month + timedelta(days=32)).replace(day=1)
+
+        activity = self.transactions_per_account * (1 if account["account_type"] == "checking" else 0.15)
+        purchases = int(_lognormal(rng, activity, 0.8)) if activity else 0
+        merchants = rng.choices(MERCHANTS, weights=_MERCHANT_WEIGHTS, k=purchases)
+        for merchant, description, _, median in merchants:
+            moment = start + timedelta(seconds=rng.randint(0, self.history_days * 86400))
+            events.append((moment, "debit", round(max(0.5, _lognormal(rng, median, 0.5)), 2), description, merchant))
+        if account["account_type"] == "savings":
+            for _ in range(rng.randint(0, 6)):
+                moment = start + timedelta(seconds=rng.randint(0, self.history_days * 86400))
+                events.append((moment, "credit", round(_lognormal(rng, 300, 0.8), 2),
+                               "Transfer from Checking", "Internal Transfer"))
+
+        events.sort()
+        for number, (moment, kind, amount, description, merchant) in enumerate(events):
+            yield {
+                "transaction_id": f"txn_{index:08d}_{ordinal}_{number:05d}",
+                "account_id": account["account_id"],
+                "transaction_type": kind,
+                "amount": amount,
+                "description": description,
+                "merchant_name": merchant,
+                "transaction_date": _timestamp(moment),
+                "status": "pending" if moment > self.as_of - timedelta(days=2) else "completed",
+            }
+
+    def _loan_application(self, rng: random.Random, index: int, ordinal: int, user_id: str) -> Dict[str, Any]:
+        loan_type, purpose, median, term, _ = rng.choices(LOAN_TYPES, weights=[loan[4] for loan in LOAN_TYPES])[0]
+        amount = round(_lognormal(rng, median, 0.4), -2)
+        status = rng.choices(("approved", "pending", "rejected"), weights=(55, 25, 20))[0]
+        rate = payment = None
+        if status == "approved":
+            rate = round(rng.uniform(4.5, 14.0), 2)
+            monthly_rate = rate / 1200
+            payment = round(amount * monthly_rate / (1 - (1 + monthly_rate) ** -term), 2)
+        return {
+            "application_id": f"loan_{index:08d}_{ordinal}",
+            "user_id": user_id,
+            "loan_type": loan_type,
+            "loan_amount": amount,
+            "loan_purpose": purpose,
+            "application_status": status,
+            "interest_rate": rate,
+            "loan_term_months": term if status == "approved" else None,
+            "monthly_payment": payment,
+            "applied_at": _timestamp(self.as_of - timedelta(days=rng.randint(1, 700))),
+        }
+
+    def write_extract(self, directory: str) -> Dict[str, str]:
+        """Stream every table to <directory>/<table>.csv in one pass over the users"""
+        os.makedirs(directory, exist_ok=True)
+        paths = {table: os.path.join(directory, f"{table}.csv") for table in TABLE_COLUMNS}
+        handles = {table: open(path, "w", newline="") for table, path in paths.items()}
+        try:
+            writers = {}
+            for table, handle in handles.items():
+                writers[table] = csv.DictWriter(handle, fieldnames=TABLE_COLUMNS[table], extrasaction="ignore")
+                writers[table].writeheader()
+            for index in range(self.users):
+                for table, rows in self.generate_user(index).items():
+                    writers[table].writerows(rows)
+        finally:
+            for handle in handles.values():
+                handle.close()
+        return paths
+
+
+def build_database(db_path: str, users: int, seed: int = 42, **options) -> Dict[str, int]:
+    """Generate a population into a temporary extract and bulk load it"""
+    from bulk_loader import BulkLoader
+
+    directory = tempfile.mkdtemp(prefix="synthetic_")
+    try:
+        paths = SyntheticBankData(users, seed=seed, **options).write_extract(directory)
+        loader = BulkLoader(db_path)
+        try:
+            return loader.load({table: [path] for table, path in paths.items()})
+        finally:
+            loader.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--as-of", default="2024-06-30")
+    parser.add_argument("--history-days", type=int, default=365)
+    parser.add_argument("--transactions-per-account", type=float, default=40)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--out", help="Directory for the CSV extract")
+    target.add_argument("--db", help="Database to bulk load the population into")
+    args = parser.parse_args(argv)
+
+    options = {"as_of": args.as_of, "history_days": args.history_days,
+               "transactions_per_account": args.transactions_per_account}
+    if args.out:
+        paths = SyntheticBankData(args.users, seed=args.seed, **options).write_extract(args.out)
+        print(f"Wrote {args.users:,} users to {', '.join(paths.values())}")
+    else:
+        build_database(args.db, args.users, seed=args.seed, **options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Deterministic replies for handler actions whose reply is just formatted data.
+
+Each template renders the plain-text, "Number:" list style RESPONSE_PREFIX asks
+the LLM for, using only characters RESPONSE_CLEANUP_PATTERN keeps. Actions in
+LLM_FREE_ACTIONS (comma-separated), or every templated action with
+LLM_FREE_MODE=true, are answered from the template instead of a
+generate_response LLM call.
+"""
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Row formats, filled per row by the render functions below
+BALANCE_ROW = "{index}: {account_type} account ending {last4}, balance {balance}{status}"
+CARD_ROW = "{index}: {card_type} card ending {last4}, {card_status}{credit}"
+CARD_CREDIT = ", available credit {available} of {limit}"
+TRANSACTION_ROW = "{index}: {date}, {transaction_type} of {amount}, {description}{merchant}"
+LOAN_ROW = "{index}: {loan_type} loan of {loan_amount}{purpose}, {status}{terms}"
+LOAN_TERMS = ", {interest_rate} percent over {term} months, monthly payment {monthly_payment}"
+
+NO_ACCOUNTS_REPLY = "You have no accounts with us yet."
+NO_CARDS_REPLY = "You have no cards with us yet. You can apply for one in online banking or at any branch."
+NO_TRANSACTIONS_REPLY = "I found no {transactions}."
+NO_LOANS_REPLY = "You have no loan applications. You can apply for a loan in online banking or at any branch."
+NO_ACTIVE_CARDS_REPLY = ("You have no active cards to block. Any cards you have are already blocked or inactive. "
+                         "Is there anything else I can help you with?")
+BLOCKED_REPLY = ("Your {card_type} card ending {last4} is now blocked and can no longer be used. "
+                 "If you need a replacement card, just ask. Is there anything else I can help you with?")
+MORE_TRANSACTIONS = "There are more transactions. Say show me more to see the next page."
+
+
+def _amount(value: Any) -> str:
+    try:
+        return f"{float(value):,.2f}"
+    except (TypeError, ValueError):
+        return "unknown"
+
+
+def _last4(row: Optional[Dict[str, Any]]) -> str:
+    return str((row or {}).get("card_number") or (row or {}).get("account_number") or "")[-4:] or "unknown"
+
+
+def _label(value: Any) -> str:
+    return str(value or "").replace("_", " ").strip()
+
+
+def _list(header: str, rows: List[str], footer: str = "") -> str:
+    return "\n".join([header, *rows, footer] if footer else [header, *rows])
+
+
+def render_balance(system_data: Dict[str, Any]) -> str:
+    accounts = system_data.get("accounts") or []
+    if not accounts:
+        return NO_ACCOUNTS_REPLY
+    rows = [
+        BALANCE_ROW.format(
+            index=index, account_type=_label(account.get("account_type")).title(), last4=_last4(account),
+            balance=_amount(account.get("balance")),
+            status="" if account.get("status") in (None, "active") else f" ({_label(account['status'])})"
+        )
+        for index, account in enumerate(accounts, 1)
+    ]
+    footer = ""
+    if len(accounts) > 1:
+        footer = f"Total across your accounts: {_amount(sum(float(a.get('balance') or 0) for a in accounts))}"
+    return _list("Here are your account balances:", rows, footer)
+
+
+def render_cards(system_data: Dict[str, Any]) -> str:
+    cards = system_data.get("cards") or []
+    if not cards:
+        return NO_CARDS_REPLY
+    rows = []
+    for index, card in enumerate(cards, 1):
+        credit = ""
+        if float(card.get("credit_limit") or 0) > 0:
+            credit = CARD_CREDIT.format(available=_amount(card.get("available_credit")),
+                                        limit=_amount(card.get("credit_limit")))
+        rows.append(CARD_ROW.format(
+            index=index, card_type=_label(card.get("card_type")).title(), last4=_last4(card),
+            card_status=_label(card.get("card_status")) or "status unknown", credit=credit
+        ))
+    return _list("Here are your cards:", rows)
+
+
+def _describe_filters(filters: Optional[Dict[str, Any]]) -> str:
+    """e.g. "debit transactions at Shell since 2024-01-05", or "" without filters"""
+    filters = filters or {}
+    parts = []
+    if filters.get("merchant"):
+        parts.append(f"at {filters['merchant']}")
+    if filters.get("start_date") and filters.get("end_date"):
+        parts.append(f"from {filters['start_date']} to {filters['end_date']}")
+    elif filters.get("start_date"):
+        parts.append(f"since {filters['start_date']}")
+    elif filters.get("end_date"):
+        parts.append(f"up to {filters['end_date']}")
+    if not parts and not filters.get("transaction_type"):
+        return ""
+    kind = f"{filters['transaction_type']} transactions" if filters.get("transaction_type") else "transactions"
+    return " ".join([kind, *parts])
+
+
+def render_transactions(system_data: Dict[str, Any]) -> str:
+    transactions = system_data.get("transactions") or []
+    described = _describe_filters(system_data.get("filters"))
+    if not transactions:
+        return NO_TRANSACTIONS_REPLY.format(transactions=described or "transactions")
+    rows = []
+    for index, transaction in enumerate(transactions, 1):
+        merchant = transaction.get("merchant_name")
+        rows.append(TRANSACTION_ROW.format(
+            index=index, date=str(transaction.get("transaction_date") or "")[:10] or "unknown date",
+            transaction_type=_label(transaction.get("transaction_type")).title() or "Transaction",
+            amount=_amount(transaction.get("amount")), description=transaction.get("description") or "no description",
+            merchant=f" at {merchant}" if merchant and merchant != transaction.get("description") else ""
+        ))
+    header = f"Here are your {described}, newest first:" if described else "Here are your most recent transactions:"
+    return _list(header, rows, MORE_TRANSACTIONS if system_data.get("has_more") else "")
+
+
+def render_loans(system_data: Dict[str, Any]) -> str:
+    loans = system_data.get("loan_applications") or []
+    if not loans:
+        return NO_LOANS_REPLY
+    rows = []
+    for index, loan in enumerate(loans, 1):
+        terms = ""
+        if loan.get("interest_rate") is not None and loan.get("loan_term_months"):
+            terms = LOAN_TERMS.format(interest_rate=f"{float(loan['interest_rate']):g}", term=loan["loan_term_months"],
+                                      monthly_payment=_amount(loan.get("monthly_payment")))
+        rows.append(LOAN_ROW.format(
+            index=index, loan_type=_label(loan.get("loan_type")).title() or "Personal",
+            loan_amount=_amount(loan.get("loan_amount")),
+            purpose=f" for {_label(loan['loan_purpose'])}" if loan.get("loan_purpose") else "",
+            status=_label(loan.get("application_status")) or "pending", terms=terms
+        ))
+    return _list("Here are your loan applications:", rows)
+
+
+def render_no_active_cards(system_data: Dict[str, Any]) -> str:
+    return NO_ACTIVE_CARDS_REPLY
+
+
+def render_block_successful(system_data: Dict[str, Any]) -> str:
+    card = system_data.get("selected_card") or {}
+    return BLOCKED_REPLY.format(card_type=_label(card.get("card_type")) or "payment", last4=_last4(card))
+
+
+# Render function per handler action
+TEMPLATES: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "show_balance": render_balance,
+    "show_cards": render_cards,
+    "show_transactions": render_transactions,
+    "show_loans": render_loans,
+    "no_active_cards": render_no_active_cards,
+    "block_successful_verified": render_block_successful,
+}
+
+
+class TemplateRenderer:
+    """Renders the selected actions' replies without calling the LLM"""
+
+    def __init__(self, actions: Iterable[str] = ()):
+        self.actions = frozenset(actions)
+        self.rendered: Dict[str, int] = {}
+
+    def selected(self, action: Optional[str]) -> bool:
+        """Whether action's reply should come from its template"""
+        return action in self.actions
+
+    def render(self, system_data: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Templated reply for system_data's action, or None if it has no template"""
+        action = (system_data or {}).get("action")
+        template = TEMPLATES.get(action)
+        if template is None:
+            return None
+        try:
+            reply = template(system_data)
+        except Exception as e:
+            print(f"Template Render Error ({action}): {e}")
+            return None
+        self.rendered[action] = self.rendered.get(action, 0) + 1
+        return reply
+
+    def stats(self) -> Dict[str, Any]:
+        return {"llm_free_actions": sorted(self.actions), "rendered": dict(self.rendered)}
+
+
+def create_template_renderer() -> TemplateRenderer:
+    if os.getenv("LLM_FREE_MODE", "false").lower() in ("1", "true", "yes"):
+        return TemplateRenderer(TEMPLATES)
+    actions = [action.strip() for action in os.getenv("LLM_FREE_ACTIONS", "").split(",") if action.strip()]
+    unknown = [action for action in actions if action not in TEMPLATES]
+    if unknown:
+        print(f"LLM_FREE_ACTIONS: no template for {', '.join(unknown)}; those actions still use the LLM")
+    return TemplateRenderer(action for action in actions if action in TEMPLATES)
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# Set before any test imports database or services, so their module-level
+# singletons never touch the working directory or need a real API key
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="banking_tests_"), "banking_system.db"))
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+os.environ.setdefault("SESSION_STORE", "memory")
+
+
+@pytest.fixture
+def bank_db(tmp_path, monkeypatch):
+    """Point the shared db_manager (and so every service) at a fresh demo database"""
+    import database
+
+    fresh = database.DatabaseManager(str(tmp_path / "bank.db"))
+    for name in ("db_path", "demo_data", "initialized", "pool", "reads"):
+        monkeypatch.setattr(database.db_manager, name, getattr(fresh, name))
+    return database.db_manager
+
+
+@pytest.fixture
+def run_llm(monkeypatch):
+    """Returns run(scenario, latency=0.01, **env): awaits scenario(server, ai, engine)
+    with a ConversationAI and AdvancedWorkflowEngine built against a mock LLM"""
+    from loadtest import MockLLMServer
+
+    def run(scenario, latency=0.01, **env):
+        async def main():
+            server = MockLLMServer(latency=latency)
+            await server.start()
+            settings = {
+                "LLM_PROVIDER": "openai",
+                "OPENAI_BASE_URL": f"{server.base_url}/v1",
+                "LLM_MAX_RETRIES": "0",
+                "LLM_BREAKER_MIN_CALLS": "3",
+                "LLM_BREAKER_WINDOW_CALLS": "3",
+                "LLM_BREAKER_OPEN_SECONDS": "0.2",
+                "LLM_FREE_MODE": "false",
+                "LLM_FREE_ACTIONS": "",
+                **env
+            }
+            for name, value in settings.items():
+                monkeypatch.setenv(name, value)
+            import database
+            from services import AdvancedWorkflowEngine, ConversationAI
+
+            ai = ConversationAI()
+            engine = AdvancedWorkflowEngine(ai)
+            try:
+                return await scenario(server, ai, engine)
+            finally:
+                # Hung handlers on the mock would otherwise hold the loop open
+                server.fault = None
+                await ai.sessions.close()
+                await ai.llm.close()
+                await database.db_manager.close()
+                await server.stop()
+
+        return asyncio.run(main())
+
+    return run
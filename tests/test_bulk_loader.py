@@ -0,0 +1,74 @@
+import csv
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+from bulk_loader import BulkLoader
+from schema import ROLLUP_REBUILD_STATEMENTS
+from synthetic_data import SyntheticBankData
+
+ROOT = str(Path(__file__).resolve().parent.parent)
+ROLLUPS_QUERY = "SELECT * FROM transaction_rollups ORDER BY 1, 2, 3, 4, 5"
+
+
+def _split(path, first, second, at):
+    with open(path, newline="") as handle:
+        rows = list(csv.reader(handle))
+    for target, part in ((first, rows[1:at]), (second, rows[at:])):
+        with open(target, "w", newline="") as handle:
+            csv.writer(handle).writerows([rows[0], *part])
+    return rows
+
+
+def _load(db_path, files, rebuild_max_rows):
+    loader = BulkLoader(db_path, rebuild_max_rows=rebuild_max_rows, report_interval=60)
+    try:
+        loader.load(files)
+    finally:
+        loader.close()
+
+
+def test_delta_load_keeps_indexes_and_updates_rollups(tmp_path, capsys):
+    paths = SyntheticBankData(20, seed=7).write_extract(str(tmp_path / "extract"))
+    first, second = str(tmp_path / "first.csv"), str(tmp_path / "second.csv")
+    rows = _split(paths["transactions"], first, second, at=200)
+    # The delta also moves an already loaded transaction to another month
+    header, moved = rows[0], list(rows[1])
+    moved[header.index("transaction_date")] = "2020-01-15T12:00:00"
+    with open(second, "a", newline="") as handle:
+        csv.writer(handle).writerow(moved)
+
+    db_path = str(tmp_path / "bank.db")
+    _load(db_path, {table: [path] for table, path in paths.items() if table != "transactions"} |
+          {"transactions": [first]}, rebuild_max_rows=1000)
+    capsys.readouterr()
+    _load(db_path, {"transactions": [second]}, rebuild_max_rows=100)
+    output = capsys.readouterr().out
+    assert "keeping its indexes" in output
+    assert "account months" in output
+
+    conn = sqlite3.connect(db_path)
+    try:
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE tbl_name = 'transactions'")}
+        assert "idx_transactions_account_date_id" in names
+        assert "trg_transactions_rollup_insert" in names
+        assert conn.execute("SELECT COUNT(*) FROM bulk_load_deferred").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM bulk_load_rollup_months").fetchone()[0] == 0
+        after_delta = conn.execute(ROLLUPS_QUERY).fetchall()
+        with conn:
+            for statement in ROLLUP_REBUILD_STATEMENTS:
+                conn.execute(statement)
+        assert after_delta == conn.execute(ROLLUPS_QUERY).fetchall()
+        assert conn.execute("SELECT COUNT(*) FROM transaction_rollups WHERE day = '2020-01-15'").fetchone()[0] == 1
+    finally:
+        conn.close()
+
+
+def test_import_leaves_the_app_database_alone(tmp_path):
+    script = "import sys, bulk_loader; assert 'database' not in sys.modules"
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=30,
+                            cwd=str(tmp_path), env={**os.environ, "PYTHONPATH": ROOT})
+    assert result.returncode == 0, result.stderr
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+from connections import ConnectionManager
+
+
+class SlowSocket:
+    """Accepts one frame per release() call"""
+
+    def __init__(self):
+        self.frames = []
+        self.gate = asyncio.Semaphore(0)
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        await self.gate.acquire()
+        self.frames.append(json.loads(text))
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+    def release(self, frames: int = 1):
+        for _ in range(frames):
+            self.gate.release()
+
+
+def test_streamed_deltas_do_not_fill_the_queue():
+    async def scenario():
+        manager = ConnectionManager(max_queue=4, send_timeout=30)
+        socket = SlowSocket()
+        await manager.connect(socket, "s1", "u1")
+        chunks = [f"token{i} " for i in range(1000)]
+        for chunk in chunks:
+            assert manager.send_delta("s1", chunk)
+        assert manager.send("s1", json.dumps({"type": "assistant", "message": "".join(chunks)}))
+        assert "s1" in manager.connections
+        assert manager.queued() <= 2
+        socket.release(10)
+        while manager.queued():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        stats = manager.stats()
+        await manager.close()
+        return socket, chunks, stats
+
+    socket, chunks, stats = asyncio.run(scenario())
+    deltas = [frame for frame in socket.frames if frame["type"] == "assistant_delta"]
+    assert "".join(frame["delta"] for frame in deltas) == "".join(chunks)
+    assert all(frame["session_id"] == "s1" for frame in deltas)
+    assert socket.frames[-1]["type"] == "assistant"
+    assert stats["merged_deltas"] == len(chunks) - len(deltas)
+    assert socket.closed_with is None
+
+
+def test_full_queue_still_disconnects():
+    async def scenario():
+        manager = ConnectionManager(max_queue=4, send_timeout=30)
+        socket = SlowSocket()
+        await manager.connect(socket, "s1", "u1")
+        sent = [manager.send("s1", json.dumps({"type": "notification", "n": i})) for i in range(10)]
+        await asyncio.sleep(0.01)
+        stats = manager.stats()
+        await manager.close()
+        return sent, stats
+
+    sent, stats = asyncio.run(scenario())
+    assert not all(sent)
+    assert stats["disconnects"] == {"queue_full": 1}
@@ -0,0 +1,30 @@
+import asyncio
+import sqlite3
+
+from database import DatabaseManager, UserService
+
+
+def test_balance_and_transaction_writes_bump_the_data_version(tmp_path):
+    manager = DatabaseManager(str(tmp_path / "bank.db"))
+    users = UserService(manager)
+
+    def write(statement, *params):
+        conn = sqlite3.connect(manager.db_path)
+        with conn:
+            conn.execute(statement, params)
+        conn.close()
+
+    async def scenario():
+        versions = [await users.get_data_version("user_demo1")]
+        write("UPDATE accounts SET balance = balance - 100 WHERE account_id = ?", "acc_001")
+        versions.append(await users.get_data_version("user_demo1"))
+        write("INSERT INTO transactions (transaction_id, account_id, transaction_type, amount, description) "
+              "VALUES (?, ?, 'debit', 100, 'Coffee')", "txn_test", "acc_001")
+        versions.append(await users.get_data_version("user_demo1"))
+        write("DELETE FROM transactions WHERE transaction_id = ?", "txn_test")
+        versions.append(await users.get_data_version("user_demo1"))
+        await manager.close()
+        return versions
+
+    versions = asyncio.run(scenario())
+    assert versions == sorted(set(versions)), versions
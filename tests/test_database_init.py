@@ -0,0 +1,48 @@
+import asyncio
+import threading
+import time
+
+from database import DatabaseManager
+
+
+def test_first_connections_initialize_once_off_the_event_loop(tmp_path, monkeypatch):
+    manager = DatabaseManager(str(tmp_path / "lazy.db"), lazy=True)
+    runs = []
+    init_database = manager.init_database
+
+    def slow_init_database():
+        runs.append(threading.current_thread())
+        # Stands in for migrations over a large file
+        time.sleep(0.2)
+        init_database()
+
+    monkeypatch.setattr(manager, "init_database", slow_init_database)
+
+    async def scenario():
+        ticks = 0
+        stop = asyncio.Event()
+
+        async def ticker():
+            nonlocal ticks
+            while not stop.is_set():
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        async def query():
+            async with manager.get_connection() as conn:
+                cursor = await conn.execute("SELECT COUNT(*) FROM users")
+                return (await cursor.fetchone())[0]
+
+        ticking = asyncio.create_task(ticker())
+        counts = await asyncio.gather(*(query() for _ in range(5)))
+        stop.set()
+        await ticking
+        await manager.close()
+        return counts, ticks
+
+    counts, ticks = asyncio.run(scenario())
+    assert counts == [1] * 5
+    assert manager.initialized
+    assert len(runs) == 1 and runs[0] is not threading.main_thread()
+    # The loop kept running while the schema was being created
+    assert ticks >= 10
@@ -0,0 +1,67 @@
+import asyncio
+
+from history import ConversationHistory
+from models import ConversationContext
+
+
+def _turn(history, context, number):
+    history.apply_ready_summary(context)
+    history.append(context, "user", f"question {number}")
+    history.append(context, "assistant", f"answer {number}")
+    history.schedule_summary(context)
+
+
+def test_history_stays_bounded_when_summaries_never_finish():
+    async def stuck(previous, entries):
+        await asyncio.sleep(3600)
+
+    async def scenario():
+        history = ConversationHistory(window=4, max_pending=6, summarizer=stuck)
+        context = ConversationContext(session_id="s", user_id="user_demo1")
+        for number in range(50):
+            _turn(history, context, number)
+            await asyncio.sleep(0)
+            assert len(context.conversation_history) <= 4
+            assert len(context.unsummarized_history) <= 6
+            assert history.message_count(context) == 2 * (number + 1)
+        await history.close()
+        return history, context
+
+    history, context = asyncio.run(scenario())
+    # The local fallback folded the overflow in, keeping the summary bounded too
+    assert history.extractive_folds > 0 and history.summaries == 0
+    assert "question" in context.history_summary
+    assert len(context.history_summary) <= history.summary_max_tokens * 4 + 3
+    assert context.conversation_history[-1]["message"] == "answer 49"
+
+
+def test_background_summary_is_applied_on_next_turn():
+    calls = []
+
+    async def summarizer(previous, entries):
+        calls.append(len(entries))
+        return f"summary of {len(entries)} more after [{previous}]"
+
+    async def scenario():
+        history = ConversationHistory(window=4, max_pending=6, summarizer=summarizer)
+        context = ConversationContext(session_id="s", user_id="user_demo1")
+        for number in range(3):
+            _turn(history, context, number)
+            await asyncio.sleep(0)
+        # Turn 3 pushed two messages out of the window; the summary of them is
+        # ready but not yet part of the context
+        assert context.history_summary == "" and len(context.unsummarized_history) == 2
+        _turn(history, context, 3)
+        assert context.history_summary == "summary of 2 more after []"
+        assert context.summarized_messages == 2
+        for number in range(4, 40):
+            _turn(history, context, number)
+            await asyncio.sleep(0)
+            assert len(context.conversation_history) <= 4 and len(context.unsummarized_history) <= 6
+        await history.close()
+        return history, context
+
+    history, context = asyncio.run(scenario())
+    assert history.extractive_folds == 0
+    assert history.message_count(context) == 80
+    assert context.history_summary.startswith("summary of ")
@@ -0,0 +1,33 @@
+from benchmarks import legacy_fallback_intent, synthetic_messages
+from intent_classifier import KeywordIntentClassifier
+from models import ConversationContext, Intent
+
+# Substring matching is kept on purpose: these contain "card", "stop" and "hi"
+LOOK_ALIKES = ["cardboard", "stopwatch", "histories", "cardboard box, stopwatch and histories",
+               "I lost my cardboard stopwatch", "this is fine", "Hi!", "nothing to see"]
+
+
+def test_keyword_classifier_matches_legacy_chain():
+    from services import ConversationAI
+
+    messages = synthetic_messages(5000, seed=11) + LOOK_ALIKES
+    classifier = KeywordIntentClassifier()
+    expected = [legacy_fallback_intent(message) for message in messages]
+
+    assert [classifier.classify(message) for message in messages] == expected
+    assert classifier.classify_batch(messages) == expected
+    context = ConversationContext(session_id="s", user_id="user_demo1")
+    assert [ConversationAI._fallback_analysis(None, message, context)["intent"] for message in messages] == expected
+    # Every intent of the chain is reached, so the comparison is not vacuous
+    assert set(expected) >= {Intent.CARD_BLOCKING, Intent.CARD_APPLICATION, Intent.LOAN_INQUIRY,
+                             Intent.LOAN_APPLICATION, Intent.BALANCE_INQUIRY, Intent.TRANSACTION_HISTORY,
+                             Intent.CARD_INQUIRY, Intent.GREETING, Intent.GENERAL_INQUIRY}
+
+
+def test_look_alike_words_keep_legacy_intents():
+    classifier = KeywordIntentClassifier()
+    assert classifier.classify("cardboard") == Intent.CARD_INQUIRY
+    assert classifier.classify("stopwatch") == Intent.GENERAL_INQUIRY
+    # "histories" does not contain "history", only "hi"
+    assert classifier.classify("histories") == Intent.GREETING
+    assert classifier.classify("I lost my cardboard stopwatch") == Intent.CARD_BLOCKING
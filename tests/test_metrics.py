@@ -0,0 +1,87 @@
+import re
+
+from fastapi.testclient import TestClient
+
+from metrics import MetricsRegistry
+
+SAMPLE_PATTERN = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL_PATTERN = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(?:,|$)')
+
+
+def parse_exposition(text):
+    """{(sample name, sorted label pairs): value}, asserting the text is well formed"""
+    samples, typed = {}, {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert kind in ("counter", "gauge", "histogram")
+            typed[name] = kind
+            continue
+        if line.startswith("# HELP ") or not line:
+            continue
+        match = SAMPLE_PATTERN.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        pairs = LABEL_PATTERN.findall(labels or "")
+        assert ",".join(f'{k}="{v}"' for k, v in pairs) == (labels or ""), line
+        family = re.sub(r"_(bucket|sum|count)$", "", name) if name not in typed else name
+        assert family in typed, f"{name} has no TYPE line"
+        key = (name, tuple(sorted(pairs)))
+        assert key not in samples, f"duplicate sample {line}"
+        samples[key] = float(value)
+    return samples
+
+
+def _sample(samples, name, **labels):
+    return samples.get((name, tuple(sorted(labels.items()))), 0.0)
+
+
+def test_metrics_after_one_turn(bank_db, run_llm):
+    import main
+
+    client = TestClient(main.app)
+    before = parse_exposition(client.get("/metrics").text)
+
+    async def scenario(server, ai, engine):
+        return await engine.handle_conversation("user_demo1", "What's my balance?", "metrics-turn")
+
+    run_llm(scenario, INTENT_ROUTER="false", FUSED_PIPELINE="false", RESPONSE_CACHE_TTL="0", PREFETCH_READS="false")
+    response = client.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    after = parse_exposition(response.text)
+
+    def delta(name, **labels):
+        return _sample(after, name, **labels) - _sample(before, name, **labels)
+
+    turn = {"intent": "balance_inquiry", "workflow_step": "none"}
+    for stage in ("intent_analysis", "route", "handler", "response_generation"):
+        assert delta("banking_stage_seconds_count", stage=stage, **turn) == 1, stage
+    # The analysis call runs before the intent is known; the reply's call after
+    assert delta("banking_llm_tokens_total", purpose="analysis", kind="prompt", intent="none",
+                 workflow_step="none") > 0
+    assert delta("banking_llm_tokens_total", purpose="response", kind="completion", **turn) > 0
+    assert delta("banking_db_connection_wait_seconds_count", **turn) >= 1
+    assert delta('banking_db_connection_wait_seconds_bucket', le="+Inf", **turn) == \
+        delta("banking_db_connection_wait_seconds_count", **turn)
+    assert delta("banking_turn_seconds_count", mode="two_call", intent="balance_inquiry") == 1
+
+
+def test_failing_gauge_is_reported_once_per_failure_streak(capsys):
+    registry = MetricsRegistry()
+    state = {"fail": True}
+
+    def read():
+        if state["fail"]:
+            raise RuntimeError("pool gone")
+        return {(): 3}
+
+    registry.gauge("test_gauge", "Gauge under test", (), read)
+    for _ in range(3):
+        parse_exposition(registry.render())
+    assert capsys.readouterr().out.count("Metrics Gauge Error") == 1
+
+    state["fail"] = False
+    assert _sample(parse_exposition(registry.render()), "test_gauge") == 3
+    state["fail"] = True
+    registry.render()
+    assert capsys.readouterr().out.count("Metrics Gauge Error") == 1
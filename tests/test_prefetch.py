@@ -0,0 +1,66 @@
+import asyncio
+
+from metrics import DB_PREFETCH
+from models import ConversationContext
+
+SETTINGS = {"INTENT_ROUTER": "false", "FUSED_PIPELINE": "false", "RESPONSE_CACHE_TTL": "0", "PREFETCH_READS": "true"}
+
+
+def _outcomes(read):
+    return {outcome: DB_PREFETCH.value(read, outcome) for outcome in ("used", "unused", "stale")}
+
+
+def _delta(before, after):
+    return {outcome: after[outcome] - before[outcome] for outcome in before}
+
+
+def test_prefetched_read_is_used_by_the_handler(bank_db, run_llm):
+    async def scenario(server, ai, engine):
+        before = _outcomes("get_user_accounts")
+        response = await engine.handle_conversation("user_demo1", "What's my balance?", "prefetch-used")
+        return before, response, engine.prefetch_stats
+
+    before, response, stats = run_llm(scenario, **SETTINGS)
+    assert _delta(before, _outcomes("get_user_accounts")) == {"used": 1, "unused": 0, "stale": 0}
+    assert stats["started"] == 1 and stats["unused"] == 0
+    # The prefetch was the turn's only accounts query; the handler reused it
+    assert bank_db.reads.db_reads == 1
+    assert response["response"]
+
+
+def test_prefetch_for_a_different_intent_is_unused(bank_db, run_llm):
+    async def scenario(server, ai, engine):
+        before = _outcomes("get_user_accounts")
+        # Keywords say transaction history; the model says card inquiry
+        await engine.handle_conversation("user_demo1", "Show my card transactions", "prefetch-unused")
+        context = await ai.sessions.get("prefetch-unused")
+        return before, context.current_intent.value
+
+    before, intent = run_llm(scenario, **SETTINGS)
+    assert intent == "card_inquiry"
+    assert _delta(before, _outcomes("get_user_accounts")) == {"used": 0, "unused": 1, "stale": 0}
+
+
+def test_write_after_prefetch_discards_the_prefetched_read(bank_db, run_llm):
+    async def scenario(server, ai, engine):
+        from database import card_service, prefetched_reads
+
+        before = _outcomes("get_user_cards")
+        context = ConversationContext(session_id="prefetch-stale", user_id="user_demo1")
+        prefetched = {}
+        token = prefetched_reads.set(prefetched)
+        try:
+            engine._start_prefetch(context, "Block my card", prefetched)
+            # Let the prefetch finish with the card still active
+            await asyncio.gather(*prefetched.values())
+            result = await card_service.block_card("card_001", "Lost card")
+            cards = await card_service.get_user_cards("user_demo1")
+            engine._finish_prefetch(prefetched)
+        finally:
+            prefetched_reads.reset(token)
+        return before, result, cards
+
+    before, result, cards = run_llm(scenario, **SETTINGS)
+    assert result["success"]
+    assert {card["card_id"]: card["card_status"] for card in cards}["card_001"] == "blocked"
+    assert _delta(before, _outcomes("get_user_cards")) == {"used": 0, "unused": 0, "stale": 1}
@@ -0,0 +1,49 @@
+import pytest
+
+from prompts import _fit, compact_json, count_tokens
+
+TRANSACTION = {"transaction_date": "2024-01-15 14:30:00", "transaction_type": "debit", "amount": 85.5,
+               "description": "Grocery Store Purchase", "merchant_name": "FreshMart Grocery"}
+
+
+def _list_heavy():
+    return {"action": "show_transactions",
+            "accounts": [{"account_number": f"ACC-{i:09d}", "notes": "overdraft review " * 40} for i in range(3)],
+            "transactions": [dict(TRANSACTION, transaction_id=f"txn_{i}") for i in range(300)]}
+
+
+def _string_heavy():
+    return {"action": "show_loans", "error": "Loan service unavailable, retry later. " * 300,
+            "loan_applications": [{"loan_type": "personal", "loan_amount": 15000.0}]}
+
+
+@pytest.mark.parametrize("payload", [_list_heavy, _string_heavy])
+@pytest.mark.parametrize("budget", [40, 200, 1500])
+def test_fit_stays_within_budget(payload, budget):
+    data = payload()
+    fitted = _fit(data, budget)
+    assert count_tokens(compact_json(fitted)) <= budget
+    assert fitted["action"] == data["action"]
+
+
+def test_fit_trims_the_costliest_list_first():
+    data = _list_heavy()
+    data["accounts"] = [dict(account, notes="overdraft review " * 150) for account in data["accounts"]]
+    data["transactions"] = data["transactions"][:20]
+    budget = count_tokens(compact_json(data)) - 50
+    fitted = _fit(data, budget)
+    # Twenty small rows cost less in all than the three wide ones, so only the wide list loses a row
+    assert fitted["transactions"] == data["transactions"]
+    assert len(fitted["accounts"]) == 2 and fitted["accounts_omitted"] == 1
+
+
+def test_fit_shortens_long_strings_as_a_last_resort():
+    fitted = _fit(_string_heavy(), 300)
+    assert fitted["error"].startswith("Loan service unavailable") and fitted["error"].endswith("…")
+    # Lists go before any scalar field is touched
+    assert "loan_applications" not in fitted and fitted["loan_applications_omitted"] == 1
+
+
+def test_fit_leaves_small_payloads_alone():
+    data = {"action": "show_balance", "accounts": [{"balance": 10.0}]}
+    assert _fit(data, 100) is data
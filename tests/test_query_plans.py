@@ -0,0 +1,27 @@
+from database import DatabaseManager
+
+
+def test_service_queries_use_indexes(tmp_path):
+    manager = DatabaseManager(str(tmp_path / "plans.db"))
+    results = manager.explain_service_queries()
+    assert results
+    problems = {name: result["problems"] for name, result in results.items() if not result["ok"]}
+    assert not problems, problems
+
+
+def test_import_does_not_create_database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = DatabaseManager("banking_system.db", lazy=True)
+    assert not manager.initialized
+    assert not (tmp_path / "banking_system.db").exists()
+
+
+def test_filtered_transaction_pages_seek_their_own_index(tmp_path):
+    results = DatabaseManager(str(tmp_path / "plans.db")).explain_service_queries()
+    for name, index in (("AccountService.get_transactions_page[transaction_type]",
+                         "idx_transactions_account_type_date_id"),
+                        ("AccountService.get_transactions_page[merchant]",
+                         "idx_transactions_account_merchant_date_id")):
+        assert results[name]["ok"], results[name]["problems"]
+        assert results[name]["plan"] == [step for step in results[name]["plan"]
+                                         if step.startswith(f"SEARCH transactions USING INDEX {index} ")], results[name]
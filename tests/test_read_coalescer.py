@@ -0,0 +1,60 @@
+import asyncio
+
+from database import CardService, ReadCoalescer
+
+
+def _with_reads(db, monkeypatch, ttl):
+    monkeypatch.setattr(db, "reads", ReadCoalescer(enabled=True, ttl=ttl))
+    return CardService(db)
+
+
+def test_concurrent_reads_share_one_query(bank_db, monkeypatch):
+    cards = _with_reads(bank_db, monkeypatch, ttl=0)
+
+    async def scenario():
+        results = await asyncio.gather(*(cards.get_user_cards("user_demo1") for _ in range(20)))
+        await bank_db.close()
+        return results
+
+    results = asyncio.run(scenario())
+    assert bank_db.reads.db_reads == 1
+    assert bank_db.reads.coalesced == 19
+    assert all(result == results[0] for result in results) and len(results[0]) == 3
+    # Each caller owns its rows
+    results[0][0]["card_status"] = "mutated"
+    assert results[1][0]["card_status"] != "mutated"
+
+
+def test_cached_read_expires_after_ttl(bank_db, monkeypatch):
+    cards = _with_reads(bank_db, monkeypatch, ttl=0.2)
+
+    async def scenario():
+        await cards.get_user_cards("user_demo1")
+        await cards.get_user_cards("user_demo1")
+        reads_within_ttl = bank_db.reads.db_reads
+        await asyncio.sleep(0.3)
+        await cards.get_user_cards("user_demo1")
+        await bank_db.close()
+        return reads_within_ttl
+
+    assert asyncio.run(scenario()) == 1
+    assert bank_db.reads.db_reads == 2
+
+
+def test_blocking_a_card_invalidates_cached_reads(bank_db, monkeypatch):
+    cards = _with_reads(bank_db, monkeypatch, ttl=60)
+
+    async def scenario():
+        before = await cards.get_user_cards("user_demo1")
+        result = await cards.block_card("card_001", "Lost card")
+        after = await cards.get_user_cards("user_demo1")
+        await bank_db.close()
+        return before, result, after
+
+    before, result, after = asyncio.run(scenario())
+    status = lambda rows: {card["card_id"]: card["card_status"] for card in rows}
+    assert result["success"]
+    assert status(before)["card_001"] == "active"
+    assert status(after)["card_001"] == "blocked"
+    assert bank_db.reads.invalidations == 1
+    assert bank_db.reads.db_reads == 2
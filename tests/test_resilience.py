@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+
+from models import ConversationContext
+from resilience import DEGRADED_REPLIES, CircuitBreaker, CircuitOpenError, turn_deadline
+
+MESSAGES = [{"role": "user", "content": "Say hello"}]
+
+
+async def _call(ai, budget=None):
+    token = turn_deadline.set(time.monotonic() + budget if budget else None)
+    try:
+        return await ai._chat_completion("response", messages=MESSAGES, max_tokens=20)
+    finally:
+        turn_deadline.reset(token)
+
+
+@pytest.mark.parametrize("llm_timeout, budget", [(5.0, 0.2), (0.2, None)], ids=["turn_budget", "llm_timeout"])
+def test_hung_provider_opens_breaker(run_llm, llm_timeout, budget):
+    """Calls cut off by either deadline while the provider has them count
+    against it, so the breaker opens instead of every turn waiting them out"""
+    async def scenario(server, ai, engine):
+        server.fault, server.fault_latency = "hang", 5
+        for _ in range(3):
+            with pytest.raises(asyncio.TimeoutError):
+                await _call(ai, budget)
+        assert ai.breaker.state == CircuitBreaker.OPEN
+        started = time.perf_counter()
+        with pytest.raises(CircuitOpenError):
+            await _call(ai, budget)
+        assert time.perf_counter() - started < 0.05
+
+    run_llm(scenario, LLM_TIMEOUT=str(llm_timeout))
+
+
+def test_error_responses_open_breaker_and_probe_recovers(run_llm):
+    async def scenario(server, ai, engine):
+        server.fault = "error"
+        for _ in range(3):
+            with pytest.raises(Exception):
+                await _call(ai)
+        assert ai.breaker.state == CircuitBreaker.OPEN
+
+        # A failed probe reopens the breaker for another open period
+        await asyncio.sleep(0.25)
+        with pytest.raises(Exception):
+            await _call(ai)
+        assert ai.breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            await _call(ai)
+
+        server.fault = None
+        await asyncio.sleep(0.25)
+        response = await _call(ai)
+        assert response.content
+        assert ai.breaker.state == CircuitBreaker.CLOSED
+        assert ai.breaker.stats()["times_opened"] == 2
+
+    run_llm(scenario)
+
+
+def test_slow_call_is_hedged(run_llm):
+    from metrics import LLM_HEDGES
+
+    async def scenario(server, ai, engine):
+        for _ in range(ai.latencies.min_samples):
+            ai.latencies.add("response", 0.02)
+        hedges = LLM_HEDGES.value("response")
+        response = await _call(ai)
+        assert response.content
+        assert LLM_HEDGES.value("response") == hedges + 1
+
+    run_llm(scenario, latency=0.2, LLM_HEDGE="true", LLM_HEDGE_MIN_DELAY="0.05")
+
+
+def test_open_breaker_gives_degraded_reply(run_llm):
+    """Data replies fall back to their template, the rest to DEGRADED_REPLIES"""
+    async def scenario(server, ai, engine):
+        server.fault = "error"
+        for _ in range(3):
+            with pytest.raises(Exception):
+                await _call(ai)
+        served = server.requests_served
+        context = ConversationContext(session_id="s1", user_id="user_demo1")
+        accounts = [{"account_type": "checking", "account_number": "ACC-123456789", "balance": 2500.75}]
+        reply = await ai.generate_response(context, "What's my balance?", {"action": "show_balance",
+                                                                         "accounts": accounts})
+        assert "ending 6789, balance 2,500.75" in reply
+        reply = await ai.generate_response(context, "Block my card", {"action": "ask_dob_verification"})
+        assert reply == DEGRADED_REPLIES["ask_dob_verification"]
+        assert server.requests_served == served
+
+    run_llm(scenario, LLM_BREAKER_OPEN_SECONDS="30")
+
+
+def test_only_the_probe_decides_half_open():
+    breaker = CircuitBreaker(window_calls=3, min_calls=3, open_seconds=0)
+    stale_success, stale_cancelled = breaker.allow(), breaker.allow()
+    for _ in range(3):
+        breaker.record(breaker.allow(), False, 0.1)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    probe = breaker.allow()
+    assert probe.probe and breaker.state == CircuitBreaker.HALF_OPEN
+    # Calls started before the circuit opened finish during the probe
+    breaker.record(stale_success, True, 0.1)
+    breaker.abandon(stale_cancelled)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() is None
+
+    breaker.record(probe, True, 0.1)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() is not None
+
+
+def test_abandoned_probe_lets_another_through():
+    breaker = CircuitBreaker(window_calls=1, min_calls=1, open_seconds=0)
+    breaker.record(breaker.allow(), False, 0.1)
+    probe = breaker.allow()
+    assert breaker.allow() is None
+    breaker.abandon(probe)
+    assert breaker.allow().probe
+
+
+
+def test_expected_llm_outcomes_are_not_logged_as_errors(run_llm, capsys):
+    async def scenario(server, ai, engine):
+        server.fault, server.fault_latency = "hang", 5
+        context = ConversationContext(session_id="s1", user_id="user_demo1")
+        token = turn_deadline.set(time.monotonic() + 0.2)
+        try:
+            analysis = await ai.analyze_intent_and_entities("What's my balance?", context)
+            reply = await ai.generate_response(context, "Hello", {"action": "greeting"})
+        finally:
+            turn_deadline.reset(token)
+        return analysis, reply
+
+    analysis, reply = run_llm(scenario, LLM_TIMEOUT="5")
+    assert analysis["intent"].value == "balance_inquiry"
+    assert reply == DEGRADED_REPLIES["greeting"]
+    assert "Error" not in capsys.readouterr().out
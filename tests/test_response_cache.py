@@ -0,0 +1,28 @@
+import sqlite3
+
+
+def test_repeated_balance_question_is_one_miss_then_one_hit(bank_db, run_llm):
+    async def scenario(server, ai, engine):
+        replies = engine.response_cache.replies
+        first = await engine.handle_conversation("user_demo1", "What's my balance?", "s1")
+        assert (replies.misses, replies.hits) == (1, 0)
+        served = server.requests_served
+
+        second = await engine.handle_conversation("user_demo1", "What's my balance?", "s1")
+        assert (replies.misses, replies.hits) == (1, 1)
+        assert second["response"] == first["response"]
+        assert second.get("cached")
+        assert server.requests_served == served
+
+        # The balance changes: the known question misses once, not once per lookup
+        conn = sqlite3.connect(bank_db.db_path)
+        with conn:
+            conn.execute("UPDATE accounts SET balance = balance + 1 WHERE account_id = 'acc_001'")
+        conn.close()
+        third = await engine.handle_conversation("user_demo1", "What's my balance?", "s1")
+        assert (replies.misses, replies.hits) == (2, 1)
+        assert not third.get("cached")
+        assert server.requests_served > served
+        assert engine.response_cache.stats()["replies"]["hit_rate"] == round(1 / 3, 4)
+
+    run_llm(scenario)
@@ -0,0 +1,64 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from database import SpendingService
+
+RAW_TOTALS = """
+SELECT account_id, date(transaction_date), transaction_type, COALESCE(merchant_name, ''),
+       round(SUM(amount), 6), COUNT(*)
+FROM transactions GROUP BY 1, 2, 3, 4
+"""
+
+ROLLUP_TOTALS = """
+SELECT account_id, day, transaction_type, merchant_name, round(SUM(total_amount), 6), SUM(transaction_count)
+FROM transaction_rollups GROUP BY 1, 2, 3, 4
+"""
+
+INSERT = ("INSERT INTO transactions (transaction_id, account_id, transaction_type, amount, description, "
+          "merchant_name, transaction_date) VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+
+def _rollups(conn):
+    return sorted(conn.execute("SELECT account_id, day, transaction_type, category, merchant_name, "
+                               "round(total_amount, 6), transaction_count FROM transaction_rollups").fetchall())
+
+
+def _assert_matches_raw(conn):
+    assert sorted(conn.execute(ROLLUP_TOTALS).fetchall()) == sorted(conn.execute(RAW_TOTALS).fetchall())
+
+
+@pytest.mark.parametrize("write, params", [
+    (INSERT, ("txn_new", "acc_001", "debit", 12.25, "Coffee", "Shell Gas Station", "2024-01-14 18:00:00")),
+    ("UPDATE transactions SET amount = 99.99 WHERE transaction_id = ?", ("txn_001",)),
+    ("UPDATE transactions SET transaction_type = 'credit' WHERE transaction_id = ?", ("txn_002",)),
+    ("UPDATE transactions SET transaction_date = '2024-02-03 10:00:00' WHERE transaction_id = ?", ("txn_001",)),
+    ("UPDATE transactions SET account_id = 'acc_002' WHERE transaction_id = ?", ("txn_002",)),
+    ("UPDATE transactions SET description = 'Coffee', merchant_name = 'Corner Cafe' WHERE transaction_id = ?",
+     ("txn_001",)),
+    ("DELETE FROM transactions WHERE transaction_id = ?", ("txn_004",)),
+])
+def test_triggers_keep_rollups_equal_to_raw_sums(bank_db, write, params):
+    conn = sqlite3.connect(bank_db.db_path)
+    try:
+        _assert_matches_raw(conn)
+        with conn:
+            # A second row on the same rollup key, so updates split a group instead of moving it whole
+            conn.execute(INSERT, ("txn_twin", "acc_001", "debit", 14.5, "Gas Station", "Shell Gas Station",
+                                  "2024-01-14 20:00:00"))
+            conn.execute(write, params)
+        _assert_matches_raw(conn)
+        maintained = _rollups(conn)
+
+        asyncio.run(_rebuild(bank_db))
+        # A full rebuild, categories included, agrees with what the triggers kept
+        assert _rollups(conn) == maintained
+        _assert_matches_raw(conn)
+    finally:
+        conn.close()
+
+
+async def _rebuild(db):
+    await SpendingService(db).rebuild_rollups()
+    await db.close()
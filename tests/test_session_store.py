@@ -0,0 +1,126 @@
+import asyncio
+import subprocess
+import sys
+import textwrap
+
+import pytest
+from pathlib import Path
+
+from models import ConversationContext, ConversationState, Intent
+from session_store import SQLiteSessionStore
+
+ROOT = str(Path(__file__).resolve().parent.parent)
+
+
+def _mid_workflow_context() -> ConversationContext:
+    return ConversationContext(
+        session_id="session-1",
+        user_id="user_001",
+        current_intent=Intent.LOAN_APPLICATION,
+        conversation_state=ConversationState.COLLECTING_INFO,
+        collected_data={"loan_amount": 25000},
+        conversation_history=[{"role": "user", "content": "I want a loan"}],
+        workflow_step="loan_purpose"
+    )
+
+
+def test_second_store_resumes_session(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+
+    async def scenario():
+        first = SQLiteSessionStore(db_path, flush_interval=0.01)
+        await first.save(_mid_workflow_context())
+        await first.close()
+
+        second = SQLiteSessionStore(db_path)
+        resumed = await second.get("session-1")
+        missing = await second.get("session-2")
+        await second.close()
+        return resumed, missing
+
+    resumed, missing = asyncio.run(scenario())
+    assert resumed == _mid_workflow_context()
+    assert missing is None
+
+
+def test_other_process_resumes_session(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+
+    async def write():
+        store = SQLiteSessionStore(db_path)
+        await store.save(_mid_workflow_context())
+        await store.close()
+
+    asyncio.run(write())
+    script = textwrap.dedent(f"""
+        import asyncio
+        from session_store import SQLiteSessionStore
+
+        async def main():
+            store = SQLiteSessionStore({db_path!r})
+            context = await store.get("session-1")
+            await store.close()
+            print(context.model_dump_json())
+
+        asyncio.run(main())
+    """)
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=30, cwd=ROOT)
+    assert result.returncode == 0, result.stderr
+    assert ConversationContext.model_validate_json(result.stdout) == _mid_workflow_context()
+
+
+def test_expired_session_is_not_resumed(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+
+    async def scenario():
+        first = SQLiteSessionStore(db_path)
+        await first.save(_mid_workflow_context())
+        await first.close()
+        second = SQLiteSessionStore(db_path, idle_ttl=0)
+        await asyncio.sleep(0.01)
+        context = await second.get("session-1")
+        await second.close()
+        return context
+
+    assert asyncio.run(scenario()) is None
+
+
+CARD_BLOCKING_TURNS = [("Block my card", "card_selection"), ("1", "dob_verification"),
+                       ("1990-01-01", "reason_collection")]
+
+
+def _handoff(run_llm, tmp_path, flush_interval, pause=0.0):
+    """Turns 1-2 of card blocking on worker A, turn 3 on worker B; returns B's
+    step and how many snapshots A still had unwritten after each of its turns"""
+    async def scenario(server, ai_a, engine_a):
+        from services import AdvancedWorkflowEngine, ConversationAI
+
+        ai_b = ConversationAI()
+        engine_b = AdvancedWorkflowEngine(ai_b)
+        pending = []
+        try:
+            for message, step in CARD_BLOCKING_TURNS[:2]:
+                await engine_a.handle_conversation("user_demo1", message, "handoff")
+                pending.append(ai_a.sessions.stats()["pending"])
+                assert (await ai_a.sessions.get("handoff")).workflow_step == step
+            await asyncio.sleep(pause)
+            await engine_b.handle_conversation("user_demo1", CARD_BLOCKING_TURNS[2][0], "handoff")
+            return (await ai_b.sessions.get("handoff")).workflow_step, pending
+        finally:
+            await ai_b.sessions.close()
+            await ai_b.llm.close()
+
+    return run_llm(scenario, SESSION_STORE="sqlite", SESSION_DB_PATH=str(tmp_path / "sessions.db"),
+                   SESSION_FLUSH_INTERVAL=str(flush_interval))
+
+
+def test_write_through_hands_card_blocking_to_another_worker(bank_db, run_llm, tmp_path):
+    assert _handoff(run_llm, tmp_path, 0) == ("reason_collection", [0, 0])
+
+
+@pytest.mark.parametrize("pause, resumed", [(0.0, False), (0.5, True)])
+def test_write_behind_is_stale_within_flush_interval(bank_db, run_llm, tmp_path, pause, resumed):
+    # Worker B only sees worker A's turns once A has flushed them
+    step, pending = _handoff(run_llm, tmp_path, 0.2, pause=pause)
+    assert pending == [1, 1]
+    assert (step == "reason_collection") is resumed
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from models import ConversationContext
+from resilience import DEGRADED_REPLIES
+from services import RESPONSE_CLEANUP_PATTERN
+from templates import NO_ACTIVE_CARDS_REPLY, TEMPLATES
+
+CHECKING = {"account_type": "checking", "account_number": "ACC-123456789", "balance": 2500.75, "status": "active"}
+SAVINGS = {"account_type": "savings", "account_number": "ACC-987654321", "balance": 15000.0, "status": "active"}
+DEBIT_CARD = {"card_type": "debit", "card_number": "4532-1234-5678-9012", "card_status": "active", "credit_limit": 0}
+CREDIT_CARD = {"card_type": "credit", "card_number": "5678-9012-3456-7890", "card_status": "active",
+               "credit_limit": 10000, "available_credit": 8500}
+GROCERIES = {"transaction_date": "2024-01-15 14:30:00", "transaction_type": "debit", "amount": 85.5,
+             "description": "Grocery Store Purchase", "merchant_name": "FreshMart Grocery"}
+LOAN = {"loan_type": "personal", "loan_amount": 15000.0, "loan_purpose": "Home renovation",
+        "application_status": "approved", "interest_rate": 8.5, "loan_term_months": 36, "monthly_payment": 475.5}
+
+CASES = [
+    ({"action": "show_balance", "accounts": [CHECKING, SAVINGS]},
+     "Here are your account balances:\n"
+     "1: Checking account ending 6789, balance 2,500.75\n"
+     "2: Savings account ending 4321, balance 15,000.00\n"
+     "Total across your accounts: 17,500.75"),
+    ({"action": "show_balance", "accounts": []}, "You have no accounts with us yet."),
+    ({"action": "show_cards", "cards": [DEBIT_CARD, CREDIT_CARD]},
+     "Here are your cards:\n"
+     "1: Debit card ending 9012, active\n"
+     "2: Credit card ending 7890, active, available credit 8,500.00 of 10,000.00"),
+    ({"action": "show_transactions", "transactions": [GROCERIES], "filters": {}, "has_more": False},
+     "Here are your most recent transactions:\n"
+     "1: 2024-01-15, Debit of 85.50, Grocery Store Purchase at FreshMart Grocery"),
+    ({"action": "show_transactions", "transactions": [GROCERIES], "has_more": True,
+      "filters": {"transaction_type": "debit", "merchant": "FreshMart", "start_date": "2024-01-01"}},
+     "Here are your debit transactions at FreshMart since 2024-01-01, newest first:\n"
+     "1: 2024-01-15, Debit of 85.50, Grocery Store Purchase at FreshMart Grocery\n"
+     "There are more transactions. Say show me more to see the next page."),
+    ({"action": "show_transactions", "transactions": [], "filters": {"merchant": "Shell"}},
+     "I found no transactions at Shell."),
+    ({"action": "show_loans", "loan_applications": [LOAN]},
+     "Here are your loan applications:\n"
+     "1: Personal loan of 15,000.00 for Home renovation, approved, 8.5 percent over 36 months, "
+     "monthly payment 475.50"),
+    ({"action": "no_active_cards", "active_cards": []}, NO_ACTIVE_CARDS_REPLY),
+    ({"action": "block_successful_verified", "selected_card": DEBIT_CARD},
+     "Your debit card ending 9012 is now blocked and can no longer be used. If you need a replacement card, "
+     "just ask. Is there anything else I can help you with?"),
+]
+
+
+def test_every_template_has_a_case():
+    assert {data["action"] for data, _ in CASES} == set(TEMPLATES)
+
+
+def _generate(run_llm, fault=None, **env):
+    async def scenario(server, ai, engine):
+        server.fault = fault
+        context = ConversationContext(session_id="templates", user_id="user_demo1")
+        replies = [await ai.generate_response(context, "question", data) for data, _ in CASES]
+        replies.append(await ai.generate_response(context, "Block my card", {"action": "ask_dob_verification"}))
+        return replies, server.requests_served
+
+    return run_llm(scenario, **env)
+
+
+def test_llm_free_mode_renders_templates_without_the_llm(run_llm):
+    replies, requests = _generate(run_llm, LLM_FREE_MODE="true")
+    assert replies[:-1] == [expected for _, expected in CASES]
+    # Actions without a template still go to the model
+    assert requests == 1
+    for reply in replies[:-1]:
+        assert RESPONSE_CLEANUP_PATTERN.sub("", reply) == reply
+
+
+def test_failed_llm_call_falls_back_to_template_or_degraded_reply(run_llm):
+    replies, _ = _generate(run_llm, fault="error", LLM_BREAKER_MIN_CALLS="100")
+    assert replies[:-1] == [expected for _, expected in CASES]
+    assert replies[-1] == DEGRADED_REPLIES["ask_dob_verification"]
@@ -0,0 +1,108 @@
+import asyncio
+import random
+import time
+
+from tracing import SpanExporter, Tracer
+
+
+class MemoryExporter(SpanExporter):
+    """Keeps exported traces in a list; close() waits for the export thread"""
+
+    def __init__(self):
+        super().__init__(interval=0.01)
+        self.traces = []
+
+    def write(self, traces):
+        self.traces.extend(traces)
+
+
+def _turn(tracer, sleep=0.0):
+    with tracer.start_trace("turn") as root:
+        with tracer.span("intent_analysis"):
+            with tracer.span("llm.chat", tokens=12):
+                time.sleep(sleep)
+    return root
+
+
+def _exported(tracer, exporter):
+    tracer.close()
+    return [[span["name"] for span in trace] for trace in exporter.traces]
+
+
+def test_head_sampling_records_whole_turns_or_nothing():
+    exporter = MemoryExporter()
+    random.seed(5)
+    tracer = Tracer([exporter], sample_rate=0.5)
+    for _ in range(200):
+        _turn(tracer)
+    traces = _exported(tracer, exporter)
+
+    assert tracer.traces_started == 200
+    assert 60 < len(traces) < 140
+    # Children finish first; each sampled turn is exported once, complete
+    assert all(names == ["llm.chat", "intent_analysis", "turn"] for names in traces)
+    trace = exporter.traces[0]
+    assert len({span["trace_id"] for span in trace}) == 1
+    assert trace[0]["parent_id"] == trace[1]["span_id"] and trace[1]["parent_id"] == trace[2]["span_id"]
+    assert trace[0]["attributes"] == {"tokens": 12}
+
+
+def test_unsampled_turn_records_nothing():
+    exporter = MemoryExporter()
+    tracer = Tracer([exporter], sample_rate=0.0)
+    root = _turn(tracer)
+    assert not root.recording and not tracer.recording()
+    assert _exported(tracer, exporter) == []
+
+
+def test_slow_unsampled_turns_are_exported_by_the_tail_rule():
+    exporter = MemoryExporter()
+    tracer = Tracer([exporter], sample_rate=0.0, slow_ms=30)
+    _turn(tracer)
+    _turn(tracer, sleep=0.05)
+    _turn(tracer)
+    traces = _exported(tracer, exporter)
+
+    assert traces == [["llm.chat", "intent_analysis", "turn"]]
+    assert exporter.traces[0][-1]["duration_ms"] >= 30
+    assert tracer.traces_exported == 1
+
+
+def _turn_with_background_call(tracer, sleep=0.0):
+    """A turn that leaves a task running, like the background history summary"""
+    async def summarize():
+        await asyncio.sleep(0.02)
+        with tracer.span("llm.chat", purpose="summary"):
+            pass
+
+    async def scenario():
+        with tracer.start_trace("turn"):
+            with tracer.span("handler"):
+                time.sleep(sleep)
+            task = asyncio.create_task(summarize())
+        await task
+
+    asyncio.run(scenario())
+
+
+def test_late_span_is_exported_alone_after_its_trace():
+    exporter = MemoryExporter()
+    tracer = Tracer([exporter], sample_rate=1.0)
+    _turn_with_background_call(tracer)
+    traces = _exported(tracer, exporter)
+
+    assert traces == [["handler", "turn"], ["llm.chat"]]
+    turn, late = exporter.traces
+    assert late[0]["trace_id"] == turn[-1]["trace_id"]
+    assert late[0]["parent_id"] == turn[-1]["span_id"]
+    assert late[0]["attributes"] == {"purpose": "summary"}
+
+
+def test_late_span_follows_its_traces_export_decision():
+    exporter = MemoryExporter()
+    tracer = Tracer([exporter], sample_rate=0.0, slow_ms=30)
+    # Fast: neither the turn nor its late span is exported
+    _turn_with_background_call(tracer)
+    # Slow: the tail rule exports the turn, and the late span with it
+    _turn_with_background_call(tracer, sleep=0.05)
+    assert _exported(tracer, exporter) == [["handler", "turn"], ["llm.chat"]]
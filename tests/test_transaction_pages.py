@@ -0,0 +1,69 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from database import AccountService
+
+MERCHANTS = ["Shell Gas Station", "SHELL Express", "Shellfish Shack", "FreshMart Grocery"]
+
+
+@pytest.fixture
+def history(bank_db):
+    """120 extra transactions for the demo user over both accounts"""
+    conn = sqlite3.connect(bank_db.db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO transactions (transaction_id, account_id, transaction_type, amount, description, "
+            "merchant_name, transaction_date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(f"page_{i:03d}", ("acc_001", "acc_002")[i % 2], ("debit", "credit")[i % 3 == 0], 10.0 + i,
+              "Purchase", MERCHANTS[i % len(MERCHANTS)], f"2024-02-{1 + i % 28:02d} {i % 24:02d}:00:00")
+             for i in range(120)]
+        )
+    conn.close()
+    return bank_db
+
+
+def _all_pages(db, limit, **filters):
+    async def scenario():
+        service = AccountService(db)
+        pages = [await service.get_transactions_page("user_demo1", limit=limit, **filters)]
+        while pages[-1]["next_cursor"]:
+            pages.append(await service.get_transactions_page("user_demo1", limit=limit,
+                                                             cursor=pages[-1]["next_cursor"]))
+        await db.close()
+        return pages
+
+    return asyncio.run(scenario())
+
+
+def _expected(db, where="1", params=()):
+    conn = sqlite3.connect(db.db_path)
+    rows = conn.execute(
+        f"SELECT t.transaction_id FROM transactions t JOIN accounts a ON a.account_id = t.account_id "
+        f"WHERE a.user_id = 'user_demo1' AND {where} ORDER BY transaction_date DESC, transaction_id DESC", params
+    ).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+@pytest.mark.parametrize("filters, where, params", [
+    ({}, "1", ()),
+    ({"transaction_type": "credit"}, "transaction_type = ?", ("credit",)),
+    ({"merchant": "shell"}, "lower(merchant_name) IN ('shell gas station', 'shell express')", ()),
+    ({"merchant": "Shell  gas", "transaction_type": "debit", "start_date": "2024-02-05", "end_date": "2024-02-20"},
+     "merchant_name = 'Shell Gas Station' AND transaction_type = 'debit' "
+     "AND transaction_date >= '2024-02-05' AND transaction_date < '2024-02-20'", ()),
+])
+def test_cursor_pages_cover_filtered_rows_once(history, filters, where, params):
+    expected = _expected(history, where, params)
+    pages = _all_pages(history, 7, **filters)
+    seen = [row["transaction_id"] for page in pages for row in page["transactions"]]
+
+    assert seen == expected
+    assert len(seen) == len(set(seen))
+    assert all(len(page["transactions"]) == 7 for page in pages[:-1])
+    assert pages[-1]["next_cursor"] is None
+    # Later pages run with the filters stored in the cursor
+    assert all(page["filters"] == pages[0]["filters"] for page in pages)
+    assert pages[0]["filters"] == {key: value for key, value in filters.items()}
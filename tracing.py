@@ -0,0 +1,452 @@
+"""Per-turn trace recording.
+
+Spans form a tree per conversation turn: WebSocket receive or REST request,
+process_message, intent analysis, the handler, every SQL statement and every
+LLM call, each with its timing and attributes (intent, confidence, tokens,
+rows). The current span lives in a ContextVar, so it follows the turn across
+awaits and into tasks created while it is active.
+
+Traces are sampled when they start (TRACE_SAMPLE_RATE). With TRACE_SLOW_MS
+set, every turn is recorded and unsampled ones are still exported when they
+take at least that long, so tail-latency outliers are never lost. Finished
+traces are exported from a background thread:
+
+    TRACE_EXPORTERS=json TRACE_FILE=traces.jsonl
+    TRACE_EXPORTERS=otlp OTLP_ENDPOINT=http://localhost:4318
+"""
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# Statements are recorded without their parameters, collapsed and truncated
+MAX_STATEMENT_LENGTH = 500
+_WHITESPACE = re.compile(r"\s+")
+
+
+class Trace:
+    """Spans of one turn, exported together when the root span ends"""
+
+    __slots__ = ("trace_id", "sampled", "spans", "finished", "exported")
+
+    def __init__(self, sampled: bool):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.sampled = sampled
+        self.spans: List["Span"] = []
+        self.finished = False
+        self.exported = False
+
+
+class Span:
+    """A timed operation; use as a context manager to make it the current span"""
+
+    __slots__ = ("tracer", "trace", "name", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "error", "_token")
+
+    def __init__(self, tracer: "Tracer", trace: Trace, name: str, parent_id: Optional[str],
+                 attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self._token = None
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def record_exception(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer._finish(self)
+
+    def __enter__(self):
+        self._token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_exception(exc)
+        try:
+            current_span.reset(self._token)
+        except ValueError:
+            # Exited from another context, e.g. an async generator closed by the GC
+            pass
+        self.end()
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            **({"error": self.error} if self.error else {})
+        }
+
+
+class _NonRecordingSpan:
+    """Stands in for spans that are not recorded; every method is a no-op"""
+
+    recording = False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+# Marks a turn whose trace was not sampled, so nothing below it is recorded
+_UNSAMPLED = object()
+
+
+class _UnsampledScope(_NonRecordingSpan):
+    __slots__ = ("_token",)
+
+    def __enter__(self):
+        self._token = current_span.set(_UNSAMPLED)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            current_span.reset(self._token)
+        except ValueError:
+            pass
+        return False
+
+
+current_span: ContextVar[Any] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """In-process span recorder with head sampling and pluggable exporters"""
+
+    def __init__(self, exporters: Optional[List["SpanExporter"]] = None, sample_rate: float = 0.1,
+                 slow_ms: Optional[float] = None):
+        self.exporters = exporters or []
+        self.enabled = bool(self.exporters)
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.traces_started = 0
+        self.traces_exported = 0
+
+    def start_trace(self, name: str, **attributes):
+        """Root span of a turn, or a child span when a trace is already active"""
+        parent = current_span.get()
+        if parent is _UNSAMPLED or not self.enabled:
+            return NON_RECORDING_SPAN
+        if parent is not None:
+            return Span(self, parent.trace, name, parent.span_id, attributes)
+        self.traces_started += 1
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_ms is None:
+            return _UnsampledScope()
+        return Span(self, Trace(sampled), name, None, attributes)
+
+    def span(self, name: str, **attributes):
+        """Child of the current span; not recorded outside a recorded trace"""
+        parent = current_span.get()
+        if parent is None or parent is _UNSAMPLED:
+            return NON_RECORDING_SPAN
+        return Span(self, parent.trace, name, parent.span_id, attributes)
+
+    def recording(self) -> bool:
+        """Whether spans started now would be recorded"""
+        return isinstance(current_span.get(), Span)
+
+    def _finish(self, span: Span):
+        trace = span.trace
+        if trace.finished:
+            # Outlived its turn (e.g. a background summary call): export it
+            # alone, if the rest of its trace was exported
+            if trace.exported:
+                self._export([span])
+            return
+        trace.spans.append(span)
+        if span.parent_id is None:
+            trace.finished = True
+            if trace.sampled or span.duration_ms >= self.slow_ms:
+                trace.exported = True
+                self._export(trace.spans)
+
+    def _export(self, spans: List[Span]):
+        self.traces_exported += 1
+        for exporter in self.exporters:
+            exporter.export(spans)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "traces_started": self.traces_started,
+            "traces_exported": self.traces_exported,
+            "exporters": {type(exporter).__name__: exporter.stats() for exporter in self.exporters}
+        }
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+
+
+class SpanExporter:
+    """Queues finished traces and writes them in batches on a daemon thread,
+    so exporting never blocks the event loop"""
+
+    def __init__(self, max_batch: int = 64, interval: float = 2.0, max_queue: int = 10000):
+        self.max_batch = max_batch
+        self.interval = interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def export(self, spans: List[Span]):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait([span.to_dict() | {"trace_id": span.trace.trace_id} for span in spans])
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            closing = batch[-1] is None
+            traces = [trace for trace in batch if trace is not None]
+            if traces:
+                try:
+                    self.write(traces)
+                    self.exported += len(traces)
+                except Exception as e:
+                    self.failed += len(traces)
+                    print(f"Trace Export Error ({type(self).__name__}): {e}")
+            if closing:
+                return
+
+    def write(self, traces: List[List[Dict[str, Any]]]):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        return {"exported": self.exported, "dropped": self.dropped, "failed": self.failed,
+                "queued": self._queue.qsize()}
+
+    def close(self, timeout: float = 5.0):
+        """Flush queued traces and stop the export thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+class JsonFileExporter(SpanExporter):
+    """Appends one JSON line per trace, spans in the order they finished"""
+
+    def __init__(self, path: str = "traces.jsonl", **options):
+        super().__init__(**options)
+        self.path = path
+
+    def write(self, traces: List[List[Dict[str, Any]]]):
+        with open(self.path, "a", encoding="utf-8") as handle:
+            for spans in traces:
+                root = spans[-1]
+                handle.write(json.dumps({
+                    "trace_id": root["trace_id"],
+                    "name": root["name"],
+                    "duration_ms": root["duration_ms"],
+                    "spans": [{key: value for key, value in span.items() if key != "trace_id"} for span in spans]
+                }, default=str) + "\n")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpHttpExporter(SpanExporter):
+    """Posts traces to an OpenTelemetry collector as OTLP/HTTP JSON"""
+
+    def __init__(self, endpoint: str = "http://localhost:4318", service_name: str = "banking-assistant",
+                 **options):
+        super().__init__(**options)
+        import httpx
+
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.client = httpx.Client(timeout=5.0)
+
+    def write(self, traces: List[List[Dict[str, Any]]]):
+        spans = []
+        for trace in traces:
+            for span in trace:
+                spans.append({
+                    "traceId": span["trace_id"],
+                    "spanId": span["span_id"],
+                    **({"parentSpanId": span["parent_id"]} if span["parent_id"] else {}),
+                    "name": span["name"],
+                    "kind": 2 if span["parent_id"] is None else 1,
+                    "startTimeUnixNano": str(span["start_ns"]),
+                    "endTimeUnixNano": str(span["start_ns"] + int(span["duration_ms"] * 1e6)),
+                    "attributes": [{"key": key, "value": _otlp_value(value)}
+                                   for key, value in span["attributes"].items() if value is not None],
+                    "status": {"code": 2, "message": span["error"]} if "error" in span else {"code": 1}
+                })
+        response = self.client.post(self.url, json={"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}]
+        }]})
+        response.raise_for_status()
+
+    def close(self, timeout: float = 5.0):
+        super().close(timeout)
+        self.client.close()
+
+
+class TracedCursor:
+    """Cursor proxy that adds the rows fetched to its statement's span"""
+
+    def __init__(self, cursor, span: Span):
+        self._cursor = cursor
+        self._span = span
+
+    def _fetched(self, rows: int):
+        self._span.attributes["db.rows"] = self._span.attributes.get("db.rows", 0) + rows
+        # The span covers the statement through its last fetch
+        self._span.end_ns = time.time_ns()
+
+    async def fetchone(self):
+        row = await self._cursor.fetchone()
+        self._fetched(row is not None)
+        return row
+
+    async def fetchmany(self, size: Optional[int] = None):
+        rows = await (self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany())
+        self._fetched(len(rows))
+        return rows
+
+    async def fetchall(self):
+        rows = await self._cursor.fetchall()
+        self._fetched(len(rows))
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TracedConnection:
+    """aiosqlite connection proxy recording a span per statement"""
+
+    def __init__(self, conn, tracer: Tracer):
+        self._conn = conn
+        self._tracer = tracer
+
+    def _statement_span(self, sql: str):
+        statement = _WHITESPACE.sub(" ", sql).strip()[:MAX_STATEMENT_LENGTH]
+        return self._tracer.span("db.query", **{"db.statement": statement})
+
+    async def execute(self, sql: str, parameters=None):
+        with self._statement_span(sql) as span:
+            cursor = await self._conn.execute(sql, parameters)
+        return TracedCursor(cursor, span) if span.recording else cursor
+
+    async def execute_fetchall(self, sql: str, parameters=None):
+        with self._statement_span(sql) as span:
+            rows = await self._conn.execute_fetchall(sql, parameters)
+            span.set_attribute("db.rows", len(rows))
+        return rows
+
+    async def executemany(self, sql: str, parameters):
+        with self._statement_span(sql) as span:
+            cursor = await self._conn.executemany(sql, parameters)
+            span.set_attribute("db.rows_affected", cursor.rowcount)
+        return cursor
+
+    async def commit(self):
+        with self._tracer.span("db.commit"):
+            await self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def create_tracer() -> Tracer:
+    """Tracer configured by TRACE_EXPORTERS (json, otlp or both, comma separated)"""
+    exporters: List[SpanExporter] = []
+    for name in filter(None, (part.strip().lower() for part in os.getenv("TRACE_EXPORTERS", "").split(","))):
+        try:
+            if name == "json":
+                exporters.append(JsonFileExporter(os.getenv("TRACE_FILE", "traces.jsonl")))
+            elif name == "otlp":
+                exporters.append(OtlpHttpExporter(os.getenv("OTLP_ENDPOINT", "http://localhost:4318"),
+                                                  os.getenv("OTEL_SERVICE_NAME", "banking-assistant")))
+            else:
+                print(f"Unknown trace exporter {name!r}, ignoring")
+        except ImportError as e:
+            print(f"Trace exporter {name} unavailable: {e}")
+    slow_ms = os.getenv("TRACE_SLOW_MS")
+    return Tracer(
+        exporters,
+        sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.1")),
+        slow_ms=float(slow_ms) if slow_ms else None
+    )
+
+
+tracer = create_tracer()
+
+
+def traced_connection(conn):
+    """Wrap conn in a tracing proxy while the current turn is being recorded"""
+    return TracedConnection(conn, tracer) if tracer.recording() else conn